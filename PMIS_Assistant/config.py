@@ -11,24 +11,123 @@ DB_NAME = os.getenv("DB_NAME", "pmis_db")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 
+# Database Connection Pool Configuration
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "true").lower() in ("1", "true", "yes")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # Giây chờ lấy connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))  # Giây trước khi đóng connection rảnh
+DB_POOL_RECONNECT_TIMEOUT = float(os.getenv("DB_POOL_RECONNECT_TIMEOUT", "60"))
+
+DB_PAGE_SIZE = int(os.getenv("DB_PAGE_SIZE", "100"))  # Số dòng mỗi trang (keyset pagination)
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")  # Prepare các câu lệnh hay dùng
+DB_PIPELINE_ENABLED = os.getenv("DB_PIPELINE_ENABLED", "true").lower() in ("1", "true", "yes")  # Gửi các lệnh của unit of work trong một round-trip
+
+# Query Metrics Configuration
+DB_METRICS_ENABLED = os.getenv("DB_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))  # Truy vấn chậm hơn ngưỡng này sẽ được ghi log
+DB_SLOW_QUERY_HISTORY = int(os.getenv("DB_SLOW_QUERY_HISTORY", "50"))  # Số truy vấn chậm gần nhất được giữ lại
+DB_METRICS_FILE = os.getenv("DB_METRICS_FILE", "")  # Để trống để không ghi file metrics
+DB_METRICS_FLUSH_INTERVAL = float(os.getenv("DB_METRICS_FLUSH_INTERVAL", "60"))  # Giây giữa các lần ghi file metrics
+
+# Search Configuration
+SEARCH_MODE = os.getenv("SEARCH_MODE", "ilike")  # "ilike" hoặc "trigram" (cần pg_trgm, xem database_setup.py)
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "50"))  # Số kết quả tối đa của tìm kiếm trigram
+
+# AI Context Cache Configuration
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", "30"))  # Giây giữa các lần kiểm tra thay đổi
+CONTEXT_CACHE_FULL_REFRESH = float(os.getenv("CONTEXT_CACHE_FULL_REFRESH", "3600"))  # Giây giữa các lần tải lại toàn bộ
+CONTEXT_DELTA_OVERLAP = float(os.getenv("CONTEXT_DELTA_OVERLAP", "5"))  # Giây lấy lùi lại trước mốc đồng bộ (bắt các transaction commit muộn)
+CONTEXT_SINGLE_QUERY = os.getenv("CONTEXT_SINGLE_QUERY", "true").lower() in ("1", "true", "yes")  # Một round-trip cho cả năm bảng (false = năm truy vấn song song qua AsyncDatabaseManager)
+
+# Candidate Retrieval Configuration (chỉ đưa các thực thể liên quan vào prompt)
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() in ("1", "true", "yes")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "20"))  # Số ứng viên tối đa mỗi loại thực thể cho một tài liệu
+RETRIEVAL_TRIGRAM_WEIGHT = float(os.getenv("RETRIEVAL_TRIGRAM_WEIGHT", "0.3"))  # Trọng số trigram so với từ nguyên vẹn
+RETRIEVAL_PROJECT_BOOST = float(os.getenv("RETRIEVAL_PROJECT_BOOST", "1.5"))  # Hệ số cho công việc/vấn đề thuộc dự án ứng viên
+
+# Entity Index Configuration (chỉ mục vector cục bộ của dự án, phòng ban, công việc, vấn đề)
+EMBEDDING_INDEX_ENABLED = os.getenv("EMBEDDING_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")  # Model sentence-transformers (trống = vector hashing, không cần model)
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "512"))  # Số chiều vector hashing
+EMBEDDING_TOP_K = int(os.getenv("EMBEDDING_TOP_K", "5"))  # Số ứng viên mỗi loại bổ sung vào prompt
+EMBEDDING_MATCH_THRESHOLD = float(os.getenv("EMBEDDING_MATCH_THRESHOLD", "0.35"))  # Độ tương đồng tối thiểu khi mapping không dùng AI
+EMBEDDING_CHUNK_CHARS = int(os.getenv("EMBEDDING_CHUNK_CHARS", "300"))  # Độ dài mỗi đoạn văn bản khi so khớp
+
+# Schema Catalog Configuration
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "300"))  # Giây giữa các lần kiểm tra DDL thay đổi
+
+# Local Mirror Configuration (bản sao SQLite của các bảng tham chiếu)
+MIRROR_ENABLED = os.getenv("MIRROR_ENABLED", "true").lower() in ("1", "true", "yes")
+MIRROR_TABLES = [table.strip() for table in os.getenv(
+    "MIRROR_TABLES", "DuAn,PhongBan,CongViec,VanDe,TienTrinhXuLy,GoiThau,HopDong"
+).split(",") if table.strip()]
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "60"))  # Giây giữa các lần đồng bộ delta
+MIRROR_FULL_REFRESH = float(os.getenv("MIRROR_FULL_REFRESH", "3600"))  # Giây giữa các lần tải lại toàn bộ
+
+# AI Activity Log Configuration (write-behind)
+AI_LOG_WRITE_BEHIND = os.getenv("AI_LOG_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+AI_LOG_QUEUE_SIZE = int(os.getenv("AI_LOG_QUEUE_SIZE", "1000"))  # Số bản ghi tối đa trong hàng đợi
+AI_LOG_BATCH_SIZE = int(os.getenv("AI_LOG_BATCH_SIZE", "20"))  # Flush khi đủ số bản ghi này
+AI_LOG_FLUSH_INTERVAL = float(os.getenv("AI_LOG_FLUSH_INTERVAL", "2"))  # Hoặc sau số giây này
+AI_LOG_RETRY_INTERVAL = float(os.getenv("AI_LOG_RETRY_INTERVAL", "30"))  # Giây chờ trước khi thử lại khi mất kết nối
+AI_LOG_STOP_TIMEOUT = float(os.getenv("AI_LOG_STOP_TIMEOUT", "5"))  # Giây chờ flush khi thoát ứng dụng
+
 # Gemini API Configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 GEMINI_TEMPERATURE = float(os.getenv("GEMINI_TEMPERATURE", "0.3"))
 GEMINI_MAX_TOKENS = int(os.getenv("GEMINI_MAX_TOKENS", "2000"))
+GEMINI_KEEPALIVE_INTERVAL = int(os.getenv("GEMINI_KEEPALIVE_INTERVAL", "0"))  # Ping Gemini khi rảnh quá số giây này (0 = tắt)
+GEMINI_KEEPALIVE_WINDOW = int(os.getenv("GEMINI_KEEPALIVE_WINDOW", "900"))  # Chỉ ping trong số giây này sau lần phân tích gần nhất
+AI_STREAMING = os.getenv("AI_STREAMING", "true").lower() in ("1", "true", "yes")  # Mở cửa sổ kết quả ngay và điền dần khi AI trả lời
+PROMPT_MEMO_SIZE = int(os.getenv("PROMPT_MEMO_SIZE", "32"))  # Số system prompt đã dựng được giữ trong bộ nhớ
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() in ("1", "true", "yes")  # Cache system prompt phía Gemini (chỉ có lợi khi RETRIEVAL_ENABLED=false)
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))  # Giây tồn tại của mỗi context cache trên Gemini
+GEMINI_CACHE_MIN_USES = int(os.getenv("GEMINI_CACHE_MIN_USES", "2"))  # Tạo cache khi cùng system prompt được dùng tới lần này
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "4"))  # Số context cache tối đa giữ trên Gemini
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "32768"))  # Số token tối thiểu Gemini nhận cache (prompt ngắn hơn không được cache)
+AI_PROMPT_CHAR_LIMIT = int(os.getenv("AI_PROMPT_CHAR_LIMIT", "4000"))  # Số ký tự nội dung tối đa gửi cho AI
+
+# Analysis Cache Configuration (cache text trích xuất và kết quả AI theo hash nội dung)
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYSIS_CACHE_MAX_MB = float(os.getenv("ANALYSIS_CACHE_MAX_MB", "200"))  # Dung lượng tối đa, vượt quá thì xóa mục cũ nhất
+
+# Text Extraction Configuration
+EXTRACT_CHAR_BUDGET = int(os.getenv("EXTRACT_CHAR_BUDGET", str(AI_PROMPT_CHAR_LIMIT)))  # Ngừng đọc PDF/Word khi đủ số ký tự này (0 = đọc hết)
+EXTRACT_PROCESS_WORKERS = int(os.getenv("EXTRACT_PROCESS_WORKERS", "0"))  # Số process đọc nhiều file song song (0 = số CPU, âm = đọc tuần tự)
+MULTI_FILE_LIMIT = int(os.getenv("MULTI_FILE_LIMIT", "50"))  # Số file tối đa trong một lần phân tích nhiều file
+AI_BATCH_SIZE = int(os.getenv("AI_BATCH_SIZE", "5"))  # Số file gộp vào một lần gọi Gemini
+
+# OCR Configuration
+OCR_LANG = os.getenv("OCR_LANG", "vie+eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))  # Số thread OCR song song (0 = số CPU)
+OCR_MAX_DIMENSION = int(os.getenv("OCR_MAX_DIMENSION", "4000"))  # Thu nhỏ ảnh có cạnh dài hơn (px)
+OCR_MIN_DIMENSION = int(os.getenv("OCR_MIN_DIMENSION", "1000"))  # Phóng to ảnh có cạnh dài ngắn hơn (px)
+OCR_BINARIZE = os.getenv("OCR_BINARIZE", "true").lower() in ("1", "true", "yes")
+OCR_TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", "1200"))  # Chiều cao mỗi dải ảnh OCR song song (0 = không cắt)
+OCR_SCANNED_PDF = os.getenv("OCR_SCANNED_PDF", "true").lower() in ("1", "true", "yes")  # OCR PDF không có lớp text
+OCR_PDF_DPI = int(os.getenv("OCR_PDF_DPI", "300"))  # Độ phân giải render trang PDF scan
 
 # Application Configuration
 APP_NAME = os.getenv("APP_NAME", "PMIS Assistant")
 APP_VERSION = os.getenv("APP_VERSION", "1.0.0")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 DEFAULT_DOCUMENT_PATH = os.getenv("DEFAULT_DOCUMENT_PATH", os.path.join(os.path.expanduser("~"), "Documents/PMIS_Documents"))
+APP_DATA_DIR = os.getenv("APP_DATA_DIR", os.path.join(os.path.expanduser("~"), ".pmis_assistant"))  # Dữ liệu cục bộ (spool, cache)
+AI_LOG_SPOOL_FILE = os.getenv("AI_LOG_SPOOL_FILE", os.path.join(APP_DATA_DIR, "ai_log_spool.jsonl"))
+MIRROR_FILE = os.getenv("MIRROR_FILE", os.path.join(APP_DATA_DIR, "pmis_mirror.sqlite3"))
+ANALYSIS_CACHE_FILE = os.getenv("ANALYSIS_CACHE_FILE", os.path.join(APP_DATA_DIR, "analysis_cache.sqlite3"))
+EMBEDDING_INDEX_FILE = os.getenv("EMBEDDING_INDEX_FILE", os.path.join(APP_DATA_DIR, "entity_index"))  # Tạo file .npy và .json
 
 # Hotkey Configuration
 HOTKEY_COMBINATION = "ctrl+c"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))  # Số thread chạy các bước phân tích ở background
 
 # UI Configuration
 WINDOW_WIDTH = 900
 WINDOW_HEIGHT = 700
+TABLE_PAGE_SIZE = 200  # Số dòng hiển thị mỗi lần khi tải dữ liệu bảng
 
 # File type mapping for naming convention
 DOCUMENT_TYPES = {
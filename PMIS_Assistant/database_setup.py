@@ -362,6 +362,16 @@ def create_tables():
             file_path_original text COLLATE pg_catalog."default",
             CONSTRAINT tbl_documents_pkey PRIMARY KEY (id)
         );
+        """,
+        
+        # Bảng khóa các unit of work đã ghi (chống ghi trùng khi gửi lại hàng đợi offline)
+        """
+        CREATE TABLE IF NOT EXISTS public.pmis_applied_units
+        (
+            unit_key character varying(64) NOT NULL,
+            applied_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP,
+            CONSTRAINT pmis_applied_units_pkey PRIMARY KEY (unit_key)
+        );
         """
     ]
     
@@ -583,6 +593,131 @@ def create_tables():
         if conn:
             conn.close()
 
+def create_search_indexes():
+    """Tạo extension pg_trgm và GIN trigram index cho các cột văn bản hay được tìm kiếm"""
+    
+    # (tên index, bảng, cột) cần index trigram
+    trigram_indexes = [
+        ("idx_duan_tenduan_trgm", '"DuAn"', '"TenDuAn"'),
+        ("idx_congviec_tencongviec_trgm", '"CongViec"', '"TenCongViec"'),
+        ("idx_vande_motavande_trgm", '"VanDe"', '"MoTaVanDe"'),
+        ("idx_tbl_documents_summary_trgm", 'tbl_documents', 'summary')
+    ]
+    
+    sql_statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm;"]
+    for index_name, table_name, column_name in trigram_indexes:
+        sql_statements.append(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON public.{table_name} '
+            f'USING gin ({column_name} gin_trgm_ops);'
+        )
+    
+    conn = None
+    try:
+        conn = connect_to_database()
+        cursor = conn.cursor()
+        
+        for sql in sql_statements:
+            try:
+                cursor.execute(sql)
+                conn.commit()
+                logger.info(f"Search index created/updated successfully")
+            except Exception as e:
+                logger.warning(f"Error creating search index: {e}")
+                conn.rollback()
+        
+        logger.info("Search indexes created successfully")
+        
+    except Exception as e:
+        logger.error(f"Error creating search indexes: {e}")
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def create_document_search():
+    """Tạo cột tsvector (bỏ dấu tiếng Việt) và GIN index cho tìm kiếm toàn văn trên tbl_documents"""
+    
+    sql_statements = [
+        "CREATE EXTENSION IF NOT EXISTS unaccent;",
+        
+        # unaccent() chỉ là STABLE nên cần wrapper IMMUTABLE để dùng trong generated column
+        """
+        CREATE OR REPLACE FUNCTION public.immutable_unaccent(text)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$;
+        """,
+        
+        # Cấu hình text search bỏ dấu cho ts_headline: đánh dấu được từ gốc có dấu
+        # cả khi truy vấn gõ không dấu ("quyet dinh" -> <b>Quyết</b> <b>định</b>)
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pmis_unaccent') THEN
+                CREATE TEXT SEARCH CONFIGURATION public.pmis_unaccent (COPY = simple);
+                ALTER TEXT SEARCH CONFIGURATION public.pmis_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH public.unaccent, simple;
+            END IF;
+        END
+        $$;
+        """,
+        
+        # Trọng số: A = tóm tắt/từ khóa, B = tên file/nơi gửi, C = nội dung gốc (giới hạn độ dài)
+        """
+        CREATE OR REPLACE FUNCTION public.tbl_documents_search_vector(
+            p_summary text, p_keywords text[], p_file_name text, p_sender text, p_raw_content text)
+        RETURNS tsvector
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$
+            SELECT
+                setweight(to_tsvector('simple', public.immutable_unaccent(coalesce(p_summary, ''))), 'A') ||
+                setweight(to_tsvector('simple', public.immutable_unaccent(coalesce(array_to_string(p_keywords, ' '), ''))), 'A') ||
+                setweight(to_tsvector('simple', public.immutable_unaccent(coalesce(p_file_name, '') || ' ' || coalesce(p_sender, ''))), 'B') ||
+                setweight(to_tsvector('simple', public.immutable_unaccent(left(coalesce(p_raw_content, ''), 200000))), 'C')
+        $$;
+        """,
+        
+        """
+        ALTER TABLE public.tbl_documents
+        ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            public.tbl_documents_search_vector(summary, keywords, file_name, sender, raw_content)
+        ) STORED;
+        """,
+        
+        """
+        CREATE INDEX IF NOT EXISTS idx_tbl_documents_search_vector
+        ON public.tbl_documents USING gin (search_vector);
+        """
+    ]
+    
+    conn = None
+    try:
+        conn = connect_to_database()
+        cursor = conn.cursor()
+        
+        for sql in sql_statements:
+            try:
+                cursor.execute(sql)
+                conn.commit()
+                logger.info(f"Document search object created/updated successfully")
+            except Exception as e:
+                logger.warning(f"Error creating document search object: {e}")
+                conn.rollback()
+        
+        logger.info("Document full-text search setup completed")
+        
+    except Exception as e:
+        logger.error(f"Error setting up document search: {e}")
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
 def insert_sample_data():
     """Chèn dữ liệu mẫu để test"""
     sample_data = [
@@ -655,6 +790,10 @@ def main():
         # Tạo các bảng
         create_tables()
         
+        # Tạo index phục vụ tìm kiếm
+        create_search_indexes()
+        create_document_search()
+        
         # Chèn dữ liệu mẫu
         insert_sample_data()
         
@@ -8,8 +8,10 @@ import sys
 import os
 import logging
 import threading
+import multiprocessing
 import time
-from typing import Optional
+from collections import deque
+from typing import Optional, Dict, Any
 from PyQt6.QtWidgets import QApplication, QSystemTrayIcon, QMenu, QMessageBox
 from PyQt6.QtCore import QObject, pyqtSignal, QTimer
 from PyQt6.QtGui import QIcon, QAction, QPixmap, QPainter, QColor, QFont
@@ -20,9 +22,13 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import config
 from src.clipboard_handler import ClipboardHandler
 from src.ai_service import AIService
+from src.entity_index import EntityIndex
 from src.db_manager import DatabaseManager
 from src.file_manager import FileManager
-from src.ui_app import show_ui
+from src.ui_app import open_ui
+from src.analysis_pipeline import AnalysisPipeline
+from src.text_extraction import shutdown_process_pool
+from src.ocr_engine import shutdown_ocr_engine
 
 # Configure logging
 logging.basicConfig(
@@ -112,10 +118,18 @@ class PMISAssistant(QObject):
         
         # Khởi tạo các thành phần
         self.clipboard_handler = ClipboardHandler()
-        self.ai_service = AIService()
         self.db_manager = DatabaseManager()
+        self.entity_index = self._create_entity_index()
+        self.ai_service = AIService(self.entity_index)
         self.file_manager = FileManager()
         
+        # Pipeline phân tích chạy ở background, kết quả được trả về qua signal
+        self.pipeline = AnalysisPipeline(self.clipboard_handler, self.ai_service, self.db_manager)
+        self.pipeline.progress.connect(self.on_analysis_progress)
+        self.pipeline.analysis_partial.connect(self.on_analysis_partial)
+        self.pipeline.analysis_ready.connect(self.on_analysis_ready)
+        self.pipeline.analysis_failed.connect(self.on_analysis_failed)
+        
         # Hotkey listener
         self.hotkey_listener = HotkeyListener()
         self.hotkey_listener.hotkey_pressed.connect(self.process_clipboard_data)
@@ -129,8 +143,22 @@ class PMISAssistant(QObject):
         self.timer.timeout.connect(self.cleanup_temp_files)
         self.timer.start(60000)  # Chạy mỗi phút
         
-        # Biến để kiểm tra xem UI đang mở không
-        self.ui_open = False
+        # Cửa sổ kết quả đang mở và các kết quả chờ hiển thị
+        self.ui_window = None
+        self.pending_results = deque()
+        # Job có cửa sổ đang điền dần kết quả tạm, và các job mà người dùng đã đóng cửa sổ khi AI còn trả lời
+        self.streaming_job_id = None
+        self.dismissed_job_ids = set()
+    
+    def _create_entity_index(self) -> Optional[EntityIndex]:
+        """Tạo chỉ mục vector cục bộ của các thực thể (None nếu tắt hoặc thiếu numpy)"""
+        if not config.EMBEDDING_INDEX_ENABLED:
+            return None
+        try:
+            return EntityIndex(self.db_manager)
+        except Exception as e:
+            logger.warning(f"Local entity index disabled: {e}")
+            return None
     
     def setup_system_tray(self):
         """Thiết lập system tray icon"""
@@ -153,6 +181,11 @@ class PMISAssistant(QObject):
             about_action.triggered.connect(self.show_about)
             tray_menu.addAction(about_action)
             
+            # Action hủy phân tích đang chạy
+            cancel_action = QAction("Hủy phân tích", self)
+            cancel_action.triggered.connect(self.cancel_analysis)
+            tray_menu.addAction(cancel_action)
+            
             tray_menu.addSeparator()
             
             # Action thoát
@@ -223,6 +256,13 @@ class PMISAssistant(QObject):
                 )
                 return False
             
+            # Khởi tạo model Gemini ở nền để lần nhấn hotkey đầu tiên không phải chờ
+            self.ai_service.start()
+            
+            # Cập nhật chỉ mục thực thể cục bộ ở nền
+            if self.entity_index is not None:
+                self.entity_index.start()
+            
             # Bắt đầu lắng nghe hotkey
             self.hotkey_listener.start_listening()
             
@@ -239,55 +279,118 @@ class PMISAssistant(QObject):
             return False
     
     def process_clipboard_data(self):
-        """Xử lý dữ liệu từ clipboard"""
-        if self.ui_open:
-            logger.info("UI already open, ignoring hotkey")
+        """Xếp hàng xử lý dữ liệu từ clipboard (chạy ở background, không chặn giao diện)"""
+        logger.info("Processing clipboard data...")
+        busy = self.pipeline.is_busy() or self.ui_window is not None
+        self.pipeline.submit()
+        
+        if busy:
+            self.show_tray_message("Đã xếp hàng", "Dữ liệu sẽ được xử lý sau tài liệu hiện tại")
+    
+    def on_analysis_progress(self, job_id: int, message: str):
+        """Hiển thị tiến trình phân tích trên tray"""
+        if self.tray_icon:
+            self.tray_icon.setToolTip(f"{config.APP_NAME} - {message}")
+        if self.ui_window is None:
+            self.show_tray_message("Đang xử lý", message, 1500)
+    
+    def on_analysis_partial(self, job_id: int, clipboard_data: Dict[str, Any], partial_result: Dict[str, Any]):
+        """Mở cửa sổ ngay khi AI bắt đầu trả lời và điền dần kết quả tạm"""
+        if job_id in self.dismissed_job_ids:
+            return
+        if self.streaming_job_id == job_id and self.ui_window is not None:
+            self.ui_window.update_result(partial_result)
+            return
+        
+        # Đang có cửa sổ khác: kết quả cuối cùng sẽ được xếp hàng như bình thường
+        if self.ui_window is not None or self.pending_results:
+            return
+        
+        self._open_result_window(clipboard_data, partial_result, streaming=True)
+        if self.ui_window is not None:
+            self.streaming_job_id = job_id
+    
+    def on_analysis_ready(self, job_id: int, clipboard_data: Dict[str, Any], ai_result: Dict[str, Any]):
+        """Nhận kết quả phân tích, hiển thị ngay hoặc chờ cửa sổ hiện tại đóng"""
+        self._reset_tray_tooltip()
+        if job_id in self.dismissed_job_ids:
+            self.dismissed_job_ids.discard(job_id)
+            return
+        if self.streaming_job_id == job_id and self.ui_window is not None:
+            # Cửa sổ đã mở từ kết quả tạm: chỉ cần điền kết quả cuối cùng
+            self.streaming_job_id = None
+            self.ui_window.update_result(ai_result, final=True)
+            return
+        
+        self.pending_results.append((clipboard_data, ai_result))
+        if self.ui_window is None:
+            self.show_next_result()
+    
+    def on_analysis_failed(self, job_id: int, title: str, message: str):
+        """Thông báo lỗi của một job phân tích"""
+        self._reset_tray_tooltip()
+        if job_id in self.dismissed_job_ids:
+            self.dismissed_job_ids.discard(job_id)
+            return
+        if self.streaming_job_id == job_id and self.ui_window is not None:
+            # Kết quả tạm không đầy đủ: đóng cửa sổ thay vì cho lưu dữ liệu dở dang
+            self._close_streaming_window()
+        self.show_tray_message(title, message)
+    
+    def show_next_result(self):
+        """Mở cửa sổ cho kết quả tiếp theo trong hàng đợi"""
+        if not self.pending_results:
             return
         
+        clipboard_data, ai_result = self.pending_results.popleft()
+        self._open_result_window(clipboard_data, ai_result)
+        if self.ui_window is None:
+            self.show_next_result()
+    
+    def _open_result_window(self, clipboard_data: Dict[str, Any], ai_result: Dict[str, Any],
+                            streaming: bool = False):
+        """Mở cửa sổ kết quả (streaming = kết quả còn đang được AI trả về)"""
         try:
-            logger.info("Processing clipboard data...")
-            
-            # Lấy dữ liệu từ clipboard
-            clipboard_data = self.clipboard_handler.get_clipboard_data()
-            
-            if clipboard_data["type"] == "empty":
-                self.show_tray_message(
-                    "Clipboard trống", 
-                    "Không có dữ liệu trong clipboard để xử lý"
-                )
-                return
-            
-            if clipboard_data["type"] == "error":
-                self.show_tray_message(
-                    "Lỗi clipboard", 
-                    f"Không thể lấy dữ liệu từ clipboard: {clipboard_data.get('metadata', {}).get('error', '')}"
-                )
-                return
-            
-            # Lấy context từ database
-            db_context = self.db_manager.get_main_tables_info()
-            
-            # Phân tích bằng AI
-            logger.info("Analyzing data with AI...")
-            ai_result = self.ai_service.analyze_clipboard_data(clipboard_data, db_context)
-            
-            # Hiển thị UI
-            self.ui_open = True
-            result = show_ui(clipboard_data, ai_result, self.db_manager, self.file_manager)
-            self.ui_open = False
-            
-            if result == 0:  # QDialog.Accepted
-                self.show_tray_message(
-                    "Thành công", 
-                    "Dữ liệu đã được lưu thành công!"
-                )
-            
+            self.ui_window = open_ui(clipboard_data, ai_result, self.db_manager, self.file_manager, streaming)
+            self.ui_window.save_completed.connect(
+                lambda: self.show_tray_message("Thành công", "Dữ liệu đã được lưu thành công!")
+            )
+            self.ui_window.closed.connect(self.on_ui_closed)
         except Exception as e:
             logger.error(f"Error processing clipboard data: {e}")
-            self.show_tray_message(
-                "Lỗi xử lý", 
-                f"Lỗi khi xử lý dữ liệu: {str(e)}"
-            )
+            self.ui_window = None
+            self.show_tray_message("Lỗi xử lý", f"Lỗi khi xử lý dữ liệu: {str(e)}")
+    
+    def _close_streaming_window(self):
+        """Đóng cửa sổ đang điền dần kết quả của job bị lỗi hoặc bị hủy"""
+        # Kết quả tạm đã nằm trong hàng đợi signal sẽ bị bỏ qua
+        self.dismissed_job_ids.add(self.streaming_job_id)
+        self.streaming_job_id = None
+        if self.ui_window is not None:
+            self.ui_window.close()
+    
+    def on_ui_closed(self):
+        """Cửa sổ kết quả đã đóng, chuyển sang kết quả tiếp theo"""
+        if self.streaming_job_id is not None:
+            # Người dùng đóng cửa sổ khi AI còn đang trả lời: bỏ kết quả của job này
+            self.dismissed_job_ids.add(self.streaming_job_id)
+            self.streaming_job_id = None
+        self.ui_window = None
+        QTimer.singleShot(0, self.show_next_result)
+    
+    def cancel_analysis(self):
+        """Hủy job đang chạy và các job đang chờ"""
+        self.pipeline.cancel()
+        self.pending_results.clear()
+        if self.streaming_job_id is not None:
+            self._close_streaming_window()
+        self._reset_tray_tooltip()
+        self.show_tray_message("Đã hủy", "Đã hủy các phân tích đang chờ")
+    
+    def _reset_tray_tooltip(self):
+        """Trả tooltip của tray về mặc định"""
+        if self.tray_icon:
+            self.tray_icon.setToolTip(f"{config.APP_NAME} v{config.APP_VERSION}")
     
     def show_tray_message(self, title: str, message: str, duration: int = 3000):
         """Hiển thị thông báo qua system tray"""
@@ -309,6 +412,14 @@ class PMISAssistant(QObject):
             # Dừng hotkey listener
             self.hotkey_listener.stop_listening()
             
+            # Dừng pipeline phân tích
+            self.pipeline.shutdown()
+            shutdown_process_pool()
+            shutdown_ocr_engine()
+            self.ai_service.stop()
+            if self.entity_index is not None:
+                self.entity_index.stop()
+            
             # Đóng kết nối database
             self.db_manager.close()
             
@@ -358,4 +469,6 @@ def main():
         return 1
 
 if __name__ == "__main__":
+    # Cần cho process pool trích xuất file khi đóng gói thành exe trên Windows
+    multiprocessing.freeze_support()
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,230 @@
+import json
+import time
+import uuid
+import queue
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+import psycopg
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# Câu lệnh chèn log theo lô (processed_at lấy theo thời điểm ghi nhận, không phải lúc flush)
+INSERT_LOG_QUERY = """
+INSERT INTO gemini_automation_log (filename, ai_response, status, processed_at)
+VALUES (%s, %s, %s, %s)
+"""
+
+# Đánh dấu yêu cầu dừng worker
+_STOP = object()
+
+class ActivityLogger:
+    """
+    Ghi log hoạt động AI theo kiểu write-behind
+    
+    - enqueue() chỉ đưa bản ghi vào hàng đợi có giới hạn rồi trả về ngay
+    - Worker nền ghi bản ghi vào file spool (JSON lines) rồi chèn vào gemini_automation_log
+      theo lô, khi đủ AI_LOG_BATCH_SIZE bản ghi hoặc sau AI_LOG_FLUSH_INTERVAL giây
+    - Bản ghi chỉ bị xóa khỏi spool sau khi đã commit, nên không mất log khi crash hay mất mạng;
+      các bản ghi còn trong spool được gửi lại ở lần chạy sau
+    """
+    
+    def __init__(self, db_manager, spool_file: Optional[str] = None):
+        self.db_manager = db_manager
+        self.spool_file = spool_file or config.AI_LOG_SPOOL_FILE
+        self.batch_size = max(config.AI_LOG_BATCH_SIZE, 1)
+        self.flush_interval = config.AI_LOG_FLUSH_INTERVAL
+        self.retry_interval = config.AI_LOG_RETRY_INTERVAL
+        self._queue = queue.Queue(maxsize=config.AI_LOG_QUEUE_SIZE)
+        self._spool_lock = threading.Lock()
+        # Có bản ghi chỉ nằm trong spool (hàng đợi đầy), cần nạp lại sau khi flush
+        self._spool_backlog = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pmis-ai-log", daemon=True)
+        self._thread.start()
+    
+    def enqueue(self, filename: str, ai_response: Any, status: str):
+        """Đưa một bản ghi log vào hàng đợi (ai_response có thể là dict, được serialize ở worker)"""
+        item = (filename, ai_response, status, datetime.now())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Hàng đợi đầy: ghi thẳng vào spool, worker sẽ nạp lại sau khi flush xong
+            logger.warning("AI log queue is full, spooling entry to disk")
+            self._append_spool([self._to_entry(item)])
+            self._spool_backlog.set()
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Dừng worker sau khi flush các bản ghi còn lại (bản ghi chưa gửi được vẫn nằm trong spool)"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(config.AI_LOG_STOP_TIMEOUT if timeout is None else timeout)
+        if self._thread.is_alive():
+            logger.warning("AI log worker did not stop in time, pending entries stay in spool")
+    
+    def pending_count(self) -> int:
+        """Số bản ghi đang chờ trong hàng đợi"""
+        return self._queue.qsize()
+    
+    def _run(self):
+        """Vòng lặp của worker: gom lô và flush theo kích thước hoặc thời gian"""
+        batch = self._load_spool()
+        first_at = time.monotonic() if batch else None
+        retry_at = 0.0
+        stopping = False
+        
+        while True:
+            now = time.monotonic()
+            if batch:
+                target = now if len(batch) >= self.batch_size else first_at + self.flush_interval
+                wait = max(max(target, retry_at) - now, 0.05)
+            else:
+                wait = None
+            
+            try:
+                item = self._queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+            
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                entry = self._to_entry(item)
+                self._append_spool([entry])
+                if not batch:
+                    first_at = time.monotonic()
+                batch.append(entry)
+            
+            now = time.monotonic()
+            due = batch and (len(batch) >= self.batch_size or now - first_at >= self.flush_interval)
+            if batch and (stopping or (due and now >= retry_at)):
+                if self._flush(batch):
+                    batch = []
+                    retry_at = 0.0
+                    if self._spool_backlog.is_set():
+                        self._spool_backlog.clear()
+                        batch = self._load_spool()
+                        first_at = time.monotonic()
+                else:
+                    retry_at = now + self.retry_interval
+            
+            if stopping:
+                break
+    
+    def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        """Chèn một lô vào database, trả về False nếu cần thử lại sau (lỗi kết nối)"""
+        params = [(entry['filename'], entry['ai_response'], entry['status'], entry['processed_at'])
+                  for entry in batch]
+        
+        try:
+            with self.db_manager.get_cursor(dictionary=False) as cursor:
+                cursor.executemany(INSERT_LOG_QUERY, params)
+        except (psycopg.IntegrityError, psycopg.DataError):
+            # Lỗi dữ liệu: chèn từng dòng để chỉ bỏ các dòng lỗi
+            try:
+                self._flush_individually(batch, params)
+            except Exception as e:
+                logger.error(f"Error flushing AI activity log ({len(batch)} entries), will retry: {e}")
+                return False
+        except Exception as e:
+            logger.error(f"Error flushing AI activity log ({len(batch)} entries), will retry: {e}")
+            return False
+        
+        self._remove_from_spool({entry['uid'] for entry in batch})
+        logger.debug(f"Flushed {len(batch)} AI activity log entries")
+        return True
+    
+    def _flush_individually(self, batch: List[Dict[str, Any]], params: List[tuple]):
+        """Chèn từng dòng trong savepoint riêng, ghi log và bỏ qua dòng lỗi"""
+        with self.db_manager.get_cursor(dictionary=False) as cursor:
+            for entry, values in zip(batch, params):
+                try:
+                    with cursor.connection.transaction():
+                        cursor.execute(INSERT_LOG_QUERY, values)
+                except (psycopg.IntegrityError, psycopg.DataError) as e:
+                    logger.error(f"Dropping AI activity log for {entry['filename']}: {e}")
+    
+    @staticmethod
+    def _to_entry(item: tuple) -> Dict[str, Any]:
+        """Chuyển bản ghi trong hàng đợi thành dạng lưu được vào spool"""
+        filename, ai_response, status, processed_at = item
+        if not isinstance(ai_response, str):
+            ai_response = json.dumps(ai_response, ensure_ascii=False, default=str)
+        return {
+            'uid': uuid.uuid4().hex,
+            'filename': filename,
+            'ai_response': ai_response,
+            'status': status,
+            'processed_at': processed_at.isoformat(),
+        }
+    
+    def _append_spool(self, entries: List[Dict[str, Any]]):
+        """Ghi thêm bản ghi vào cuối file spool"""
+        try:
+            with self._spool_lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.spool_file)), exist_ok=True)
+                with open(self.spool_file, 'a', encoding='utf-8') as f:
+                    for entry in entries:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"Error writing AI log spool {self.spool_file}: {e}")
+    
+    def _load_spool(self) -> List[Dict[str, Any]]:
+        """Đọc các bản ghi chưa được gửi từ file spool"""
+        entries = []
+        with self._spool_lock:
+            if not os.path.exists(self.spool_file):
+                return entries
+            try:
+                with open(self.spool_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            # Dòng ghi dở khi crash
+                            continue
+            except OSError as e:
+                logger.error(f"Error reading AI log spool {self.spool_file}: {e}")
+        
+        if entries:
+            logger.info(f"Loaded {len(entries)} pending AI activity log entries from spool")
+        return entries
+    
+    def _remove_from_spool(self, uids: set):
+        """Xóa các bản ghi đã commit khỏi file spool (ghi file tạm rồi đổi tên)"""
+        with self._spool_lock:
+            if not os.path.exists(self.spool_file):
+                return
+            try:
+                with open(self.spool_file, 'r', encoding='utf-8') as f:
+                    lines = [line for line in f if self._line_uid(line) not in uids | {None}]
+                
+                if not lines:
+                    os.remove(self.spool_file)
+                    return
+                
+                temp_path = f"{self.spool_file}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.spool_file)
+            except OSError as e:
+                logger.error(f"Error compacting AI log spool {self.spool_file}: {e}")
+    
+    @staticmethod
+    def _line_uid(line: str) -> Optional[str]:
+        """Lấy uid của một dòng spool (None nếu dòng rỗng hoặc ghi dở)"""
+        try:
+            return json.loads(line).get('uid')
+        except ValueError:
+            return None
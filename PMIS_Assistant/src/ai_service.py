@@ -1,22 +1,34 @@
 import os
+import re
 import json
 import requests
 import logging
 import base64
-from typing import Dict, List, Any, Optional
+import time
+import threading
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from datetime import datetime
 import sys
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from src.analysis_cache import AnalysisCache
+from src.text_extraction import ocr_image, extract_files_parallel
+from src.partial_json import IncrementalJSONParser
+from src.candidate_retriever import CandidateRetriever
+from src.entity_index import ENTITY_SOURCES
+from src.prompt_cache import PromptCache
 
 logger = logging.getLogger(__name__)
 
+# Tăng khi thay đổi system/user prompt để kết quả AI đã cache không còn được dùng
+PROMPT_VERSION = "3"
+
 class AIService:
     """Dịch vụ AI tích hợp với Gemini API để phân tích tài liệu"""
     
-    def __init__(self):
+    def __init__(self, entity_index=None):
         self.api_key = config.GEMINI_API_KEY
         self.model = config.GEMINI_MODEL
         self.temperature = config.GEMINI_TEMPERATURE
@@ -24,6 +36,92 @@ class AIService:
         
         if not self.api_key:
             raise ValueError("Gemini API key is not configured")
+        
+        self.generation_config = {
+            "temperature": self.temperature,
+            "max_output_tokens": self.max_tokens,
+        }
+        
+        # Client và model Gemini được tạo một lần và dùng lại cho mọi lần phân tích
+        self._gemini_model = None
+        self._model_lock = threading.Lock()
+        self._last_call = 0.0    # Thời điểm lần gọi phân tích thật gần nhất (không tính ping)
+        self._stop_event = threading.Event()
+        self._keepalive_thread = None
+        # Fingerprint của context gần nhất: (context, fingerprint), tính lại khi context đổi
+        self._context_fingerprint = (None, None)
+        # System prompt đã dựng theo context và CachedContent phía Gemini
+        self.prompt_cache = PromptCache(self.model, self.generation_config)
+        
+        # Chọn trước các thực thể liên quan để prompt không chứa toàn bộ CSDL
+        self.retriever = CandidateRetriever() if config.RETRIEVAL_ENABLED else None
+        # Chỉ mục vector cục bộ: thêm ứng viên cho prompt và mapping dự phòng khi không gọi được Gemini
+        self.entity_index = entity_index
+        
+        # Cache text đã trích xuất và kết quả AI theo hash nội dung
+        self.cache = None
+        if config.ANALYSIS_CACHE_ENABLED:
+            try:
+                self.cache = AnalysisCache()
+            except Exception as e:
+                logger.error(f"Error opening analysis cache, caching disabled: {e}")
+    
+    def start(self):
+        """Warm-up model Gemini ở thread nền (không chặn lúc khởi động), ping giữ kết nối nếu được bật"""
+        if self._keepalive_thread is None or not self._keepalive_thread.is_alive():
+            self._stop_event.clear()
+            self._keepalive_thread = threading.Thread(target=self._run_keepalive, name="pmis-gemini-keepalive",
+                                                      daemon=True)
+            self._keepalive_thread.start()
+    
+    def stop(self):
+        """Dừng thread giữ kết nối và xóa các context cache đã tạo trên Gemini"""
+        self._stop_event.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join(timeout=5)
+        self.prompt_cache.clear()
+    
+    def warm_up(self) -> bool:
+        """Tạo model và mở kết nối tới Gemini trước lần phân tích đầu tiên"""
+        try:
+            # count_tokens không sinh nội dung nhưng vẫn là một request tính vào giới hạn request của API
+            self._get_model().count_tokens("ping")
+            logger.info(f"Gemini model {self.model} is ready")
+            return True
+        except Exception as e:
+            logger.warning(f"Gemini warm-up failed: {e}")
+            return False
+    
+    def _run_keepalive(self):
+        """
+        Warm-up rồi (nếu GEMINI_KEEPALIVE_INTERVAL > 0) ping Gemini khi rảnh quá khoảng đó
+        
+        Chỉ ping trong GEMINI_KEEPALIVE_WINDOW giây sau lần phân tích gần nhất: khi người dùng
+        không dùng nữa, kết nối được để đóng thay vì gửi request định kỳ mãi mãi.
+        """
+        self.warm_up()
+        interval = config.GEMINI_KEEPALIVE_INTERVAL
+        if interval <= 0:
+            return
+        
+        while not self._stop_event.wait(interval):
+            idle = time.monotonic() - self._last_call
+            if self._last_call and interval <= idle < config.GEMINI_KEEPALIVE_WINDOW:
+                logger.debug("Sending Gemini keep-alive request")
+                self.warm_up()
+    
+    def _get_model(self):
+        """Model Gemini dùng chung của instance (cấu hình client ở lần gọi đầu tiên)"""
+        with self._model_lock:
+            if self._gemini_model is None:
+                import google.generativeai as genai
+                
+                genai.configure(api_key=self.api_key)
+                self._gemini_model = genai.GenerativeModel(
+                    model_name=self.model,
+                    generation_config=self.generation_config
+                )
+            return self._gemini_model
     
     def analyze_clipboard_data(self, data: Dict[str, Any], db_context: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -37,36 +135,78 @@ class AIService:
             Dict chứa kết quả phân tích
         """
         try:
-            # Lấy nội dung văn bản để phân tích
+            text_content, content_hash = self.prepare_text(data)
+        except Exception as e:
+            logger.error(f"Error extracting text content: {e}")
+            return self._get_default_result(f"Lỗi khi phân tích: {str(e)}")
+        
+        return self.analyze_text(data, text_content, db_context, content_hash)
+    
+    def prepare_text(self, data: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """
+        Trích xuất nội dung văn bản (dùng lại text đã cache nếu có)
+        
+        Không cần context CSDL nên có thể chạy song song với việc tải context.
+        
+        Returns:
+            (text_content, content_hash) - content_hash là None nếu không dùng cache
+        """
+        content_hash = self.cache.content_hash(data) if self.cache else None
+        
+        text_key = None
+        text_content = None
+        if content_hash:
+            text_key = AnalysisCache.make_key("text", content_hash, config.EXTRACT_CHAR_BUDGET)
+            text_content = self.cache.get_text(text_key)
+        if text_content is None:
             text_content = self._extract_text_content(data)
-            
+            if text_key and text_content and not self._is_extraction_error(text_content):
+                self.cache.put_text(text_key, text_content)
+        
+        return text_content, content_hash
+    
+    def analyze_text(self, data: Dict[str, Any], text_content: str, db_context: Dict[str, Any],
+                     content_hash: Optional[str] = None,
+                     on_partial: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Phân tích nội dung đã trích xuất bằng Gemini (hoặc lấy kết quả đã cache)
+        
+        Nếu có on_partial và AI_STREAMING bật, phản hồi được nhận dạng streaming và on_partial
+        được gọi với kết quả tạm mỗi khi nhận thêm được trường mới.
+        """
+        try:
             if not text_content or len(text_content.strip()) < 10:
                 return self._get_default_result("Nội dung quá ngắn để phân tích")
             
-            # Chuẩn bị prompt cho Gemini
-            system_prompt = self._build_system_prompt(db_context)
-            user_prompt = self._build_user_prompt(text_content, data)
+            # Kết quả đã có cho cùng nội dung, cùng context CSDL và cùng phiên bản prompt
+            result_key = self._result_key(data, content_hash, db_context)
+            cached_result = self._get_cached_result(result_key)
+            if cached_result is not None:
+                logger.info("Using cached AI analysis result")
+                return cached_result
+            
+            # Chuẩn bị prompt cho Gemini: phần cố định ở system prompt, ứng viên theo tài liệu ở user prompt
+            system_prompt = self._get_system_prompt(db_context)
+            user_prompt = (self._build_candidates_prompt(self._prompt_context(db_context, text_content))
+                           + self._build_user_prompt(text_content, data))
             
             # Gọi API Gemini
-            response = self._call_gemini_api(system_prompt, user_prompt)
+            try:
+                response = self._call_gemini_api(system_prompt, user_prompt, on_partial)
+            except Exception as e:
+                fallback_result = self._local_mapping_result(text_content)
+                if fallback_result is None:
+                    raise
+                logger.error(f"Gemini API unavailable, using local entity matching: {e}")
+                return fallback_result
             
             # Xử lý kết quả
             try:
-                # Try to extract JSON from response
-                # Gemini might wrap JSON in markdown code blocks
-                if "```json" in response:
-                    start = response.find("```json") + 7
-                    end = response.find("```", start)
-                    json_str = response[start:end].strip()
-                elif "```" in response:
-                    start = response.find("```") + 3
-                    end = response.find("```", start)
-                    json_str = response[start:end].strip()
-                else:
-                    json_str = response.strip()
-                
-                result = json.loads(json_str)
-                return self._format_analysis_result(result)
+                result = self._parse_json_response(response)
+                formatted_result = self._format_analysis_result(result)
+                if result_key:
+                    self.cache.put_result(result_key, formatted_result)
+                return formatted_result
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse Gemini response as JSON: {e}")
                 logger.error(f"Response was: {response}")
@@ -79,6 +219,226 @@ class AIService:
             logger.error(f"Error analyzing clipboard data: {e}")
             return self._get_default_result(f"Lỗi khi phân tích: {str(e)}")
     
+    def prepare_texts(self, items: List[Dict[str, Any]],
+                      cancelled: Optional[threading.Event] = None) -> List[Tuple[str, Optional[str]]]:
+        """
+        Trích xuất text cho nhiều file cùng lúc (file chưa có trong cache được đọc song song
+        trong process pool, dừng sớm khi cancelled được set)
+        
+        Returns:
+            Danh sách (text_content, content_hash) theo thứ tự items
+        """
+        hashes = [self.cache.content_hash(item) if self.cache else None for item in items]
+        texts = [None] * len(items)
+        
+        for index, content_hash in enumerate(hashes):
+            if content_hash:
+                texts[index] = self.cache.get_text(
+                    AnalysisCache.make_key("text", content_hash, config.EXTRACT_CHAR_BUDGET)
+                )
+        
+        missing = [index for index, text in enumerate(texts) if text is None]
+        extracted = extract_files_parallel([items[index].get("content", "") for index in missing],
+                                           cancelled=cancelled)
+        for index in missing:
+            text = extracted.get(items[index].get("content", ""), "")
+            texts[index] = text
+            if hashes[index] and text and not self._is_extraction_error(text):
+                self.cache.put_text(
+                    AnalysisCache.make_key("text", hashes[index], config.EXTRACT_CHAR_BUDGET), text
+                )
+        
+        return list(zip(texts, hashes))
+    
+    def analyze_batch(self, items: List[Dict[str, Any]], prepared: List[Tuple[str, Optional[str]]],
+                      db_context: Dict[str, Any],
+                      cancelled: Optional[threading.Event] = None) -> List[Dict[str, Any]]:
+        """
+        Phân tích nhiều file, gộp tối đa AI_BATCH_SIZE file vào một lần gọi Gemini
+        
+        Kết quả đã cache được dùng lại; nếu kết quả của một lô không đúng định dạng thì
+        các file trong lô được phân tích riêng từng file. Khi cancelled được set, các lô
+        chưa gửi bị bỏ qua (kết quả tương ứng là None).
+        """
+        results = [None] * len(items)
+        pending = []
+        
+        for index, (data, (text_content, content_hash)) in enumerate(zip(items, prepared)):
+            if not text_content or len(text_content.strip()) < 10:
+                results[index] = self._get_default_result("Nội dung quá ngắn để phân tích")
+                continue
+            result_key = self._result_key(data, content_hash, db_context)
+            cached_result = self._get_cached_result(result_key)
+            if cached_result is not None:
+                results[index] = cached_result
+            else:
+                pending.append((index, result_key))
+        
+        batch_size = max(config.AI_BATCH_SIZE, 1)
+        for start in range(0, len(pending), batch_size):
+            if cancelled is not None and cancelled.is_set():
+                break
+            batch = pending[start:start + batch_size]
+            batch_results = None
+            if len(batch) > 1:
+                batch_results = self._analyze_batch_call(
+                    [(items[index], prepared[index][0]) for index, _ in batch], db_context
+                )
+            
+            for position, (index, result_key) in enumerate(batch):
+                if cancelled is not None and cancelled.is_set():
+                    break
+                if batch_results is None:
+                    results[index] = self.analyze_text(items[index], prepared[index][0], db_context,
+                                                       prepared[index][1])
+                    continue
+                results[index] = batch_results[position]
+                if result_key:
+                    self.cache.put_result(result_key, batch_results[position])
+        
+        return results
+    
+    def _analyze_batch_call(self, documents: List[Tuple[Dict[str, Any], str]],
+                            db_context: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Gọi Gemini một lần cho nhiều tài liệu, trả về None nếu kết quả không dùng được"""
+        try:
+            system_prompt = self._get_system_prompt(db_context)
+            prompt_context = self._prompt_context(db_context, *[text_content for _, text_content in documents])
+            user_prompt = self._build_candidates_prompt(prompt_context) + self._build_batch_user_prompt(documents)
+            # Mỗi tài liệu trong lô cần đủ số token đầu ra như khi phân tích riêng
+            generation_config = dict(self.generation_config, max_output_tokens=self.max_tokens * len(documents))
+            response = self._call_gemini_api(system_prompt, user_prompt, generation_config=generation_config)
+            raw_results = self._parse_json_response(response)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse batched Gemini response as JSON: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error analyzing document batch: {e}")
+            return None
+        
+        if not isinstance(raw_results, list) or len(raw_results) != len(documents):
+            logger.error("Batched Gemini response does not match the number of documents")
+            return None
+        
+        return [self._format_analysis_result(raw if isinstance(raw, dict) else {}) for raw in raw_results]
+    
+    def _prompt_context(self, db_context: Dict[str, Any], *texts: str) -> Dict[str, Any]:
+        """Context đưa vào prompt: chỉ các thực thể ứng viên của các văn bản (nếu bật retrieval)"""
+        if self.retriever is None:
+            return db_context
+        try:
+            selected = self.retriever.select(db_context, *texts)
+        except Exception as e:
+            logger.error(f"Error retrieving candidate entities, sending full context: {e}")
+            return db_context
+        
+        if self.entity_index is not None and self.entity_index.is_ready():
+            self._add_embedding_candidates(selected, db_context, texts)
+        return selected
+    
+    def _add_embedding_candidates(self, selected: Dict[str, Any], db_context: Dict[str, Any], texts: Tuple[str, ...]):
+        """Bổ sung vào context các thực thể gần nhất theo chỉ mục vector (nếu chưa được chọn)"""
+        try:
+            for text in texts:
+                matches = self.entity_index.match_entities(text, config.EMBEDDING_TOP_K)
+                for entity_type, candidates in matches.items():
+                    context_key = ENTITY_SOURCES[entity_type][1]
+                    chosen_ids = {row.get('ID') for row in selected.get(context_key, [])}
+                    candidate_ids = {candidate['id'] for candidate in candidates} - chosen_ids
+                    if candidate_ids:
+                        selected[context_key] = selected.get(context_key, []) + [
+                            row for row in db_context.get(context_key, []) if row.get('ID') in candidate_ids
+                        ]
+        except Exception as e:
+            logger.error(f"Error matching entities with the local index: {e}")
+    
+    def _local_mapping_result(self, text_content: str) -> Optional[Dict[str, Any]]:
+        """Kết quả mapping không dùng AI (từ chỉ mục vector), None nếu chưa có chỉ mục"""
+        if self.entity_index is None or not self.entity_index.is_ready():
+            return None
+        
+        try:
+            matches = self.entity_index.match_entities(text_content, 1)
+        except Exception as e:
+            logger.error(f"Error matching entities with the local index: {e}")
+            return None
+        
+        result = self._get_default_result(
+            "Không kết nối được AI, mapping được gợi ý tự động từ dữ liệu dự án. Vui lòng kiểm tra lại."
+        )
+        fields = {
+            'DuAn': ('project_id', 'project_code', 'project_name'),
+            'PhongBan': ('department_id', 'department_code', 'department_name'),
+            'CongViec': ('task_id', None, 'task_name'),
+            'VanDe': ('issue_id', None, 'issue_description'),
+        }
+        for entity_type, (id_field, code_field, label_field) in fields.items():
+            candidates = matches.get(entity_type) or []
+            if not candidates or candidates[0]['score'] < config.EMBEDDING_MATCH_THRESHOLD:
+                continue
+            best = candidates[0]
+            mapping = {"matched": True, id_field: best['id'], label_field: best['label'], "confidence": best['score']}
+            if code_field:
+                mapping[code_field] = best['code']
+            result["mapping_results"][entity_type] = mapping
+        
+        return result
+    
+    def _result_key(self, data: Dict[str, Any], content_hash: Optional[str],
+                    db_context: Dict[str, Any]) -> Optional[str]:
+        """
+        Khóa cache kết quả AI: nội dung + context CSDL + phiên bản prompt/model
+        
+        Ngày hiện tại không nằm trong khóa: ngày chỉ dùng cho tiền tố YYYYMMDD của tên file gợi ý,
+        được cập nhật lại khi lấy kết quả từ cache (_get_cached_result).
+        """
+        if not content_hash or not self.cache:
+            return None
+        return AnalysisCache.make_key(
+            "result", content_hash, self._get_context_fingerprint(db_context),
+            PROMPT_VERSION, self.model, self.temperature, config.AI_PROMPT_CHAR_LIMIT,
+            data.get("type", ""), data.get("metadata", {}).get("name", "")
+        )
+    
+    def _get_context_fingerprint(self, db_context: Dict[str, Any]) -> str:
+        """
+        Fingerprint của context CSDL, chỉ tính lại khi context đổi
+        
+        ContextCache.get() trả về cùng một dict khi version không đổi, nên mỗi version
+        chỉ phải băm toàn bộ context một lần.
+        """
+        context, fingerprint = self._context_fingerprint
+        if context is not db_context:
+            fingerprint = AnalysisCache.context_fingerprint(db_context)
+            self._context_fingerprint = (db_context, fingerprint)
+        return fingerprint
+    
+    def _get_cached_result(self, result_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Kết quả AI đã cache, tiền tố ngày của tên file gợi ý được đổi thành ngày hiện tại"""
+        if not result_key:
+            return None
+        result = self.cache.get_result(result_key)
+        if result is not None and result.get("suggested_filename"):
+            result["suggested_filename"] = re.sub(r"^\d{8}(?=_)", datetime.now().strftime("%Y%m%d"),
+                                                  result["suggested_filename"])
+        return result
+    
+    @staticmethod
+    def _parse_json_response(response: str) -> Any:
+        """Lấy JSON từ phản hồi của Gemini (có thể bị bọc trong block code markdown)"""
+        if "```json" in response:
+            start = response.find("```json") + 7
+            end = response.find("```", start)
+            json_str = response[start:end].strip()
+        elif "```" in response:
+            start = response.find("```") + 3
+            end = response.find("```", start)
+            json_str = response[start:end].strip()
+        else:
+            json_str = response.strip()
+        
+        return json.loads(json_str)
+    
     def _extract_text_content(self, data: Dict[str, Any]) -> str:
         """Trích xuất nội dung văn bản từ dữ liệu clipboard"""
         data_type = data.get("type", "")
@@ -96,26 +456,33 @@ class AIService:
         else:
             return ""
     
+    @staticmethod
+    def _is_extraction_error(text: str) -> bool:
+        """Text là thông báo lỗi trích xuất (không nên cache)"""
+        return text.startswith(("[Không thể trích xuất", "[Lỗi khi trích xuất"))
+    
     def _extract_text_from_image(self, image_path: str) -> str:
         """Trích xuất text từ ảnh sử dụng OCR"""
-        try:
-            import pytesseract
-            from PIL import Image
-            
-            # Mở ảnh và trích xuất text
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image, lang='vie+eng')
-            return text
-            
-        except ImportError:
-            logger.warning("pytesseract not installed, cannot extract text from image")
-            return "[Không thể trích xuất text từ ảnh - cần cài đặt pytesseract]"
-        except Exception as e:
-            logger.error(f"Error extracting text from image: {e}")
-            return f"[Lỗi khi trích xuất text từ ảnh: {str(e)}]"
+        return ocr_image(image_path)
+    
+    def _get_system_prompt(self, db_context: Dict[str, Any]) -> str:
+        """
+        System prompt (hướng dẫn, quy tắc đặt tên, JSON schema), dựng lại chỉ khi ngày hoặc phiên bản
+        prompt thay đổi
+        
+        Khi tắt retrieval, toàn bộ danh sách thực thể nằm trong system prompt nên khóa gồm cả
+        fingerprint context; khi bật, ứng viên của từng tài liệu được gửi ở user prompt.
+        """
+        full_context = db_context if self.retriever is None else None
+        context_key = AnalysisCache.make_key(
+            self._get_context_fingerprint(full_context) if full_context is not None else "candidates",
+            PROMPT_VERSION, datetime.now().strftime('%Y%m%d')
+        )
+        return self.prompt_cache.get_prompt(context_key, lambda: self._build_system_prompt(full_context))
     
-    def _build_system_prompt(self, db_context: Dict[str, Any]) -> str:
-        """Xây dựng system prompt với context từ CSDL"""
+    @staticmethod
+    def _format_entities(db_context: Dict[str, Any]) -> str:
+        """Danh sách dự án, phòng ban, công việc, vấn đề dạng text cho prompt"""
         projects = db_context.get('projects', [])
         departments = db_context.get('departments', [])
         tasks = db_context.get('tasks', [])
@@ -126,10 +493,7 @@ class AIService:
         tasks_info = "\n".join([f"- ID: {t['ID']}, Tên: {t['TenCongViec']}, Dự án: {t['DuAn_ID']}" for t in tasks])
         issues_info = "\n".join([f"- ID: {i['ID']}, Mô tả: {i['MoTaVanDe']}, Dự án: {i['DuAn_ID']}" for i in issues])
         
-        return f"""
-Bạn là một trợ lý AI chuyên phân tích tài liệu dự án xây dựng. Hãy phân tích văn bản và mapping với các thực thể trong CSDL sau:
-
-DANH SÁCH DỰ ÁN:
+        return f"""DANH SÁCH DỰ ÁN:
 {projects_info}
 
 DANH SÁCH PHÒNG BAN:
@@ -139,9 +503,21 @@ DANH SÁCH CÔNG VIỆC:
 {tasks_info}
 
 DANH SÁCH VẤN ĐỀ:
-{issues_info}
+{issues_info}"""
+    
+    def _build_system_prompt(self, db_context: Optional[Dict[str, Any]] = None) -> str:
+        """Xây dựng system prompt (kèm danh sách thực thể từ CSDL nếu có db_context)"""
+        if db_context is not None:
+            entities_info = self._format_entities(db_context)
+        else:
+            entities_info = "(Danh sách các thực thể có thể liên quan được gửi kèm cùng tài liệu cần phân tích.)"
+        
+        return f"""
+Bạn là một trợ lý AI chuyên phân tích tài liệu dự án xây dựng. Hãy phân tích văn bản và mapping với các thực thể trong CSDL sau:
+
+{entities_info}
 
-Hãy xác định văn bản liên quan đến thực thể nào trong danh sách trên và trả về kết quả với độ tin cậy (confidence score từ 0.0 đến 1.0).
+Hãy xác định văn bản liên quan đến thực thể nào trong danh sách thực thể CSDL và trả về kết quả với độ tin cậy (confidence score từ 0.0 đến 1.0).
 
 Quy tắc đặt tên file: YYYYMMDD_MaDuAn_MaPhongBan_Loai_MoTaNgan.ext
 Trong đó:
@@ -173,16 +549,27 @@ Trả về kết quả dưới dạng JSON với cấu trúc sau:
   "suggested_filename": "Tên file đề xuất theo quy chuẩn",
   "suggested_destination": "Đường dẫn thư mục đề xuất"
 }}
+"""
+    
+    def _build_candidates_prompt(self, prompt_context: Dict[str, Any]) -> str:
+        """Phần đầu user prompt chứa các thực thể ứng viên (rỗng khi danh sách đầy đủ nằm ở system prompt)"""
+        if self.retriever is None:
+            return ""
+        return f"""
+Các thực thể trong CSDL có thể liên quan:
+
+{self._format_entities(prompt_context)}
 """
     
     def _build_user_prompt(self, text_content: str, data: Dict[str, Any]) -> str:
         """Xây dựng user prompt để gửi đến AI"""
         data_type = data.get("type", "")
         
+        # Giới hạn độ dài nội dung để prompt không quá dài
         prompt = f"""
 Hãy phân tích văn bản sau và trích xuất thông tin:
 
-{text_content[:4000]}  # Giới hạn 4000 ký tự để tránh quá dài
+{text_content[:config.AI_PROMPT_CHAR_LIMIT]}
 
 """
         
@@ -211,41 +598,91 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON VÀ KHÔNG BAO GIỜ ba
         
         return prompt
     
-    def _call_gemini_api(self, system_prompt: str, user_prompt: str) -> str:
-        """Gọi API Gemini để phân tích văn bản"""
-        import google.generativeai as genai
+    def _build_batch_user_prompt(self, documents: List[Tuple[Dict[str, Any], str]]) -> str:
+        """Xây dựng user prompt cho nhiều tài liệu trong một lần gọi"""
+        prompt = f"""
+Hãy phân tích lần lượt {len(documents)} tài liệu sau và trích xuất thông tin cho từng tài liệu:
+"""
         
-        # Configure the API
-        genai.configure(api_key=self.api_key)
+        for number, (data, text_content) in enumerate(documents, 1):
+            file_info = data.get("metadata", {})
+            # Giới hạn độ dài nội dung của từng tài liệu
+            prompt += f"""
+=== TÀI LIỆU {number} ===
+Tên file: {file_info.get('name', 'N/A')}
+Loại file: {file_info.get('type', 'N/A')}
+
+{text_content[:config.AI_PROMPT_CHAR_LIMIT]}
+"""
         
-        # Create the model
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config={
-                "temperature": self.temperature,
-                "max_output_tokens": self.max_tokens,
-            }
-        )
+        prompt += f"""
+Với MỖI tài liệu, hãy thực hiện các nhiệm vụ như với một tài liệu đơn lẻ (tóm tắt, loại tài liệu,
+thông tin văn bản, mapping CSDL, gợi ý tên file và vị trí lưu).
+
+QUAN TRỌNG: Trả về MỘT mảng JSON gồm đúng {len(documents)} phần tử theo đúng thứ tự tài liệu ở trên,
+mỗi phần tử có cấu trúc JSON như mô tả. KHÔNG bao quanh JSON trong các block code markdown.
+"""
         
-        # Combine system prompt and user prompt for Gemini
-        combined_prompt = f"{system_prompt}\n\n{user_prompt}"
+        return prompt
+    
+    def _call_gemini_api(self, system_prompt: str, user_prompt: str,
+                         on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """Gọi API Gemini để phân tích văn bản (generation_config ghi đè cấu hình mặc định của model)"""
+        model = self._get_model()
+        cached_model = self.prompt_cache.get_cached_model(system_prompt)
         
         try:
-            response = model.generate_content(combined_prompt)
+            if cached_model is not None:
+                try:
+                    # System prompt đã nằm trong cached content, chỉ gửi nội dung tài liệu
+                    return self._generate(cached_model, user_prompt, on_partial, generation_config)
+                except Exception as e:
+                    logger.warning(f"Gemini context cache failed, sending the full prompt: {e}")
+                    self.prompt_cache.invalidate(system_prompt)
             
-            # Extract text from response
-            if hasattr(response, 'text'):
-                return response.text
-            elif hasattr(response, 'parts') and response.parts:
-                return response.parts[0].text
-            else:
-                logger.error("Unexpected response format from Gemini API")
-                raise ValueError("Unexpected response format from Gemini API")
+            # Combine system prompt and user prompt for Gemini
+            combined_prompt = f"{system_prompt}\n\n{user_prompt}"
+            return self._generate(model, combined_prompt, on_partial, generation_config)
             
         except Exception as e:
             logger.error(f"Error calling Gemini API: {e}")
             raise
     
+    def _generate(self, model, prompt: str, on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                  generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """Sinh nội dung từ prompt (streaming nếu có on_partial và AI_STREAMING bật)"""
+        if on_partial is not None and config.AI_STREAMING:
+            return self._stream_gemini_response(model, prompt, on_partial, generation_config)
+        
+        response = model.generate_content(prompt, generation_config=generation_config)
+        self._last_call = time.monotonic()
+        
+        # Extract text from response
+        if hasattr(response, 'text'):
+            return response.text
+        elif hasattr(response, 'parts') and response.parts:
+            return response.parts[0].text
+        else:
+            logger.error("Unexpected response format from Gemini API")
+            raise ValueError("Unexpected response format from Gemini API")
+    
+    def _stream_gemini_response(self, model, prompt: str, on_partial: Callable[[Dict[str, Any]], None],
+                                generation_config: Optional[Dict[str, Any]] = None) -> str:
+        """Nhận phản hồi Gemini dạng streaming, gửi kết quả tạm qua on_partial, trả về toàn bộ text"""
+        parser = IncrementalJSONParser()
+        chunks = []
+        
+        for chunk in model.generate_content(prompt, generation_config=generation_config, stream=True):
+            text = chunk.text
+            chunks.append(text)
+            partial = parser.feed(text)
+            if isinstance(partial, dict):
+                on_partial(self._format_analysis_result(partial))
+        
+        self._last_call = time.monotonic()
+        return "".join(chunks)
+    
     def _format_analysis_result(self, raw_result: Dict[str, Any]) -> Dict[str, Any]:
         """Định dạng kết quả phân tích từ Gemini"""
         # Đảm bảo kết quả có đủ các trường cần thiết
@@ -0,0 +1,160 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Dict, Any, Optional
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+class AnalysisCache:
+    """
+    Cache trên đĩa (SQLite) cho text đã trích xuất và kết quả phân tích AI
+    
+    - Khóa text: SHA-256 của nội dung (byte của file hoặc chuỗi text) + giới hạn ký tự trích xuất
+    - Khóa kết quả AI: khóa nội dung + fingerprint context CSDL + phiên bản prompt/model
+    - Tổng dung lượng giới hạn bởi ANALYSIS_CACHE_MAX_MB, vượt quá thì xóa mục lâu nhất chưa dùng (LRU)
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = path or config.ANALYSIS_CACHE_FILE
+        self.max_bytes = (config.ANALYSIS_CACHE_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries "
+            "(key TEXT PRIMARY KEY, kind TEXT, value TEXT, size INTEGER, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries (last_access)")
+        self._conn.commit()
+    
+    @staticmethod
+    def content_hash(data: Dict[str, Any]) -> Optional[str]:
+        """Tính SHA-256 của dữ liệu clipboard (byte của file/ảnh hoặc chuỗi text)"""
+        data_type = data.get("type", "")
+        content = data.get("content")
+        digest = hashlib.sha256()
+        
+        try:
+            if data_type == "text" and isinstance(content, str):
+                digest.update(b"text:")
+                digest.update(content.encode("utf-8"))
+            elif data_type in ("file", "image") and content and os.path.isfile(content):
+                _, ext = os.path.splitext(content)
+                digest.update(f"file:{ext.lower()}:".encode("utf-8"))
+                with open(content, "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(block)
+            else:
+                return None
+        except OSError as e:
+            logger.warning(f"Cannot hash clipboard content: {e}")
+            return None
+        
+        return digest.hexdigest()
+    
+    @staticmethod
+    def context_fingerprint(db_context: Dict[str, Any]) -> str:
+        """Fingerprint của context CSDL (đổi khi danh sách dự án, phòng ban... thay đổi)"""
+        payload = json.dumps(db_context, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Ghép các thành phần thành một khóa cache"""
+        return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    
+    def get_text(self, key: str) -> Optional[str]:
+        """Lấy text đã trích xuất"""
+        return self._get(key)
+    
+    def put_text(self, key: str, text: str):
+        """Lưu text đã trích xuất"""
+        self._put(key, "text", text)
+    
+    def get_result(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lấy kết quả phân tích AI đã parse"""
+        value = self._get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    
+    def put_result(self, key: str, result: Dict[str, Any]):
+        """Lưu kết quả phân tích AI đã parse"""
+        self._put(key, "result", json.dumps(result, ensure_ascii=False, default=str))
+    
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_entries")
+        logger.info("Analysis cache cleared")
+    
+    def close(self):
+        """Đóng file cache"""
+        with self._lock:
+            self._conn.close()
+    
+    def _get(self, key: str) -> Optional[str]:
+        """Đọc một mục và cập nhật thời điểm truy cập (LRU)"""
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT value FROM cache_entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "UPDATE cache_entries SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading analysis cache: {e}")
+            return None
+    
+    def _put(self, key: str, kind: str, value: str):
+        """Ghi một mục rồi xóa các mục LRU nếu vượt dung lượng"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, kind, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, value, size, time.time())
+                )
+                self._evict()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing analysis cache: {e}")
+    
+    def _evict(self):
+        """Xóa các mục lâu nhất chưa dùng cho tới khi tổng dung lượng dưới giới hạn"""
+        total = self._conn.execute("SELECT coalesce(sum(size), 0) FROM cache_entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        
+        logger.debug(f"Analysis cache evicted {removed} entries")
@@ -0,0 +1,203 @@
+import queue
+import itertools
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from PyQt6.QtCore import QObject, pyqtSignal
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# Đánh dấu yêu cầu dừng thread điều phối
+_STOP = object()
+
+class AnalysisJob:
+    """Một lần nhấn hotkey: clipboard được chụp ngay, phân tích chạy khi tới lượt"""
+    
+    def __init__(self, job_id: int, capture_future):
+        self.job_id = job_id
+        self.capture_future = capture_future
+        self.cancelled = threading.Event()
+
+class AnalysisPipeline(QObject):
+    """
+    Chạy luồng hotkey -> clipboard -> context CSDL + trích xuất text -> Gemini ở background
+    
+    - Clipboard được đọc ngay khi nhấn hotkey, các lần nhấn tiếp theo được xếp hàng
+    - Tải context CSDL và trích xuất text chạy song song trên ThreadPoolExecutor
+    - Kết quả và tiến trình được gửi về thread giao diện qua signal (kết quả tạm khi AI trả lời streaming)
+    - cancel() hủy job đang chạy (kết quả bị bỏ qua) và các job đang chờ
+    """
+    
+    # (job_id, thông báo)
+    progress = pyqtSignal(int, str)
+    # (job_id, clipboard_data, kết quả tạm khi AI đang trả lời dạng streaming)
+    analysis_partial = pyqtSignal(int, dict, dict)
+    # (job_id, clipboard_data, ai_result)
+    analysis_ready = pyqtSignal(int, dict, dict)
+    # (job_id, tiêu đề, thông báo)
+    analysis_failed = pyqtSignal(int, str, str)
+    
+    def __init__(self, clipboard_handler, ai_service, db_manager, parent=None):
+        super().__init__(parent)
+        self.clipboard_handler = clipboard_handler
+        self.ai_service = ai_service
+        self.db_manager = db_manager
+        # Thread điều phối chờ các stage nên cần tối thiểu: chụp clipboard + context + trích xuất
+        self._executor = ThreadPoolExecutor(max_workers=max(config.PIPELINE_WORKERS, 3),
+                                            thread_name_prefix="pmis-pipeline")
+        self._jobs = queue.Queue()
+        self._job_ids = itertools.count(1)
+        self._current_job = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="pmis-pipeline-driver", daemon=True)
+        self._thread.start()
+    
+    def submit(self) -> int:
+        """Chụp clipboard và xếp hàng một job phân tích, trả về job_id"""
+        job = AnalysisJob(next(self._job_ids), self._executor.submit(self.clipboard_handler.get_clipboard_data))
+        self._jobs.put(job)
+        logger.info(f"Queued analysis job {job.job_id} ({self._jobs.qsize()} waiting)")
+        return job.job_id
+    
+    def cancel(self):
+        """Hủy job đang chạy và tất cả các job đang chờ"""
+        with self._lock:
+            if self._current_job is not None:
+                self._current_job.cancelled.set()
+        
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                self._jobs.put(job)
+                break
+            job.cancelled.set()
+            job.capture_future.cancel()
+        
+        logger.info("Analysis jobs cancelled")
+    
+    def is_busy(self) -> bool:
+        """Có job đang chạy hoặc đang chờ không"""
+        return self._current_job is not None or not self._jobs.empty()
+    
+    def shutdown(self):
+        """Hủy các job và dừng các thread"""
+        self.cancel()
+        self._jobs.put(_STOP)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _run(self):
+        """Thread điều phối: xử lý lần lượt từng job"""
+        while True:
+            job = self._jobs.get()
+            if job is _STOP:
+                break
+            
+            with self._lock:
+                self._current_job = job
+            try:
+                if not job.cancelled.is_set():
+                    self._process(job)
+            except Exception as e:
+                logger.error(f"Error processing clipboard data: {e}")
+                self.analysis_failed.emit(job.job_id, "Lỗi xử lý", f"Lỗi khi xử lý dữ liệu: {str(e)}")
+            finally:
+                with self._lock:
+                    self._current_job = None
+    
+    def _process(self, job: AnalysisJob):
+        """Các stage của một job, kiểm tra hủy giữa các stage"""
+        clipboard_data = job.capture_future.result()
+        
+        if clipboard_data["type"] == "empty":
+            self.analysis_failed.emit(job.job_id, "Clipboard trống",
+                                      "Không có dữ liệu trong clipboard để xử lý")
+            return
+        
+        if clipboard_data["type"] == "error":
+            self.analysis_failed.emit(
+                job.job_id, "Lỗi clipboard",
+                f"Không thể lấy dữ liệu từ clipboard: {clipboard_data.get('metadata', {}).get('error', '')}"
+            )
+            return
+        
+        if clipboard_data["type"] == "files":
+            self._process_files(job, clipboard_data)
+            return
+        
+        # Context CSDL và trích xuất text không phụ thuộc nhau nên chạy song song
+        self.progress.emit(job.job_id, "Đang đọc nội dung và tải dữ liệu dự án...")
+        context_future = self._executor.submit(self.db_manager.get_main_tables_info)
+        text_future = self._executor.submit(self.ai_service.prepare_text, clipboard_data)
+        
+        text_content, content_hash = text_future.result()
+        if self._is_cancelled(job, context_future):
+            return
+        db_context = context_future.result()
+        if self._is_cancelled(job):
+            return
+        
+        logger.info("Analyzing data with AI...")
+        self.progress.emit(job.job_id, "Đang phân tích bằng AI...")
+        ai_result = self.ai_service.analyze_text(
+            clipboard_data, text_content, db_context, content_hash,
+            on_partial=lambda partial: self._emit_partial(job, clipboard_data, partial)
+        )
+        if self._is_cancelled(job):
+            return
+        
+        self.analysis_ready.emit(job.job_id, clipboard_data, ai_result)
+    
+    def _process_files(self, job: AnalysisJob, clipboard_data: Dict[str, Any]):
+        """Phân tích nhiều file: trích xuất song song trong process pool, gọi AI theo lô"""
+        items = self.clipboard_handler.split_files(clipboard_data)
+        if not items:
+            self.analysis_failed.emit(job.job_id, "Không có file phù hợp",
+                                      "Không có file nào đọc được nội dung để phân tích")
+            return
+        
+        self.progress.emit(job.job_id, f"Đang đọc nội dung {len(items)} file và tải dữ liệu dự án...")
+        context_future = self._executor.submit(self.db_manager.get_main_tables_info)
+        texts_future = self._executor.submit(self.ai_service.prepare_texts, items, job.cancelled)
+        
+        prepared = texts_future.result()
+        if self._is_cancelled(job, context_future):
+            return
+        db_context = context_future.result()
+        if self._is_cancelled(job):
+            return
+        
+        logger.info(f"Analyzing {len(items)} files with AI...")
+        self.progress.emit(job.job_id, f"Đang phân tích {len(items)} file bằng AI...")
+        ai_results = self.ai_service.analyze_batch(items, prepared, db_context, job.cancelled)
+        if self._is_cancelled(job):
+            return
+        
+        # Mỗi file một giao diện xem lại, hiển thị lần lượt
+        for item, ai_result in zip(items, ai_results):
+            self.analysis_ready.emit(job.job_id, item, ai_result)
+    
+    def _emit_partial(self, job: AnalysisJob, clipboard_data: Dict[str, Any], partial: Dict[str, Any]):
+        """Gửi kết quả tạm về giao diện (bỏ qua nếu job đã bị hủy)"""
+        if not job.cancelled.is_set():
+            self.analysis_partial.emit(job.job_id, clipboard_data, partial)
+    
+    @staticmethod
+    def _is_cancelled(job: AnalysisJob, pending_future: Optional[Any] = None) -> bool:
+        """Kiểm tra job đã bị hủy chưa (hủy luôn stage chưa bắt đầu nếu có)"""
+        if not job.cancelled.is_set():
+            return False
+        if pending_future is not None:
+            pending_future.cancel()
+        logger.info(f"Analysis job {job.job_id} cancelled")
+        return True
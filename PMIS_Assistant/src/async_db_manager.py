@@ -0,0 +1,292 @@
+import asyncio
+import threading
+import psycopg
+from psycopg import sql
+from psycopg.rows import dict_row
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+from contextlib import asynccontextmanager
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.context_cache import ContextCache, CONTEXT_TABLES
+from src.schema_catalog import schema_catalog
+from src.db_manager import DatabaseManager, LOG_AI_ACTIVITY_QUERY
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabaseManager:
+    """
+    Phiên bản bất đồng bộ của DatabaseManager dùng psycopg.AsyncConnection
+    
+    Mỗi truy vấn lấy một connection riêng từ AsyncConnectionPool nên các truy vấn độc lập
+    (ví dụ năm bảng context AI) có thể chạy song song bằng asyncio.gather.
+    Code đồng bộ (thread nền) gọi qua run(), coroutine chạy trên event loop riêng của manager.
+    
+    Sử dụng:
+        async with AsyncDatabaseManager() as db:
+            context = await db.get_main_tables_info()
+        
+        db = AsyncDatabaseManager()
+        context = db.run(db.get_main_tables_info())
+        db.stop()
+    """
+    
+    def __init__(self, use_pool: Optional[bool] = None):
+        self.connection_params = {
+            'host': config.DB_HOST,
+            'port': config.DB_PORT,
+            'dbname': config.DB_NAME,
+            'user': config.DB_USER,
+            'password': config.DB_PASSWORD
+        }
+        self.connection = None
+        self.pool = None
+        # Connection dùng chung chỉ chạy được một truy vấn tại một thời điểm
+        self._connection_lock = asyncio.Lock()
+        # Event loop nền cho run() (tạo khi cần lần đầu)
+        self._loop = None
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        
+        if use_pool is None:
+            use_pool = config.DB_POOL_ENABLED
+        
+        if use_pool:
+            if AsyncConnectionPool is None:
+                logger.warning("psycopg_pool not installed, falling back to a single shared async connection")
+            else:
+                self.pool = AsyncConnectionPool(
+                    kwargs=self.connection_params,
+                    min_size=config.DB_POOL_MIN_SIZE,
+                    max_size=max(config.DB_POOL_MAX_SIZE, config.DB_POOL_MIN_SIZE),
+                    timeout=config.DB_POOL_TIMEOUT,
+                    max_idle=config.DB_POOL_MAX_IDLE,
+                    reconnect_timeout=config.DB_POOL_RECONNECT_TIMEOUT,
+                    check=AsyncConnectionPool.check_connection,
+                    name="pmis-async",
+                    open=False
+                )
+        
+        self.schema_catalog = schema_catalog
+    
+    async def open(self):
+        """Mở connection pool (không chờ kết nối sẵn sàng)"""
+        if self.pool is not None and self.pool.closed:
+            await self.pool.open(wait=False)
+            logger.info("Async database pool opened")
+    
+    async def __aenter__(self):
+        await self.open()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def run(self, coroutine) -> Any:
+        """Chạy một coroutine trên event loop nền của manager và chờ kết quả (gọi từ code đồng bộ)"""
+        with self._thread_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                name="pmis-async-db", daemon=True)
+                self._thread.start()
+                asyncio.run_coroutine_threadsafe(self.open(), self._loop).result()
+            loop = self._loop
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    
+    def stop(self):
+        """Đóng kết nối và dừng event loop nền (nếu đã được tạo bởi run())"""
+        with self._thread_lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is None:
+            return
+        
+        try:
+            asyncio.run_coroutine_threadsafe(self.close(), loop).result(timeout=10)
+        except Exception as e:
+            logger.error(f"Error closing async database manager: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+    
+    @asynccontextmanager
+    async def get_connection(self):
+        """Async context manager để lấy connection (từ pool nếu bật, ngược lại dùng connection chung)"""
+        if self.pool is not None:
+            async with self.pool.connection() as connection:
+                yield connection
+        else:
+            async with self._connection_lock:
+                if self.connection is None or self.connection.closed:
+                    self.connection = await psycopg.AsyncConnection.connect(**self.connection_params)
+                yield self.connection
+    
+    @asynccontextmanager
+    async def get_cursor(self, dictionary=True):
+        """Async context manager để lấy cursor từ connection"""
+        async with self.get_connection() as connection:
+            cursor = None
+            try:
+                if dictionary:
+                    cursor = connection.cursor(row_factory=dict_row)
+                else:
+                    cursor = connection.cursor()
+                
+                yield cursor
+                await connection.commit()
+            except Exception as e:
+                if not connection.closed:
+                    await connection.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                if cursor:
+                    await cursor.close()
+    
+    async def test_connection(self) -> bool:
+        """Kiểm tra kết nối đến cơ sở dữ liệu"""
+        try:
+            async with self.get_cursor() as cursor:
+                await cursor.execute("SELECT 1")
+                return True
+        except Exception as e:
+            logger.error(f"Connection test failed: {e}")
+            return False
+    
+    async def get_main_tables_info(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Lấy thông tin từ các bảng chính để làm context cho AI (các bảng được truy vấn song song)"""
+        fetched = await self.fetch_context_tables()
+        return {key: rows for key, (rows, _) in fetched.items()}
+    
+    async def fetch_context_tables(self, since: Optional[Dict[str, Any]] = None
+                                   ) -> Dict[str, Tuple[List[Dict[str, Any]], Any]]:
+        """
+        Lấy các bảng context song song, mỗi bảng trên một connection: {key: (dòng, last_updated lớn nhất)}
+        
+        since=None lấy toàn bộ dòng chưa xóa; với dict {key: mốc} chỉ lấy delta (kèm is_deleted)
+        như ContextCache. Lỗi của bất kỳ bảng nào được ném lại cho nơi gọi.
+        """
+        keys = list(CONTEXT_TABLES.keys())
+        results = await asyncio.gather(
+            *(self._fetch_context_table(key, since) for key in keys)
+        )
+        return dict(zip(keys, results))
+    
+    async def _fetch_context_table(self, key: str, since: Optional[Dict[str, Any]]
+                                   ) -> Tuple[List[Dict[str, Any]], Any]:
+        """Lấy một bảng context"""
+        query, params = ContextCache.build_table_query(key, since is not None,
+                                                       (since or {}).get(key))
+        async with self.get_cursor() as cursor:
+            await cursor.execute(query, params or None)
+            return ContextCache.split_last_sync(await cursor.fetchall())
+    
+    async def get_table_data(self, table_name: str, columns: List[str] = None,
+                             order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Lấy dữ liệu từ một bảng cụ thể (có thể kèm ORDER BY và LIMIT)"""
+        if columns is None:
+            # Lấy tất cả các cột trừ các cột hệ thống
+            schema = await self.schema_catalog.get_columns_async(self, table_name)
+            columns = [col['column_name'] for col in schema
+                       if col['column_name'] not in ['is_deleted', 'last_updated']]
+        else:
+            columns = [column.strip().strip('"') for column in columns]
+        
+        query = sql.SQL("SELECT {} FROM {} WHERE is_deleted = FALSE OR is_deleted IS NULL").format(
+            DatabaseManager._select_list(columns),
+            sql.Identifier(self.schema_catalog.normalize_name(table_name))
+        ) + sql.SQL(DatabaseManager._build_order_limit(order_by, limit))
+        
+        try:
+            async with self.get_cursor() as cursor:
+                await cursor.execute(query)
+                return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting data from table {table_name}: {e}")
+            return []
+    
+    async def insert_document(self, table_name: str, data: Dict[str, Any]) -> int:
+        """Chèn dữ liệu vào bảng cụ thể và trả về ID của bản ghi mới"""
+        # Lọc ra các cột có trong bảng
+        table_columns = [col['column_name']
+                         for col in await self.schema_catalog.get_columns_async(self, table_name)]
+        filtered_data = {k: v for k, v in data.items() if k in table_columns}
+        
+        if not filtered_data:
+            raise ValueError(f"No valid columns found for table {table_name}")
+        
+        id_column = next((col for col in table_columns if col.lower() == 'id'), 'id')
+        query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) RETURNING {}").format(
+            sql.Identifier(self.schema_catalog.normalize_name(table_name)),
+            sql.SQL(', ').join(sql.Identifier(col) for col in filtered_data),
+            sql.SQL(', ').join(sql.Placeholder() * len(filtered_data)),
+            sql.Identifier(id_column)
+        )
+        
+        try:
+            async with self.get_cursor(dictionary=False) as cursor:
+                await cursor.execute(query, list(filtered_data.values()))
+                result = await cursor.fetchone()
+                return result[0] if result else None
+        except (psycopg.errors.UndefinedColumn, psycopg.errors.UndefinedTable) as e:
+            # Catalog có thể đã cũ sau khi DDL thay đổi
+            self.schema_catalog.invalidate()
+            logger.error(f"Error inserting into table {table_name}: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error inserting into table {table_name}: {e}")
+            raise
+    
+    async def insert_into_documents_table(self, document_data: Dict[str, Any]) -> int:
+        """Chèn dữ liệu vào bảng tbl_documents"""
+        return await self.insert_document('tbl_documents', document_data)
+    
+    async def log_ai_activity(self, filename: str, ai_response: str, status: str) -> int:
+        """Ghi log hoạt động của AI vào bảng gemini_automation_log"""
+        try:
+            async with self.get_cursor(dictionary=False) as cursor:
+                await cursor.execute(LOG_AI_ACTIVITY_QUERY, (filename, ai_response, status))
+                result = await cursor.fetchone()
+                return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Error logging AI activity: {e}")
+            raise
+    
+    async def search_data(self, table_name: str, filters: Dict[str, Any],
+                          order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Tìm kiếm dữ liệu trong bảng với các bộ lọc ILIKE (có thể kèm ORDER BY và LIMIT)"""
+        where_conditions, values = DatabaseManager._build_filter_conditions(filters)
+        if not where_conditions:
+            return await self.get_table_data(table_name, order_by=order_by, limit=limit)
+        
+        query = sql.SQL("SELECT * FROM {} WHERE {}").format(
+            sql.Identifier(self.schema_catalog.normalize_name(table_name)),
+            sql.SQL(' AND ').join(where_conditions)
+        ) + sql.SQL(DatabaseManager._build_order_limit(order_by, limit))
+        
+        try:
+            async with self.get_cursor() as cursor:
+                await cursor.execute(query, values)
+                return await cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error searching in table {table_name}: {e}")
+            return []
+    
+    async def close(self):
+        """Đóng kết nối đến database"""
+        if self.pool is not None and not self.pool.closed:
+            await self.pool.close()
+            logger.info("Async database pool closed")
+        if self.connection and not self.connection.closed:
+            await self.connection.close()
+            logger.info("Async database connection closed")
@@ -0,0 +1,148 @@
+import re
+import math
+import threading
+import unicodedata
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Optional, Tuple
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.analysis_cache import AnalysisCache
+
+logger = logging.getLogger(__name__)
+
+# Các trường dùng để tìm ứng viên của từng loại thực thể trong context AI
+RETRIEVAL_FIELDS = {
+    'projects': ['MaDuAn', 'TenDuAn'],
+    'departments': ['MaPhongBan', 'TenPhongBan'],
+    'tasks': ['TenCongViec'],
+    'issues': ['MoTaVanDe'],
+}
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+class BM25Index:
+    """Chỉ mục BM25 trên từ và trigram ký tự (chịu được lỗi OCR và mã viết liền/viết tách)"""
+    
+    K1 = 1.5
+    B = 0.75
+    
+    def __init__(self, documents: List[str]):
+        self.size = len(documents)
+        self._postings = defaultdict(list)   # {term: [(vị trí tài liệu, tần suất)]}
+        self._lengths = []
+        
+        for index, document in enumerate(documents):
+            terms = Counter(tokenize(document))
+            self._lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self._postings[term].append((index, count))
+        
+        self._average_length = (sum(self._lengths) / self.size) if self.size else 0.0
+    
+    def scores(self, query_terms: List[str]) -> Dict[int, float]:
+        """Điểm BM25 của các tài liệu chứa ít nhất một term của câu truy vấn"""
+        scores = defaultdict(float)
+        for term in set(query_terms):
+            postings = self._postings.get(term)
+            # Term xuất hiện ở quá nửa số tài liệu gần như không phân biệt được gì
+            if not postings or len(postings) > self.size / 2 > 1:
+                continue
+            
+            idf = math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            weight = idf if not term.startswith('#') else idf * config.RETRIEVAL_TRIGRAM_WEIGHT
+            for index, count in postings:
+                norm = self.K1 * (1 - self.B + self.B * self._lengths[index] / self._average_length)
+                scores[index] += weight * count * (self.K1 + 1) / (count + norm)
+        return scores
+
+class CandidateRetriever:
+    """
+    Chọn trước top-K thực thể (dự án, phòng ban, công việc, vấn đề) liên quan tới tài liệu
+    
+    Thay vì đưa toàn bộ context CSDL vào prompt, mỗi loại thực thể được xếp hạng bằng BM25
+    trên từ và trigram (bỏ dấu tiếng Việt) so với nội dung tài liệu, chỉ giữ RETRIEVAL_TOP_K
+    thực thể điểm cao nhất. Công việc/vấn đề thuộc các dự án được chọn được cộng điểm.
+    Loại thực thể có không quá RETRIEVAL_TOP_K dòng được giữ nguyên.
+    Chỉ mục được dựng lại khi context CSDL thay đổi (theo fingerprint).
+    """
+    
+    def __init__(self, top_k: Optional[int] = None):
+        self.top_k = top_k or config.RETRIEVAL_TOP_K
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._indexes = {}
+    
+    def select(self, db_context: Dict[str, Any], *texts: str) -> Dict[str, Any]:
+        """Trả về context chỉ gồm các ứng viên của các văn bản (hợp các ứng viên nếu có nhiều văn bản)"""
+        indexes = self._get_indexes(db_context)
+        selected = dict(db_context)
+        
+        project_ids = set()
+        if 'projects' in indexes:
+            rows = self._select_rows(db_context, 'projects', indexes['projects'], texts)
+            selected['projects'] = rows
+            project_ids = {row.get('ID') for row in rows}
+        
+        for key in RETRIEVAL_FIELDS:
+            if key == 'projects' or key not in indexes:
+                continue
+            selected[key] = self._select_rows(db_context, key, indexes[key], texts, project_ids)
+        
+        logger.debug(
+            "Retrieved candidates: " + ", ".join(
+                f"{key} {len(selected.get(key, []))}/{len(db_context.get(key, []))}" for key in RETRIEVAL_FIELDS
+            )
+        )
+        return selected
+    
+    def _select_rows(self, db_context: Dict[str, Any], key: str, index: BM25Index, texts: Tuple[str, ...],
+                     project_ids: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Top-K dòng của một loại thực thể cho từng văn bản, giữ thứ tự ban đầu"""
+        rows = db_context.get(key, [])
+        chosen = set()
+        
+        for text in texts:
+            scores = index.scores(tokenize(text[:config.AI_PROMPT_CHAR_LIMIT]))
+            if project_ids:
+                for position in scores:
+                    if rows[position].get('DuAn_ID') in project_ids:
+                        scores[position] *= config.RETRIEVAL_PROJECT_BOOST
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            chosen.update(position for position, _ in ranked[:self.top_k])
+        
+        return [rows[position] for position in sorted(chosen)]
+    
+    def _get_indexes(self, db_context: Dict[str, Any]) -> Dict[str, BM25Index]:
+        """Chỉ mục của các loại thực thể có nhiều hơn top_k dòng (dựng lại khi context đổi)"""
+        fingerprint = AnalysisCache.context_fingerprint(db_context)
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                self._indexes = {}
+                for key, fields in RETRIEVAL_FIELDS.items():
+                    rows = db_context.get(key, [])
+                    if len(rows) > self.top_k:
+                        self._indexes[key] = BM25Index(
+                            [" ".join(str(row.get(field) or "") for field in fields) for row in rows]
+                        )
+                self._fingerprint = fingerprint
+                logger.info(f"Built candidate retrieval index for {len(self._indexes)} entity types")
+            return self._indexes
+
+def normalize_text(text: str) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d)"""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(char for char in text if unicodedata.category(char) != 'Mn')
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ và trigram ký tự (trigram có tiền tố '#' để phân biệt với từ)"""
+    terms = []
+    for word in _WORD_PATTERN.findall(normalize_text(text)):
+        terms.append(word)
+        padded = f" {word} "
+        terms.extend('#' + padded[i:i + 3] for i in range(len(padded) - 2))
+    return terms
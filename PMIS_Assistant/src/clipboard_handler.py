@@ -5,12 +5,23 @@ import time
 from PIL import Image, ImageGrab
 import win32clipboard
 import win32con
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Iterator
 import logging
 from datetime import datetime
+import sys
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.text_extraction import IMAGE_EXTENSIONS
+from src.ocr_engine import get_ocr_engine
 
 logger = logging.getLogger(__name__)
 
+TEXT_EXTENSIONS = ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.csv']
+# Các loại file đọc được nội dung khi phân tích nhiều file
+READABLE_EXTENSIONS = TEXT_EXTENSIONS + ['.pdf', '.doc', '.docx'] + IMAGE_EXTENSIONS
+
 class ClipboardHandler:
     """Xử lý các loại dữ liệu từ clipboard Windows"""
     
@@ -195,8 +206,8 @@ class ClipboardHandler:
                 if data and len(data) > 0:
                     file_paths = list(data)
                     
-                    # Nếu chỉ có một file, xử lý file đó
-                    if len(file_paths) == 1:
+                    # Nếu chỉ có một file, xử lý file đó (một thư mục được xử lý như nhiều file)
+                    if len(file_paths) == 1 and not os.path.isdir(file_paths[0]):
                         file_path = file_paths[0]
                         
                         if os.path.exists(file_path):
@@ -238,6 +249,39 @@ class ClipboardHandler:
                 pass
             return None
     
+    def split_files(self, clipboard_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Tách dữ liệu nhiều file thành danh sách dữ liệu từng file để phân tích riêng
+        
+        Thư mục được duyệt đệ quy, chỉ giữ các file đọc được và tối đa MULTI_FILE_LIMIT file.
+        """
+        file_paths = []
+        for path in clipboard_data.get("content") or []:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    file_paths.extend(os.path.join(root, name) for name in sorted(names))
+            elif os.path.isfile(path):
+                file_paths.append(path)
+        
+        readable = [path for path in file_paths
+                    if os.path.splitext(path)[1].lower() in READABLE_EXTENSIONS]
+        if len(readable) > config.MULTI_FILE_LIMIT:
+            logger.warning(f"Too many files ({len(readable)}), analyzing the first {config.MULTI_FILE_LIMIT}")
+            readable = readable[:config.MULTI_FILE_LIMIT]
+        
+        timestamp = datetime.now().isoformat()
+        return [
+            {
+                "type": "file",
+                "content": path,
+                "metadata": {
+                    **self._get_file_info(path),
+                    "timestamp": timestamp
+                }
+            }
+            for path in readable
+        ]
+    
     def _get_file_info(self, file_path: str) -> Dict[str, Any]:
         """Lấy thông tin chi tiết về file"""
         try:
@@ -279,24 +323,32 @@ class ClipboardHandler:
                 "error": str(e)
             }
     
-    def read_file_content(self, file_path: str) -> Optional[str]:
-        """Đọc nội dung file (chỉ cho các file text-based)"""
+    def read_file_content(self, file_path: str, max_chars: Optional[int] = None) -> Optional[str]:
+        """
+        Đọc nội dung file (chỉ cho các file text-based)
+        
+        Chỉ đọc tối đa max_chars ký tự (mặc định EXTRACT_CHAR_BUDGET, 0 = không giới hạn),
+        nên file PDF/Word lớn dừng ngay khi đã đủ nội dung cho AI.
+        """
+        if max_chars is None:
+            max_chars = config.EXTRACT_CHAR_BUDGET
+        
         try:
             _, ext = os.path.splitext(file_path)
             ext = ext.lower()
             
             # Xử lý các loại file text-based
-            if ext in ['.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml', '.csv']:
+            if ext in TEXT_EXTENSIONS:
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    return f.read()
+                    return f.read(max_chars or -1)
             
             # Xử lý file PDF
             elif ext == '.pdf':
-                return self._read_pdf_content(file_path)
+                return self._read_pdf_content(file_path, max_chars)
             
             # Xử lý file Word
             elif ext in ['.doc', '.docx']:
-                return self._read_word_content(file_path)
+                return self._read_word_content(file_path, max_chars)
             
             else:
                 logger.warning(f"Unsupported file type for reading: {ext}")
@@ -306,17 +358,29 @@ class ClipboardHandler:
             logger.error(f"Error reading file content from {file_path}: {e}")
             return None
     
-    def _read_pdf_content(self, file_path: str) -> Optional[str]:
-        """Đọc nội dung từ file PDF"""
+    def iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """Đọc lần lượt text của từng trang PDF (chỉ phân tích trang khi được lấy tới)"""
+        import PyPDF2
+        
+        with open(file_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for page in reader.pages:
+                yield page.extract_text() or ""
+    
+    def _read_pdf_content(self, file_path: str, max_chars: int = 0) -> Optional[str]:
+        """Đọc nội dung từ file PDF, dừng khi đã đủ max_chars ký tự (0 = đọc hết)"""
         try:
-            import PyPDF2
+            pages = self.iter_pdf_pages(file_path)
+            try:
+                text = self._join_with_budget(pages, max_chars)
+            finally:
+                pages.close()
             
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-                return text
+            # PDF scan không có lớp text: OCR từng trang
+            if not text.strip() and config.OCR_SCANNED_PDF:
+                logger.info(f"No text layer in {file_path}, running OCR")
+                text = get_ocr_engine().pdf_to_text(file_path, max_chars)
+            return text
                 
         except ImportError:
             logger.warning("PyPDF2 not installed, cannot read PDF content")
@@ -325,16 +389,13 @@ class ClipboardHandler:
             logger.error(f"Error reading PDF content: {e}")
             return None
     
-    def _read_word_content(self, file_path: str) -> Optional[str]:
-        """Đọc nội dung từ file Word"""
+    def _read_word_content(self, file_path: str, max_chars: int = 0) -> Optional[str]:
+        """Đọc nội dung từ file Word, dừng khi đã đủ max_chars ký tự (0 = đọc hết)"""
         try:
             import docx
             
             doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            return self._join_with_budget((paragraph.text for paragraph in doc.paragraphs), max_chars)
                 
         except ImportError:
             logger.warning("python-docx not installed, cannot read Word content")
@@ -343,6 +404,20 @@ class ClipboardHandler:
             logger.error(f"Error reading Word content: {e}")
             return None
     
+    @staticmethod
+    def _join_with_budget(parts: Iterator[str], max_chars: int = 0) -> str:
+        """Ghép các đoạn text (mỗi đoạn một dòng), ngừng lấy thêm khi đủ max_chars ký tự"""
+        chunks = []
+        total = 0
+        for part in parts:
+            chunks.append(part)
+            total += len(part) + 1
+            if max_chars and total >= max_chars:
+                break
+        
+        text = "\n".join(chunks) + "\n" if chunks else ""
+        return text[:max_chars] if max_chars else text
+    
     def cleanup_temp_files(self):
         """Dọn dẹp các file tạm thời đã tạo"""
         try:
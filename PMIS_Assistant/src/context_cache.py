@@ -0,0 +1,263 @@
+import time
+import threading
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import psycopg
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# Các bảng dùng làm context cho AI: key -> (tên bảng, danh sách cột)
+CONTEXT_TABLES = {
+    'projects': ('"DuAn"', ['"ID"', '"MaDuAn"', '"TenDuAn"']),
+    'departments': ('"PhongBan"', ['"ID"', '"MaPhongBan"', '"TenPhongBan"']),
+    'tasks': ('"CongViec"', ['"ID"', '"TenCongViec"', '"DuAn_ID"']),
+    'issues': ('"VanDe"', ['"ID"', '"MoTaVanDe"', '"DuAn_ID"']),
+    'progress': ('"TienTrinhXuLy"', ['"ID"', '"CongViec_ID"', '"TinhTrangThucHien"']),
+}
+
+class ContextCache:
+    """
+    Cache trong bộ nhớ cho context AI (DuAn, PhongBan, CongViec, VanDe, TienTrinhXuLy)
+
+    - Trong thời gian TTL: trả về dữ liệu trong bộ nhớ, không truy vấn DB
+    - Hết TTL: chỉ lấy các dòng có last_updated từ lần đồng bộ trước trừ CONTEXT_DELTA_OVERLAP giây
+      (dòng của transaction commit muộn vẫn được lấy, dòng lấy lại được gộp theo ID)
+    - Định kỳ (hoặc sau invalidate): tải lại toàn bộ để bắt các dòng bị xóa cứng
+    - Listener (add_listener) nhận các thay đổi: listener(key, dòng mới/đổi, ID đã xóa, full)
+    """
+
+    def __init__(self, db_manager, ttl: Optional[float] = None,
+                 full_refresh_interval: Optional[float] = None,
+                 single_query: Optional[bool] = None):
+        self.db_manager = db_manager
+        # Gộp năm bảng vào một truy vấn json_agg để chỉ tốn một round-trip tới server
+        self.single_query = config.CONTEXT_SINGLE_QUERY if single_query is None else single_query
+        self.ttl = config.CONTEXT_CACHE_TTL if ttl is None else ttl
+        self.full_refresh_interval = (config.CONTEXT_CACHE_FULL_REFRESH
+                                      if full_refresh_interval is None else full_refresh_interval)
+        self._lock = threading.Lock()
+        self._rows = {}          # {key: {ID: row}}
+        self._last_sync = {}     # {key: last_updated lớn nhất đã thấy}
+        self._checked_at = 0.0   # Thời điểm kiểm tra DB gần nhất
+        self._loaded_at = 0.0    # Thời điểm tải toàn bộ gần nhất
+        self.version = 0         # Tăng mỗi khi dữ liệu context thay đổi
+        self._snapshot = None    # (version, context) đã trả về, dùng lại khi version chưa đổi
+        self._listeners = []
+
+    def get(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Lấy context, làm mới nếu cần
+
+        Khi version không đổi, get() trả về cùng một dict (nơi gọi không được sửa nó), nên nơi gọi
+        có thể nhớ các giá trị tính từ context (ví dụ fingerprint) theo đối tượng.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self._rows or now - self._loaded_at >= self.full_refresh_interval:
+                self._full_load(now)
+            elif now - self._checked_at >= self.ttl:
+                self._incremental_refresh(now)
+
+            if self._snapshot is None or self._snapshot[0] != self.version:
+                self._snapshot = (self.version,
+                                  {key: list(self._rows.get(key, {}).values()) for key in CONTEXT_TABLES})
+            return self._snapshot[1]
+
+    def add_listener(self, listener: Callable[[str, List[Dict[str, Any]], List[Any], bool], None]):
+        """
+        Đăng ký nhận thay đổi context: listener(key, rows, deleted_ids, full)
+
+        full=True khi tải lại toàn bộ (rows là toàn bộ dòng của bảng). Listener được gọi khi đang
+        giữ lock của cache nên chỉ nên xếp hàng công việc, không xử lý lâu.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, List[Dict[str, Any]], List[Any], bool], None]):
+        """Hủy đăng ký listener"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, key: str, rows: List[Dict[str, Any]], deleted_ids: List[Any], full: bool):
+        """Gửi thay đổi của một bảng tới các listener"""
+        for listener in list(self._listeners):
+            try:
+                listener(key, rows, deleted_ids, full)
+            except Exception as e:
+                logger.error(f"Error in context cache listener: {e}")
+
+    def invalidate(self):
+        """Xóa cache, lần gọi get() tiếp theo sẽ tải lại toàn bộ"""
+        with self._lock:
+            self._rows = {}
+            self._last_sync = {}
+            self._checked_at = 0.0
+            self._loaded_at = 0.0
+            self._snapshot = None
+        logger.info("Context cache invalidated")
+
+    def _full_load(self, now: float):
+        """Tải lại toàn bộ các bảng context"""
+        try:
+            if self.single_query:
+                fetched = self._fetch_single_query(deltas=False)
+            else:
+                fetched = self._fetch_per_table(deltas=False)
+        except Exception as e:
+            logger.error(f"Error loading context cache: {e}")
+            # Giữ dữ liệu cũ (nếu có) khi mất kết nối
+            if self._rows:
+                self._checked_at = now
+            elif isinstance(e, psycopg.OperationalError):
+                # Chưa có dữ liệu nào: báo mất kết nối để nơi gọi dùng nguồn dự phòng
+                raise
+            return
+
+        self._rows = {key: {row['ID']: row for row in rows} for key, (rows, _) in fetched.items()}
+        self._last_sync = {key: last_sync for key, (_, last_sync) in fetched.items()}
+        self._checked_at = now
+        self._loaded_at = now
+        self.version += 1
+        for key, rows in self._rows.items():
+            self._notify(key, list(rows.values()), [], True)
+        logger.info("Context cache fully loaded")
+
+    def _incremental_refresh(self, now: float):
+        """Chỉ lấy các dòng thay đổi kể từ lần đồng bộ trước"""
+        changed = False
+
+        try:
+            if self.single_query:
+                fetched = self._fetch_single_query(deltas=True)
+            else:
+                fetched = self._fetch_per_table(deltas=True)
+
+            for key, (rows, last_sync) in fetched.items():
+                if self._apply_delta(key, rows, last_sync):
+                    changed = True
+        except Exception as e:
+            logger.error(f"Error refreshing context cache: {e}")
+
+        self._checked_at = now
+        if changed:
+            self.version += 1
+            logger.debug("Context cache updated from deltas")
+
+    def _fetch_single_query(self, deltas: bool) -> Dict[str, Tuple[List[Dict[str, Any]], Any]]:
+        """
+        Lấy tất cả các bảng context trong một truy vấn (một round-trip)
+
+        Mỗi bảng được gộp thành một mảng JSON bằng json_agg kèm max(last_updated).
+        Với deltas=True chỉ lấy các dòng thay đổi từ lần đồng bộ trước (xem _delta_since),
+        kể cả dòng đã xóa mềm, để loại khỏi cache.
+        """
+        params = []
+        if deltas:
+            for key in CONTEXT_TABLES:
+                since = self._delta_since(key)
+                params.extend([since, since])
+
+        statement = 'context_delta' if deltas else 'context_full'
+        with self.db_manager.get_cursor() as cursor:
+            self.db_manager.execute_prepared(cursor, statement, params)
+            result = cursor.fetchone()
+
+        return {key: (result[key], result[f"{key}_last_sync"]) for key in CONTEXT_TABLES}
+
+    @staticmethod
+    def build_single_query(deltas: bool) -> str:
+        """
+        Tạo câu SQL gộp tất cả các bảng context (không phụ thuộc dữ liệu nên có thể prepare)
+
+        Với deltas=True, mỗi bảng nhận hai tham số: thời điểm đồng bộ trước (NULL = lấy tất cả).
+        """
+        select_parts = []
+        from_parts = []
+
+        for key, (table_name, columns) in CONTEXT_TABLES.items():
+            pairs = [f"'{column.strip(chr(34))}', {column}" for column in columns]
+            if deltas:
+                pairs.append("'is_deleted', is_deleted")
+                where_clause = "%s::timestamp IS NULL OR last_updated >= %s"
+            else:
+                where_clause = "is_deleted = FALSE OR is_deleted IS NULL"
+
+            from_parts.append(
+                f"(SELECT coalesce(json_agg(json_build_object({', '.join(pairs)})), '[]'::json) AS rows, "
+                f"max(last_updated) AS last_sync FROM {table_name} WHERE {where_clause}) AS {key}"
+            )
+            select_parts.append(f"{key}.rows AS {key}, {key}.last_sync AS {key}_last_sync")
+
+        return f"SELECT {', '.join(select_parts)} FROM {', '.join(from_parts)}"
+
+    def _fetch_per_table(self, deltas: bool) -> Dict[str, Tuple[List[Dict[str, Any]], Any]]:
+        """Lấy các bảng context bằng một truy vấn cho mỗi bảng, chạy song song qua AsyncDatabaseManager"""
+        since = {key: self._delta_since(key) for key in CONTEXT_TABLES} if deltas else None
+        async_db = self.db_manager.get_async_manager()
+        return async_db.run(async_db.fetch_context_tables(since))
+
+    @staticmethod
+    def build_table_query(key: str, deltas: bool, since: Any = None) -> Tuple[str, List[Any]]:
+        """
+        Câu SQL lấy một bảng context (kèm last_updated), trả về (query, params)
+
+        Với deltas=True lấy cả dòng đã xóa mềm (kèm is_deleted), chỉ các dòng từ since nếu có.
+        """
+        table_name, columns = CONTEXT_TABLES[key]
+        if not deltas:
+            return (f"SELECT {', '.join(columns)}, last_updated FROM {table_name} "
+                    f"WHERE is_deleted = FALSE OR is_deleted IS NULL"), []
+        if since is None:
+            return f"SELECT {', '.join(columns)}, is_deleted, last_updated FROM {table_name}", []
+        return (f"SELECT {', '.join(columns)}, is_deleted, last_updated FROM {table_name} "
+                f"WHERE last_updated >= %s"), [since]
+
+    @staticmethod
+    def split_last_sync(fetched_rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Any]:
+        """Tách cột last_updated khỏi các dòng, trả về (dòng, last_updated lớn nhất)"""
+        rows = []
+        last_sync = None
+        for row in fetched_rows:
+            row = dict(row)
+            last_updated = row.pop('last_updated', None)
+            if last_updated is not None and (last_sync is None or last_updated > last_sync):
+                last_sync = last_updated
+            rows.append(row)
+        return rows, last_sync
+
+    def _delta_since(self, key: str) -> Any:
+        """Mốc lấy delta của một bảng: lần đồng bộ trước lùi lại CONTEXT_DELTA_OVERLAP giây (None = lấy tất cả)"""
+        since = self._last_sync.get(key)
+        if since is None:
+            return None
+        return since - timedelta(seconds=config.CONTEXT_DELTA_OVERLAP)
+
+    def _apply_delta(self, key: str, delta_rows: List[Dict[str, Any]], last_sync: Any) -> bool:
+        """Áp dụng các dòng thay đổi vào cache (gộp theo ID), trả về True nếu có thay đổi"""
+        rows = self._rows.setdefault(key, {})
+        upserted = []
+        deleted_ids = []
+        for row in delta_rows:
+            row = dict(row)
+            if row.pop('is_deleted', False):
+                if rows.pop(row['ID'], None) is not None:
+                    deleted_ids.append(row['ID'])
+            elif rows.get(row['ID']) != row:
+                # Dòng nằm trong khoảng lấy lùi lại và không đổi thì bỏ qua
+                rows[row['ID']] = row
+                upserted.append(row)
+
+        if last_sync is not None and (self._last_sync.get(key) is None
+                                      or last_sync > self._last_sync[key]):
+            self._last_sync[key] = last_sync
+
+        if upserted or deleted_ids:
+            self._notify(key, upserted, deleted_ids, False)
+            return True
+        return False
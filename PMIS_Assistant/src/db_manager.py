@@ -1,7 +1,12 @@
 import psycopg
+from psycopg import sql
 from psycopg.rows import dict_row
 from typing import Dict, List, Any, Optional, Tuple
+import json
+import base64
 import logging
+import time
+import threading
 from contextlib import contextmanager
 import sys
 import os
@@ -9,13 +14,34 @@ import os
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from src.context_cache import ContextCache, CONTEXT_TABLES
+from src.schema_catalog import schema_catalog
+from src.query_metrics import query_metrics, InstrumentedCursor
+from src.activity_logger import ActivityLogger
+from src.local_mirror import LocalMirror
+from src.unit_of_work import UnitOfWork
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
 
 logger = logging.getLogger(__name__)
 
+# Câu lệnh ghi log hoạt động AI (dùng chung cho registry prepared statement)
+LOG_AI_ACTIVITY_QUERY = """
+INSERT INTO gemini_automation_log (filename, ai_response, status, processed_at)
+VALUES (%s, %s, %s, NOW())
+RETURNING id
+"""
+
+# Điều kiện bỏ các dòng đã xóa mềm (chỉ dùng cho bảng có cột is_deleted)
+_NOT_DELETED = sql.SQL("(is_deleted = FALSE OR is_deleted IS NULL)")
+
 class DatabaseManager:
     """Quản lý kết nối và thao tác với cơ sở dữ liệu PostgreSQL"""
     
-    def __init__(self):
+    def __init__(self, use_pool: Optional[bool] = None):
         self.connection_params = {
             'host': config.DB_HOST,
             'port': config.DB_PORT,
@@ -24,30 +50,163 @@ class DatabaseManager:
             'password': config.DB_PASSWORD
         }
         self.connection = None
+        self.pool = None
+        # Connection chung (khi không dùng pool) chỉ phục vụ một thread tại một thời điểm,
+        # giữ suốt khối with để commit/rollback của thread này không lẫn với thread khác
+        self._connection_lock = threading.RLock()
+        
+        if use_pool is None:
+            use_pool = config.DB_POOL_ENABLED
+        
+        if use_pool:
+            if ConnectionPool is None:
+                logger.warning("psycopg_pool not installed, falling back to a single shared connection")
+            else:
+                self.pool = self._create_pool()
+        
+        # Cache context cho AI (làm mới tăng dần theo last_updated)
+        self.context_cache = ContextCache(self)
+        
+        # Catalog schema dùng chung cho toàn process
+        self.schema_catalog = schema_catalog
+        
+        # Thống kê truy vấn dùng chung cho toàn process
+        self.query_metrics = query_metrics
+        
+        # Registry các câu lệnh chạy thường xuyên: tên -> SQL, được prepare một lần trên mỗi connection
+        self.statements = {}
+        self.register_statement('log_ai_activity', LOG_AI_ACTIVITY_QUERY)
+        self.register_statement('schema_fingerprint', self.schema_catalog.FINGERPRINT_QUERY)
+        self.register_statement('schema_load', self.schema_catalog.LOAD_QUERY)
+        self.register_statement('context_full', ContextCache.build_single_query(deltas=False))
+        self.register_statement('context_delta', ContextCache.build_single_query(deltas=True))
+        
+        # Bản bất đồng bộ (tạo khi cần lần đầu) để chạy song song các truy vấn độc lập
+        self._async_manager = None
+        self._async_lock = threading.Lock()
+        
+        # Ghi log AI ở background (write-behind, có spool trên đĩa)
+        self.activity_logger = ActivityLogger(self) if config.AI_LOG_WRITE_BEHIND else None
+        
+        # Bản sao SQLite cục bộ của các bảng tham chiếu (đọc nhanh, dùng được khi offline)
+        self.local_mirror = None
+        if config.MIRROR_ENABLED:
+            try:
+                self.local_mirror = LocalMirror(self)
+                self.local_mirror.start()
+            except Exception as e:
+                logger.error(f"Error opening local mirror, reading from database only: {e}")
+    
+    def _create_pool(self):
+        """Tạo connection pool với kiểm tra sức khỏe khi lấy connection và tự đóng connection rảnh"""
+        pool = ConnectionPool(
+            kwargs=self.connection_params,
+            min_size=config.DB_POOL_MIN_SIZE,
+            max_size=max(config.DB_POOL_MAX_SIZE, config.DB_POOL_MIN_SIZE),
+            timeout=config.DB_POOL_TIMEOUT,
+            max_idle=config.DB_POOL_MAX_IDLE,
+            reconnect_timeout=config.DB_POOL_RECONNECT_TIMEOUT,
+            check=ConnectionPool.check_connection,
+            name="pmis",
+            open=False
+        )
+        # Không chờ kết nối sẵn sàng: pool tự kết nối lại ở background khi mạng chập chờn
+        pool.open(wait=False)
+        logger.info(
+            f"Database pool opened (min={config.DB_POOL_MIN_SIZE}, max={config.DB_POOL_MAX_SIZE})"
+        )
+        return pool
+    
+    @contextmanager
+    def get_connection(self):
+        """
+        Context manager để lấy connection (từ pool nếu bật, ngược lại dùng connection chung)
+        
+        Connection chung được khóa trong suốt khối with: các thread nền (ghi log AI, mirror,
+        pipeline, chỉ mục thực thể) chờ nhau thay vì chạy xen transaction trên cùng connection.
+        """
+        started = time.perf_counter()
+        if self.pool is not None:
+            with self.pool.connection() as connection:
+                self.query_metrics.record_acquire((time.perf_counter() - started) * 1000)
+                yield connection
+        else:
+            with self._connection_lock:
+                if self.connection is None or self.connection.closed:
+                    self.connection = psycopg.connect(**self.connection_params)
+                self.query_metrics.record_acquire((time.perf_counter() - started) * 1000)
+                yield self.connection
     
     @contextmanager
     def get_cursor(self, dictionary=True):
         """Context manager để lấy cursor từ connection"""
-        cursor = None
-        try:
-            if self.connection is None or self.connection.closed:
-                self.connection = psycopg.connect(**self.connection_params)
-                
-            if dictionary:
-                cursor = self.connection.cursor(row_factory=dict_row)
-            else:
-                cursor = self.connection.cursor()
-                
-            yield cursor
-            self.connection.commit()
-        except Exception as e:
-            if self.connection:
-                self.connection.rollback()
-            logger.error(f"Database error: {e}")
-            raise
-        finally:
-            if cursor:
-                cursor.close()
+        with self.get_connection() as connection:
+            cursor = None
+            try:
+                row_factory = dict_row if dictionary else connection.row_factory
+                cursor = InstrumentedCursor(connection, row_factory=row_factory)
+                    
+                yield cursor
+                connection.commit()
+            except Exception as e:
+                if not connection.closed:
+                    connection.rollback()
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                if cursor:
+                    cursor.close()
+    
+    def register_statement(self, name: str, query: str):
+        """Đăng ký một câu lệnh vào registry prepared statement"""
+        self.statements[name] = query
+    
+    def execute_prepared(self, cursor, name: str, params: Optional[List[Any]] = None,
+                         prepare: Optional[bool] = None):
+        """
+        Thực thi câu lệnh đã đăng ký trong registry
+        
+        Với prepare=True, psycopg prepare câu lệnh ở server lần đầu nó chạy trên một connection
+        và các lần sau chỉ gửi tham số (bỏ qua parse/plan). prepare=False chạy như truy vấn thường.
+        """
+        if prepare is None:
+            prepare = config.DB_PREPARED_STATEMENTS
+        cursor.execute(self.statements[name], params or None, prepare=prepare)
+    
+    def benchmark_statement(self, name: str, params: Optional[List[Any]] = None,
+                            iterations: int = 100) -> Dict[str, float]:
+        """
+        So sánh thời gian trung bình (ms) giữa chạy prepared và chạy ad-hoc một câu lệnh đã đăng ký
+        
+        Mọi thay đổi dữ liệu trong lúc đo đều được rollback. Câu lệnh ghi được chạy mỗi lần
+        trong một savepoint rollback ngay, nên các lần chạy lặp với cùng tham số không vi phạm
+        ràng buộc UNIQUE (thời gian đo được gồm cả chi phí savepoint ở cả hai chế độ).
+        """
+        read_only = self.statements[name].lstrip().upper().startswith("SELECT")
+        timings = {}
+        with self.get_cursor(dictionary=False) as cursor:
+            connection = cursor.connection
+            
+            def run(prepare: bool):
+                if read_only:
+                    self.execute_prepared(cursor, name, params, prepare=prepare)
+                else:
+                    with connection.transaction(force_rollback=True):
+                        self.execute_prepared(cursor, name, params, prepare=prepare)
+            
+            with connection.transaction(force_rollback=True):
+                for mode, prepare in (('adhoc_ms', False), ('prepared_ms', True)):
+                    # Lần chạy đầu để prepare (và làm nóng cache) không tính vào kết quả
+                    run(prepare)
+                    started = time.perf_counter()
+                    for _ in range(iterations):
+                        run(prepare)
+                    timings[mode] = (time.perf_counter() - started) * 1000 / iterations
+        
+        logger.info(
+            f"Statement {name}: ad-hoc {timings['adhoc_ms']:.3f} ms, prepared {timings['prepared_ms']:.3f} ms"
+        )
+        return timings
     
     def test_connection(self) -> bool:
         """Kiểm tra kết nối đến cơ sở dữ liệu"""
@@ -60,67 +219,109 @@ class DatabaseManager:
             return False
     
     def get_table_schema(self, table_name: str) -> List[Dict[str, Any]]:
-        """Lấy schema của một bảng cụ thể"""
-        query = """
-        SELECT 
-            column_name, 
-            data_type, 
-            is_nullable,
-            column_default,
-            character_maximum_length
-        FROM information_schema.columns 
-        WHERE table_schema = 'public' AND table_name = %s
-        ORDER BY ordinal_position
-        """
-        
-        try:
-            with self.get_cursor() as cursor:
-                cursor.execute(query, (table_name,))
-                return [dict(row) for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting schema for table {table_name}: {e}")
-            return []
+        """Lấy schema của một bảng cụ thể (từ catalog schema trong bộ nhớ)"""
+        return self.schema_catalog.get_columns(self, table_name)
     
-    def get_main_tables_info(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Lấy thông tin từ các bảng chính để làm context cho AI"""
-        result = {}
-        
-        # Lấy thông tin từ bảng DuAn
-        result['projects'] = self.get_table_data('"DuAn"', ['"ID"', '"MaDuAn"', '"TenDuAn"'])
-        
-        # Lấy thông tin từ bảng PhongBan
-        result['departments'] = self.get_table_data('"PhongBan"', ['"ID"', '"MaPhongBan"', '"TenPhongBan"'])
-        
-        # Lấy thông tin từ bảng CongViec
-        result['tasks'] = self.get_table_data('"CongViec"', ['"ID"', '"TenCongViec"', '"DuAn_ID"'])
-        
-        # Lấy thông tin từ bảng VanDe
-        result['issues'] = self.get_table_data('"VanDe"', ['"ID"', '"MoTaVanDe"', '"DuAn_ID"'])
+    def invalidate_schema_cache(self):
+        """Buộc tải lại catalog schema (gọi sau khi thay đổi DDL)"""
+        self.schema_catalog.invalidate()
+    
+    def get_main_tables_info(self, use_cache: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+        """Lấy thông tin từ các bảng chính để làm context cho AI (mirror cục bộ khi mất kết nối)"""
+        if use_cache:
+            try:
+                return self.context_cache.get()
+            except psycopg.OperationalError as e:
+                context = self.local_mirror.get_context() if self.local_mirror is not None else None
+                if context is None:
+                    logger.error(f"Error loading AI context: {e}")
+                    return {key: [] for key in CONTEXT_TABLES}
+                logger.warning("Database unreachable, using AI context from the local mirror")
+                return context
         
-        # Lấy thông tin từ bảng TienTrinhXuLy
-        result['progress'] = self.get_table_data('"TienTrinhXuLy"', ['"ID"', '"CongViec_ID"', '"TinhTrangThucHien"'])
+        result = {}
+        for key, (table_name, columns) in CONTEXT_TABLES.items():
+            result[key] = self.get_table_data(table_name, columns)
         
         return result
     
-    def get_table_data(self, table_name: str, columns: List[str] = None) -> List[Dict[str, Any]]:
-        """Lấy dữ liệu từ một bảng cụ thể"""
-        if columns is None:
-            # Lấy tất cả các cột trừ các cột hệ thống
-            schema = self.get_table_schema(table_name)
-            columns = [col['column_name'] for col in schema 
-                      if col['column_name'] not in ['is_deleted', 'last_updated']]
-        
-        columns_str = ', '.join(columns)
-        query = f"SELECT {columns_str} FROM {table_name} WHERE is_deleted = FALSE OR is_deleted IS NULL"
-        
+    def get_async_manager(self):
+        """AsyncDatabaseManager dùng chung cấu hình với manager này (event loop và pool riêng)"""
+        with self._async_lock:
+            if self._async_manager is None:
+                from src.async_db_manager import AsyncDatabaseManager
+                self._async_manager = AsyncDatabaseManager(use_pool=self.pool is not None)
+            return self._async_manager
+    
+    def invalidate_context_cache(self):
+        """Buộc tải lại context AI ở lần gọi get_main_tables_info tiếp theo"""
+        self.context_cache.invalidate()
+    
+    def get_table_data(self, table_name: str, columns: List[str] = None,
+                       order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Lấy dữ liệu từ một bảng cụ thể (có thể kèm ORDER BY và LIMIT), đọc mirror cục bộ khi mất kết nối"""
         try:
+            query = self._build_table_query(table_name, columns, order_by, limit)
             with self.get_cursor() as cursor:
                 cursor.execute(query)
-                return [dict(row) for row in cursor.fetchall()]
+                # dict_row đã trả về dict, không cần sao chép lại từng dòng
+                return cursor.fetchall()
+        except psycopg.OperationalError as e:
+            if self.local_mirror is not None and self.local_mirror.has_table(table_name):
+                rows = self.local_mirror.get_table_data(table_name, columns, order_by, limit)
+                if rows is not None:
+                    logger.warning(f"Database unreachable, reading {table_name} from the local mirror")
+                    return rows
+            logger.error(f"Error getting data from table {table_name}: {e}")
+            return []
         except Exception as e:
             logger.error(f"Error getting data from table {table_name}: {e}")
             return []
     
+    def _build_table_query(self, table_name: str, columns: List[str] = None,
+                           order_by: Optional[str] = None, limit: Optional[int] = None) -> sql.Composed:
+        """Xây dựng câu SELECT các dòng chưa bị xóa của một bảng"""
+        query = sql.SQL("SELECT {} FROM {}").format(
+            self._select_list(self._resolve_columns(table_name, columns)),
+            sql.Identifier(self.schema_catalog.normalize_name(table_name))
+        )
+        if self._has_soft_delete(table_name):
+            query += sql.SQL(" WHERE ") + _NOT_DELETED
+        return query + sql.SQL(self._build_order_limit(order_by, limit))
+    
+    def _has_soft_delete(self, table_name: str) -> bool:
+        """Bảng có cột is_deleted không (các bảng hệ thống như tbl_documents thì không)"""
+        return any(col['column_name'] == 'is_deleted' for col in self.get_table_schema(table_name))
+    
+    @staticmethod
+    def _find_id_column(table_columns: List[str]) -> Optional[str]:
+        """Cột ID của bảng: bảng nghiệp vụ dùng "ID", các bảng hệ thống dùng id"""
+        return next((col for col in table_columns if col.lower() == 'id'), None)
+    
+    def _resolve_columns(self, table_name: str, columns: List[str] = None) -> List[str]:
+        """Trả về tên các cột cần lấy, bỏ dấu ngoặc kép (mặc định tất cả cột trừ các cột hệ thống)"""
+        if columns is not None:
+            return [column.strip().strip('"') for column in columns]
+        
+        schema = self.get_table_schema(table_name)
+        return [col['column_name'] for col in schema 
+                if col['column_name'] not in ['is_deleted', 'last_updated']]
+    
+    @staticmethod
+    def _select_list(columns: List[str]) -> sql.Composed:
+        """Danh sách cột của câu SELECT, mỗi cột là một identifier (giữ đúng chữ hoa/thường)"""
+        return sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+    
+    @staticmethod
+    def _build_order_limit(order_by: Optional[str] = None, limit: Optional[int] = None) -> str:
+        """Xây dựng phần ORDER BY / LIMIT của câu query"""
+        clause = ""
+        if order_by:
+            clause += f" ORDER BY {order_by}"
+        if limit is not None:
+            clause += f" LIMIT {int(limit)}"
+        return clause
+    
     def get_all_tables(self) -> List[str]:
         """Lấy danh sách tất cả các bảng trong database"""
         query = """
@@ -140,27 +341,25 @@ class DatabaseManager:
     
     def get_table_columns(self, table_name: str) -> List[Dict[str, Any]]:
         """Lấy danh sách các cột của một bảng"""
-        query = """
-        SELECT 
-            column_name, 
-            data_type, 
-            is_nullable,
-            character_maximum_length
-        FROM information_schema.columns 
-        WHERE table_schema = 'public' AND table_name = %s
-        ORDER BY ordinal_position
+        columns = self.schema_catalog.get_columns(self, table_name)
+        for column in columns:
+            column.pop('column_default', None)
+        return columns
+    
+    def insert_document(self, table_name: str, data: Dict[str, Any]) -> Optional[int]:
         """
+        Chèn dữ liệu vào bảng cụ thể và trả về ID của bản ghi mới
         
-        try:
-            with self.get_cursor() as cursor:
-                cursor.execute(query, (table_name,))
-                return [dict(row) for row in cursor.fetchall()]
-        except Exception as e:
-            logger.error(f"Error getting columns for table {table_name}: {e}")
-            return []
+        Lệnh chèn chạy như một unit of work một lệnh (có khóa chống ghi trùng), nên khi bật mirror
+        cục bộ và không kết nối được database (kể cả khi catalog schema chưa tải được), nó được
+        xếp hàng để gửi lại sau mà không bị ghi hai lần; khi đó hàm trả về None.
+        """
+        with self.unit_of_work() as uow:
+            uow.insert(table_name, data)
+        return uow.results[0]
     
-    def insert_document(self, table_name: str, data: Dict[str, Any]) -> int:
-        """Chèn dữ liệu vào bảng cụ thể và trả về ID của bản ghi mới"""
+    def build_insert(self, table_name: str, data: Dict[str, Any]) -> Tuple[sql.Composed, List[Any]]:
+        """Tạo câu INSERT ... RETURNING <cột id> cho các cột có trong bảng (theo catalog schema)"""
         # Lọc ra các cột có trong bảng
         table_columns = [col['column_name'] for col in self.get_table_columns(table_name)]
         filtered_data = {k: v for k, v in data.items() if k in table_columns}
@@ -168,73 +367,464 @@ class DatabaseManager:
         if not filtered_data:
             raise ValueError(f"No valid columns found for table {table_name}")
         
-        columns = list(filtered_data.keys())
-        placeholders = ', '.join(['%s'] * len(columns))
-        values = list(filtered_data.values())
+        id_column = self._find_id_column(table_columns) or 'id'
+        query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) RETURNING {}").format(
+            sql.Identifier(self.schema_catalog.normalize_name(table_name)),
+            sql.SQL(', ').join(sql.Identifier(col) for col in filtered_data),
+            sql.SQL(', ').join(sql.Placeholder() * len(filtered_data)),
+            sql.Identifier(id_column)
+        )
+        return query, list(filtered_data.values())
+    
+    def unit_of_work(self, key: Optional[str] = None) -> UnitOfWork:
+        """
+        Tạo unit of work để gom nhiều lệnh ghi vào một transaction và một round-trip
         
-        query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING ID"
+        Sử dụng:
+            with db_manager.unit_of_work() as uow:
+                doc = uow.insert('tbl_documents', document_data)
+                uow.insert('VanBanPhapLy', van_ban_data)
+            doc_id = uow.results[doc]
         
-        try:
-            with self.get_cursor() as cursor:
-                cursor.execute(query, values)
-                result = cursor.fetchone()
-                return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error inserting into table {table_name}: {e}")
-            raise
+        key là khóa chống ghi trùng khi gửi lại (mặc định tạo mới).
+        """
+        return UnitOfWork(self, key)
     
     def insert_into_documents_table(self, document_data: Dict[str, Any]) -> int:
         """Chèn dữ liệu vào bảng tbl_documents"""
         table_name = 'tbl_documents'
         return self.insert_document(table_name, document_data)
     
-    def log_ai_activity(self, filename: str, ai_response: str, status: str) -> int:
-        """Ghi log hoạt động của AI vào bảng gemini_automation_log"""
-        query = """
-        INSERT INTO gemini_automation_log (filename, ai_response, status, processed_at)
-        VALUES (%s, %s, %s, NOW())
-        RETURNING id
+    def insert_documents_bulk(self, rows: List[Dict[str, Any]], table_name: str = 'tbl_documents') -> Dict[str, Any]:
         """
+        Chèn nhiều bản ghi bằng COPY và trả về ID theo đúng thứ tự đầu vào
+        
+        ID được cấp trước từ sequence của bảng nên COPY vẫn trả được ID. Nếu COPY của một
+        nhóm thất bại, nhóm đó được chèn lại từng dòng để báo lỗi cho đúng dòng;
+        các dòng hợp lệ vẫn được lưu.
+        
+        Args:
+            rows: Danh sách dict dữ liệu (cùng định dạng với insert_into_documents_table)
+            table_name: Bảng đích (mặc định tbl_documents)
+            
+        Returns:
+            Dict gồm:
+            - ids: danh sách ID theo thứ tự của rows (None nếu dòng lỗi)
+            - errors: danh sách {"index": vị trí dòng, "error": thông báo lỗi}
+        """
+        ids = [None] * len(rows)
+        errors = []
+        if not rows:
+            return {"ids": ids, "errors": errors}
+        
+        bare_table = self.schema_catalog.normalize_name(table_name)
+        table_columns = [col['column_name'] for col in self.get_table_columns(bare_table)]
+        id_column = self._find_id_column(table_columns)
+        if id_column is None:
+            raise ValueError(f"No ID column found for table {table_name}")
+        
+        # Gom các dòng theo tập cột để cột không có giá trị vẫn nhận DEFAULT của bảng
+        groups = {}
+        for index, row in enumerate(rows):
+            filtered_data = {k: v for k, v in row.items() if k in table_columns and k != id_column}
+            if not filtered_data:
+                errors.append({"index": index, "error": f"No valid columns found for table {table_name}"})
+                continue
+            groups.setdefault(tuple(filtered_data.keys()), []).append((index, list(filtered_data.values())))
+        
+        for columns, items in groups.items():
+            try:
+                group_ids = self._copy_rows(bare_table, id_column, columns, [values for _, values in items])
+                for (index, _), new_id in zip(items, group_ids):
+                    ids[index] = new_id
+            except Exception as e:
+                logger.warning(f"COPY into {bare_table} failed, retrying row by row: {e}")
+                self._insert_rows_individually(bare_table, id_column, columns, items, ids, errors)
+        
+        errors.sort(key=lambda error: error["index"])
+        logger.info(f"Bulk inserted {len(rows) - len(errors)}/{len(rows)} rows into {bare_table}")
+        return {"ids": ids, "errors": errors}
+    
+    def _copy_rows(self, table_name: str, id_column: str, columns: Tuple[str, ...],
+                   values_list: List[List[Any]]) -> List[int]:
+        """COPY một nhóm dòng cùng tập cột, với ID cấp trước từ sequence"""
+        copy_query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(sql.Identifier(col) for col in (id_column, *columns))
+        )
+        
+        with self.get_cursor(dictionary=False) as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                (sql.Identifier(table_name).as_string(cursor), id_column, len(values_list))
+            )
+            new_ids = [row[0] for row in cursor.fetchall()]
+            
+            with cursor.copy(copy_query) as copy:
+                for new_id, values in zip(new_ids, values_list):
+                    copy.write_row([new_id, *values])
+        
+        return new_ids
+    
+    def _insert_rows_individually(self, table_name: str, id_column: str, columns: Tuple[str, ...],
+                                  items: List[Tuple[int, List[Any]]], ids: List[Optional[int]],
+                                  errors: List[Dict[str, Any]]):
+        """Chèn lại từng dòng, mỗi dòng một transaction riêng để ghi nhận lỗi cho đúng dòng"""
+        insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({}) RETURNING {}").format(
+            sql.Identifier(table_name),
+            sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+            sql.SQL(', ').join(sql.Placeholder() * len(columns)),
+            sql.Identifier(id_column)
+        )
         
         try:
-            with self.get_cursor() as cursor:
-                cursor.execute(query, (filename, ai_response, status))
+            with self.get_cursor(dictionary=False) as cursor:
+                for index, values in items:
+                    try:
+                        with cursor.connection.transaction():
+                            cursor.execute(insert_query, values)
+                            ids[index] = cursor.fetchone()[0]
+                    except psycopg.Error as e:
+                        errors.append({"index": index, "error": str(e)})
+        except Exception as e:
+            # Lỗi kết nối: các dòng chưa được chèn cũng bị đánh dấu lỗi
+            reported = {error["index"] for error in errors}
+            for index, _ in items:
+                if ids[index] is None and index not in reported:
+                    errors.append({"index": index, "error": str(e)})
+    
+    def log_ai_activity(self, filename: str, ai_response: str, status: str) -> int:
+        """Ghi log hoạt động của AI vào bảng gemini_automation_log"""
+        try:
+            with self.get_cursor(dictionary=False) as cursor:
+                self.execute_prepared(cursor, 'log_ai_activity', [filename, ai_response, status])
                 result = cursor.fetchone()
                 return result[0] if result else None
         except Exception as e:
             logger.error(f"Error logging AI activity: {e}")
             raise
     
-    def search_data(self, table_name: str, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Tìm kiếm dữ liệu trong bảng với các bộ lọc"""
-        if not filters:
-            return self.get_table_data(table_name)
+    def queue_ai_activity(self, filename: str, ai_response: Any, status: str):
+        """
+        Ghi log hoạt động AI mà không chờ database (ai_response có thể là dict)
+        
+        Bản ghi được chèn theo lô ở background; nếu tắt AI_LOG_WRITE_BEHIND thì ghi đồng bộ.
+        """
+        if self.activity_logger is None:
+            if not isinstance(ai_response, str):
+                ai_response = json.dumps(ai_response, ensure_ascii=False)
+            self.log_ai_activity(filename, ai_response, status)
+        else:
+            self.activity_logger.enqueue(filename, ai_response, status)
+    
+    def search_data(self, table_name: str, filters: Dict[str, Any],
+                    order_by: Optional[str] = None, limit: Optional[int] = None,
+                    mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm dữ liệu trong bảng với các bộ lọc (có thể kèm ORDER BY và LIMIT)
+        
+        Args:
+            table_name: Tên bảng
+            filters: Bộ lọc {cột: giá trị}
+            order_by: Biểu thức ORDER BY (chế độ trigram mặc định xếp theo độ tương đồng)
+            limit: Số dòng tối đa (chế độ trigram mặc định SEARCH_LIMIT)
+            mode: "ilike" hoặc "trigram" (mặc định SEARCH_MODE); chế độ trigram dùng
+                  GIN index pg_trgm, chấp nhận lỗi chính tả nhẹ và trả thêm cột search_rank
+        """
+        mode = mode or config.SEARCH_MODE
+        if mode == "trigram":
+            query, values = self._build_trigram_search_query(table_name, filters, order_by, limit)
+        elif mode == "ilike":
+            query, values = self._build_search_query(table_name, filters, order_by, limit)
+        else:
+            raise ValueError(f"Invalid search mode: {mode}")
+        
+        if query is None:
+            return self.get_table_data(table_name, order_by=order_by, limit=limit)
+        
+        try:
+            with self.get_cursor() as cursor:
+                cursor.execute(query, values)
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error searching in table {table_name}: {e}")
+            return []
+    
+    def _build_search_query(self, table_name: str, filters: Dict[str, Any],
+                            order_by: Optional[str] = None,
+                            limit: Optional[int] = None) -> Tuple[Optional[sql.Composed], List[Any]]:
+        """Xây dựng câu query tìm kiếm ILIKE, trả về (None, []) nếu không có bộ lọc"""
+        where_conditions, values = self._build_filter_conditions(filters)
+        if not where_conditions:
+            return None, []
         
-        # Xây dựng câu query động
+        query = sql.SQL("SELECT * FROM {} WHERE {}").format(
+            sql.Identifier(self.schema_catalog.normalize_name(table_name)),
+            sql.SQL(' AND ').join(where_conditions)
+        )
+        return query + sql.SQL(self._build_order_limit(order_by, limit)), values
+    
+    @staticmethod
+    def _build_filter_conditions(filters: Dict[str, Any]) -> Tuple[List[sql.Composed], List[Any]]:
+        """Xây dựng các điều kiện ILIKE từ bộ lọc {cột: giá trị} (tên cột là identifier)"""
         where_conditions = []
         values = []
         
-        for column, value in filters.items():
+        for column, value in (filters or {}).items():
             if value and value.strip():
-                where_conditions.append(f"{column} ILIKE %s")
+                where_conditions.append(sql.SQL("{} ILIKE %s").format(sql.Identifier(column.strip().strip('"'))))
                 values.append(f"%{value.strip()}%")
         
+        return where_conditions, values
+    
+    def _build_trigram_search_query(self, table_name: str, filters: Dict[str, Any],
+                                    order_by: Optional[str] = None,
+                                    limit: Optional[int] = None) -> Tuple[Optional[sql.Composed], List[Any]]:
+        """Xây dựng câu query tìm kiếm pg_trgm có xếp hạng, trả về (None, []) nếu không có bộ lọc"""
+        where_conditions = []
+        rank_terms = []
+        where_values = []
+        rank_values = []
+        
+        for column, value in (filters or {}).items():
+            if value and value.strip():
+                value = value.strip()
+                column = sql.Identifier(column.strip().strip('"'))
+                # ILIKE và <% (word similarity) đều dùng được GIN index gin_trgm_ops
+                where_conditions.append(sql.SQL("({column} ILIKE %s OR %s <%% {column})").format(column=column))
+                where_values.extend([f"%{value}%", value])
+                rank_terms.append(sql.SQL("word_similarity(%s, {})").format(column))
+                rank_values.append(value)
+        
         if not where_conditions:
-            return self.get_table_data(table_name)
+            return None, []
+        
+        rank_expr = (rank_terms[0] if len(rank_terms) == 1
+                     else sql.SQL("GREATEST({})").format(sql.SQL(', ').join(rank_terms)))
+        query = sql.SQL("SELECT *, {} AS search_rank FROM {} WHERE {}").format(
+            rank_expr,
+            sql.Identifier(self.schema_catalog.normalize_name(table_name)),
+            sql.SQL(' AND ').join(where_conditions)
+        )
         
-        where_clause = " AND ".join(where_conditions)
-        query = f"SELECT * FROM {table_name} WHERE {where_clause}"
+        order_by = order_by or "search_rank DESC"
+        limit = config.SEARCH_LIMIT if limit is None else limit
+        return query + sql.SQL(self._build_order_limit(order_by, limit)), rank_values + where_values
+    
+    def search_documents(self, query: str, filters: Optional[Dict[str, Any]] = None,
+                         limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Tìm kiếm toàn văn trong tbl_documents, xếp hạng theo độ liên quan
+        
+        Cần chạy create_document_search() trong database_setup.py để tạo cột search_vector
+        và cấu hình pmis_unaccent. Truy vấn được bỏ dấu nên "quyet dinh" khớp với "Quyết định".
+        Hiện chỉ dùng qua API (giao diện chưa có ô tìm kiếm tài liệu).
+        
+        Args:
+            query: Chuỗi tìm kiếm (cú pháp websearch: "cụm từ", OR, -loại trừ)
+            filters: Bộ lọc tùy chọn: doc_type, project_name, sender (bằng),
+                     date_from, date_to (khoảng doc_date), keywords (danh sách, giao nhau)
+            limit: Số kết quả tối đa (mặc định SEARCH_LIMIT)
+            
+        Returns:
+            Danh sách dict gồm id, file_name, doc_type, doc_date, project_name, sender,
+            file_path_original, rank và snippet (ts_headline trên summary, hoặc 5000 ký tự
+            đầu của raw_content khi summary rỗng; từ gốc khớp, kể cả khi truy vấn không dấu,
+            được đánh dấu <b>...</b>)
+        """
+        if not query or not query.strip():
+            return []
+        
+        filter_columns = {
+            'doc_type': "doc_type = %s",
+            'project_name': "project_name = %s",
+            'sender': "sender = %s",
+            'date_from': "doc_date >= %s",
+            'date_to': "doc_date <= %s",
+            'keywords': "keywords && %s",
+        }
+        
+        where_conditions = ["search_vector @@ websearch_to_tsquery('simple', public.immutable_unaccent(%s))"]
+        values = [query.strip()]
+        
+        for key, value in (filters or {}).items():
+            if key not in filter_columns:
+                raise ValueError(f"Unsupported document search filter: {key}")
+            if value is None or value == "" or value == []:
+                continue
+            where_conditions.append(filter_columns[key])
+            values.append(list(value) if key == 'keywords' else value)
+        
+        limit = config.SEARCH_LIMIT if limit is None else limit
+        
+        # Xếp hạng và LIMIT trước, chỉ tạo snippet (tốn kém) cho các kết quả được trả về.
+        # Snippet dùng cấu hình pmis_unaccent: cả văn bản gốc lẫn truy vấn đều được bỏ dấu khi so khớp
+        # nhưng từ được đánh dấu vẫn là từ gốc có dấu, nên truy vấn không dấu cũng có highlight.
+        sql_query = f"""
+        SELECT
+            hits.id, hits.file_name, hits.doc_type, hits.doc_date, hits.project_name,
+            hits.sender, hits.file_path_original, hits.rank,
+            ts_headline(
+                'public.pmis_unaccent',
+                coalesce(NULLIF(hits.summary, ''), left(hits.raw_content, 5000), ''),
+                websearch_to_tsquery('public.pmis_unaccent', %s),
+                'MaxWords=35, MinWords=15, MaxFragments=2'
+            ) AS snippet
+        FROM (
+            SELECT
+                id, file_name, doc_type, doc_date, project_name, sender, file_path_original,
+                summary, raw_content,
+                ts_rank_cd(search_vector, websearch_to_tsquery('simple', public.immutable_unaccent(%s))) AS rank
+            FROM tbl_documents
+            WHERE {' AND '.join(where_conditions)}
+            ORDER BY rank DESC, id DESC
+            LIMIT {int(limit)}
+        ) AS hits
+        ORDER BY hits.rank DESC, hits.id DESC
+        """
+        params = [query.strip(), query.strip()] + values
         
         try:
             with self.get_cursor() as cursor:
-                cursor.execute(query, values)
-                return [dict(row) for row in cursor.fetchall()]
+                cursor.execute(sql_query, params)
+                return cursor.fetchall()
         except Exception as e:
-            logger.error(f"Error searching in table {table_name}: {e}")
+            logger.error(f"Error searching documents: {e}")
             return []
     
+    def get_table_page(self, table_name: str, columns: List[str] = None,
+                       page_size: Optional[int] = None, direction: str = "next",
+                       cursor: Optional[str] = None, filters: Optional[Dict[str, Any]] = None,
+                       key_column: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Lấy một trang dữ liệu bằng keyset pagination trên cột khóa (mặc định cột ID của bảng)
+        
+        Chi phí mỗi trang không phụ thuộc vào vị trí trang vì truy vấn dùng điều kiện
+        khóa > / < giá trị khóa thay vì OFFSET.
+        
+        Args:
+            table_name: Tên bảng
+            columns: Danh sách cột (None = tất cả cột trừ cột hệ thống); cột khóa được thêm nếu thiếu
+            page_size: Số dòng mỗi trang (mặc định DB_PAGE_SIZE)
+            direction: "next" (trang sau cursor) hoặc "prev" (trang trước cursor)
+            cursor: Token trang lấy từ next_cursor/prev_cursor của trang trước, None = trang đầu
+            filters: Bộ lọc ILIKE {cột: giá trị} như search_data
+            key_column: Cột khóa duy nhất, tăng dần (mặc định "ID" hoặc id theo catalog schema)
+            
+        Returns:
+            Dict gồm rows, next_cursor, prev_cursor (None nếu không còn trang) và page_size
+            
+        Raises:
+            ValueError: Bảng không có cột khóa hoặc tham số không hợp lệ
+            psycopg.Error: Lỗi truy vấn (đã ghi log)
+        """
+        if direction not in ("next", "prev"):
+            raise ValueError(f"Invalid page direction: {direction}")
+        
+        page_size = page_size or config.DB_PAGE_SIZE
+        if key_column is not None:
+            key_name = key_column.strip().strip('"')
+        else:
+            key_name = self._find_id_column([col['column_name'] for col in self.get_table_schema(table_name)])
+            if key_name is None:
+                raise ValueError(f"No ID column found for table {table_name}")
+        key = sql.Identifier(key_name)
+        
+        select_columns = self._resolve_columns(table_name, columns)
+        if key_name not in select_columns:
+            select_columns.append(key_name)
+        
+        where_conditions, values = self._build_filter_conditions(filters)
+        if self._has_soft_delete(table_name):
+            where_conditions.insert(0, _NOT_DELETED)
+        
+        if cursor is not None:
+            operator = ">" if direction == "next" else "<"
+            where_conditions.append(sql.SQL("{} {} %s").format(key, sql.SQL(operator)))
+            values.append(self._decode_page_cursor(cursor))
+        
+        sort_order = "ASC" if direction == "next" else "DESC"
+        query = sql.SQL("SELECT {} FROM {}").format(
+            self._select_list(select_columns),
+            sql.Identifier(self.schema_catalog.normalize_name(table_name))
+        )
+        if where_conditions:
+            query += sql.SQL(" WHERE ") + sql.SQL(' AND ').join(where_conditions)
+        # Lấy thêm một dòng để biết còn trang tiếp theo hay không
+        query += sql.SQL(" ORDER BY {} {} LIMIT {}").format(key, sql.SQL(sort_order), sql.Literal(page_size + 1))
+        
+        try:
+            with self.get_cursor() as db_cursor:
+                db_cursor.execute(query, values)
+                rows = db_cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error getting page from table {table_name}: {e}")
+            raise
+        
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == "prev":
+            rows.reverse()
+        
+        first_key = rows[0][key_name] if rows else None
+        last_key = rows[-1][key_name] if rows else None
+        
+        if direction == "next":
+            next_key = last_key if has_more else None
+            prev_key = first_key if cursor is not None else None
+        else:
+            next_key = last_key
+            prev_key = first_key if has_more else None
+        
+        return {
+            "rows": rows,
+            "next_cursor": self._encode_page_cursor(next_key) if next_key is not None else None,
+            "prev_cursor": self._encode_page_cursor(prev_key) if prev_key is not None else None,
+            "page_size": page_size
+        }
+    
+    @staticmethod
+    def _encode_page_cursor(key_value: Any) -> str:
+        """Mã hóa giá trị khóa thành token trang"""
+        payload = json.dumps({"k": key_value}, default=str).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+    
+    @staticmethod
+    def _decode_page_cursor(token: str) -> Any:
+        """Giải mã token trang thành giá trị khóa"""
+        try:
+            return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))["k"]
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid page cursor: {token}") from e
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Lấy thống kê của connection pool (rỗng nếu không dùng pool)"""
+        if self.pool is None:
+            return {}
+        return self.pool.get_stats()
+    
+    def get_query_stats(self) -> Dict[str, Any]:
+        """Lấy thống kê truy vấn: histogram độ trễ, số dòng, số byte và các truy vấn chậm"""
+        return self.query_metrics.snapshot()
+    
+    def reset_query_stats(self):
+        """Xóa thống kê truy vấn"""
+        self.query_metrics.reset()
+    
     def close(self):
         """Đóng kết nối đến database"""
+        if self.local_mirror is not None:
+            self.local_mirror.stop()
+        # Flush log AI còn trong hàng đợi trước khi đóng pool
+        if self.activity_logger is not None:
+            self.activity_logger.stop()
+        if self._async_manager is not None:
+            self._async_manager.stop()
+        # Dừng thread ghi file metrics và ghi thống kê lần cuối (nếu có cấu hình DB_METRICS_FILE)
+        self.query_metrics.stop()
+        if self.pool is not None and not self.pool.closed:
+            self.pool.close()
+            logger.info("Database pool closed")
         if self.connection and not self.connection.closed:
             self.connection.close()
             logger.info("Database connection closed")
\ No newline at end of file
@@ -0,0 +1,307 @@
+import json
+import zlib
+import queue
+import threading
+import logging
+from typing import Dict, List, Any, Optional
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.candidate_retriever import tokenize
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Thực thể được đưa vào chỉ mục: {loại trong mapping_results: (bảng, khóa context AI, các trường text)}
+ENTITY_SOURCES = {
+    'DuAn': ('DuAn', 'projects', ['MaDuAn', 'TenDuAn']),
+    'PhongBan': ('PhongBan', 'departments', ['MaPhongBan', 'TenPhongBan']),
+    'CongViec': ('CongViec', 'tasks', ['TenCongViec']),
+    'VanDe': ('VanDe', 'issues', ['MoTaVanDe']),
+}
+
+# Khóa context AI -> loại thực thể
+_CONTEXT_TYPES = {context_key: entity_type for entity_type, (_, context_key, _) in ENTITY_SOURCES.items()}
+
+class EntityIndex:
+    """
+    Chỉ mục vector (ma trận NumPy đã chuẩn hóa) của tên/mô tả các thực thể PMIS
+    
+    - Vector mặc định là hashing trigram/từ (không cần model, chạy offline); đặt EMBEDDING_MODEL
+      để dùng sentence-transformers nếu đã cài
+    - Lưu trên đĩa (EMBEDDING_INDEX_FILE .npy + .json); không tự truy vấn CSDL mà nhận thay đổi
+      từ ContextCache (tải toàn bộ và delta) rồi tính vector ở thread nền, dòng bị xóa được bỏ
+    - match_entities(text, k) trả về top-k ứng viên mỗi loại cùng độ tương đồng cosine; văn bản
+      được chia đoạn và lấy điểm cao nhất của các đoạn để tài liệu dài không làm loãng điểm
+    """
+    
+    def __init__(self, db_manager, path: Optional[str] = None):
+        if np is None:
+            raise ImportError("numpy is required for the local entity index")
+        
+        self.db_manager = db_manager
+        self.path = path or config.EMBEDDING_INDEX_FILE
+        self.backend = "hashing"
+        self.dimension = config.EMBEDDING_DIMENSION
+        self._model = None
+        self._lock = threading.Lock()
+        self._updates = queue.Queue()    # (loại, dòng, ID đã xóa, full) từ ContextCache, None = dừng
+        self._thread = None
+        
+        self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self._entries = []          # [{'type', 'id', 'code', 'label'}] theo thứ tự dòng của ma trận
+        self._positions = {}        # {(type, id): vị trí dòng}
+        self._types = np.array([])  # Loại thực thể của từng dòng
+        
+        self._load_model()
+        self._load()
+    
+    def start(self):
+        """Đăng ký nhận thay đổi từ ContextCache và chạy thread cập nhật chỉ mục nền"""
+        if self._thread is None or not self._thread.is_alive():
+            self.db_manager.context_cache.add_listener(self.on_context_update)
+            self._thread = threading.Thread(target=self._run, name="pmis-entity-index", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Hủy đăng ký và dừng thread cập nhật"""
+        self.db_manager.context_cache.remove_listener(self.on_context_update)
+        if self._thread is not None:
+            self._updates.put(None)
+            self._thread.join(timeout=5)
+    
+    def _run(self):
+        """Thread nền: tải context một lần lúc khởi động rồi áp dụng các thay đổi được xếp hàng"""
+        try:
+            # ContextCache gửi toàn bộ dòng qua listener ở lần tải đầu tiên
+            self.db_manager.get_main_tables_info()
+        except Exception as e:
+            logger.warning(f"Initial context load for the entity index failed: {e}")
+        
+        changed = False
+        while True:
+            update = self._updates.get()
+            if update is None:
+                break
+            try:
+                changed = self.apply_update(*update) or changed
+            except Exception as e:
+                logger.error(f"Error updating entity index for {update[0]}: {e}")
+            # Lưu khi đã áp dụng hết các thay đổi đang chờ
+            if changed and self._updates.empty():
+                self._save()
+                changed = False
+        
+        if changed:
+            self._save()
+    
+    def is_ready(self) -> bool:
+        """Chỉ mục đã có dữ liệu chưa"""
+        return bool(self._entries)
+    
+    def match_entities(self, text: str, k: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """Top-k thực thể mỗi loại giống nội dung văn bản nhất: {loại: [{'id', 'code', 'label', 'score'}]}"""
+        chunks = self._split_chunks(text[:config.AI_PROMPT_CHAR_LIMIT])
+        with self._lock:
+            vectors = self._vectors
+            entries = self._entries
+            types = self._types
+        if not chunks or not entries:
+            return {entity_type: [] for entity_type in ENTITY_SOURCES}
+        
+        # Điểm của một thực thể = cosine cao nhất giữa nó và các đoạn văn bản
+        scores = (self._embed(chunks) @ vectors.T).max(axis=0)
+        
+        matches = {}
+        for entity_type in ENTITY_SOURCES:
+            positions = np.flatnonzero(types == entity_type)
+            if positions.size == 0:
+                matches[entity_type] = []
+                continue
+            top = positions[np.argsort(-scores[positions])[:k]]
+            matches[entity_type] = [
+                {**{key: entries[position][key] for key in ('id', 'code', 'label')},
+                 'score': round(float(scores[position]), 4)}
+                for position in top
+            ]
+        return matches
+    
+    def on_context_update(self, key: str, rows: List[Dict[str, Any]], deleted_ids: List[Any], full: bool):
+        """Listener của ContextCache: chỉ xếp hàng thay đổi, thread nền sẽ tính vector"""
+        entity_type = _CONTEXT_TYPES.get(key)
+        if entity_type is not None:
+            self._updates.put((entity_type, rows, deleted_ids, full))
+    
+    def apply_update(self, entity_type: str, rows: List[Dict[str, Any]], deleted_ids: List[Any], full: bool) -> bool:
+        """
+        Cập nhật chỉ mục của một loại thực thể, trả về True nếu có thay đổi
+        
+        Chỉ dòng mới hoặc có text thay đổi mới được tính lại vector (gộp theo ID nên nhận lại
+        cùng một dòng nhiều lần không sao). full=True: các thực thể không có trong rows bị bỏ.
+        """
+        fields = ENTITY_SOURCES[entity_type][2]
+        entries = [
+            {
+                'type': entity_type,
+                'id': row['ID'],
+                'code': str(row.get(fields[0]) or "") if len(fields) > 1 else "",
+                'label': str(row.get(fields[-1]) or ""),
+            }
+            for row in rows
+        ]
+        
+        with self._lock:
+            current = {entry['id']: entry for entry in self._entries if entry['type'] == entity_type}
+        changed = [entry for entry in entries if current.get(entry['id']) != entry]
+        deleted = {(entity_type, entity_id) for entity_id in deleted_ids if entity_id in current}
+        if full:
+            live_ids = {entry['id'] for entry in entries}
+            deleted.update((entity_type, entity_id) for entity_id in current if entity_id not in live_ids)
+        if not changed and not deleted:
+            return False
+        
+        vectors = self._embed([f"{entry['code']} {entry['label']}".strip() for entry in changed])
+        with self._lock:
+            self._upsert(changed, vectors, deleted)
+        
+        logger.debug(f"Entity index updated {len(changed)} and removed {len(deleted)} entities of {entity_type}")
+        return True
+    
+    def _upsert(self, entries: List[Dict[str, Any]], vectors, deleted: set):
+        """Thay thế/thêm vector và bỏ các dòng đã xóa (gọi khi giữ lock, ma trận mới được tạo thay vì sửa tại chỗ)"""
+        matrix = self._vectors.copy()
+        current = list(self._entries)
+        appended_entries = []
+        appended_rows = []
+        
+        for entry, vector in zip(entries, vectors):
+            position = self._positions.get((entry['type'], entry['id']))
+            if position is None:
+                appended_entries.append(entry)
+                appended_rows.append(vector)
+            else:
+                matrix[position] = vector
+                current[position] = entry
+        
+        if appended_rows:
+            matrix = np.vstack([matrix, np.asarray(appended_rows, dtype=np.float32)])
+            current.extend(appended_entries)
+        
+        if deleted:
+            keep = [index for index, entry in enumerate(current) if (entry['type'], entry['id']) not in deleted]
+            matrix = matrix[keep]
+            current = [current[index] for index in keep]
+        
+        self._vectors = matrix
+        self._set_entries(current)
+    
+    def _set_entries(self, entries: List[Dict[str, Any]]):
+        """Cập nhật danh sách thực thể và các bảng tra cứu theo vị trí"""
+        self._entries = entries
+        self._positions = {(entry['type'], entry['id']): index for index, entry in enumerate(entries)}
+        self._types = np.array([entry['type'] for entry in entries])
+    
+    def _embed(self, texts: List[str]):
+        """Vector đã chuẩn hóa L2 của các văn bản (ma trận len(texts) x dimension)"""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        
+        if self._model is not None:
+            return np.asarray(self._model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+        
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                digest = zlib.crc32(term.encode("utf-8"))
+                weight = config.RETRIEVAL_TRIGRAM_WEIGHT if term.startswith('#') else 1.0
+                # Bit cao của hash quyết định dấu để giảm sai lệch do va chạm
+                matrix[row, digest % self.dimension] += weight if digest & 0x80000000 else -weight
+        
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    @staticmethod
+    def _split_chunks(text: str) -> List[str]:
+        """Chia văn bản thành các đoạn khoảng EMBEDDING_CHUNK_CHARS ký tự theo dòng"""
+        chunks = []
+        current = ""
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if current and len(current) + len(line) > config.EMBEDDING_CHUNK_CHARS:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+    
+    def _load_model(self):
+        """Tải model sentence-transformers nếu được cấu hình, nếu không dùng vector hashing"""
+        if not config.EMBEDDING_MODEL:
+            return
+        try:
+            from sentence_transformers import SentenceTransformer
+            
+            self._model = SentenceTransformer(config.EMBEDDING_MODEL)
+            self.backend = config.EMBEDDING_MODEL
+            self.dimension = self._model.get_sentence_embedding_dimension()
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        except ImportError:
+            logger.warning("sentence-transformers not installed, using hashing embeddings")
+        except Exception as e:
+            logger.error(f"Error loading embedding model {config.EMBEDDING_MODEL}, using hashing embeddings: {e}")
+    
+    def _load(self):
+        """Đọc chỉ mục đã lưu (bỏ qua nếu được tạo bằng backend/số chiều khác)"""
+        meta_path = self.path + ".json"
+        vectors_path = self.path + ".npy"
+        if not (os.path.exists(meta_path) and os.path.exists(vectors_path)):
+            return
+        
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get('backend') != self.backend or meta.get('dimension') != self.dimension:
+                logger.info("Entity index was built with a different embedding, rebuilding")
+                return
+            
+            vectors = np.load(vectors_path)
+            if vectors.shape[0] != len(meta['entries']):
+                raise ValueError("entity index files are out of sync")
+            
+            self._vectors = vectors.astype(np.float32, copy=False)
+            self._set_entries(meta['entries'])
+            logger.info(f"Loaded entity index with {len(self._entries)} entities")
+        except Exception as e:
+            logger.error(f"Error loading entity index, rebuilding: {e}")
+    
+    def _save(self):
+        """Ghi chỉ mục ra đĩa (ghi file tạm rồi đổi tên)"""
+        with self._lock:
+            vectors = self._vectors
+            meta = {
+                'backend': self.backend,
+                'dimension': self.dimension,
+                'entries': self._entries,
+            }
+        
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + ".npy.tmp", "wb") as f:
+                np.save(f, vectors)
+            with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, default=str)
+            os.replace(self.path + ".npy.tmp", self.path + ".npy")
+            os.replace(self.path + ".json.tmp", self.path + ".json")
+        except OSError as e:
+            logger.error(f"Error saving entity index: {e}")
@@ -0,0 +1,376 @@
+import json
+import time
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Any, Optional
+import psycopg
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.context_cache import CONTEXT_TABLES
+from src.schema_catalog import SchemaCatalog
+
+logger = logging.getLogger(__name__)
+
+class LocalMirror:
+    """
+    Bản sao SQLite cục bộ của các bảng tham chiếu (DuAn, PhongBan, CongViec, VanDe, GoiThau, HopDong...)
+    
+    - Thread nền đồng bộ theo last_updated mỗi MIRROR_SYNC_INTERVAL giây, tải lại toàn bộ
+      mỗi MIRROR_FULL_REFRESH giây để bắt các dòng bị xóa cứng hoặc schema thay đổi
+    - Chỉ dùng làm nguồn dự phòng khi không kết nối được Postgres (DatabaseManager đọc Postgres
+      và ContextCache trước)
+    - Ghi không gửi được (mất kết nối) được xếp hàng trong SQLite và gửi lại khi có mạng
+    
+    Giá trị ngày giờ được lưu dạng chuỗi ISO, số thập phân dạng float, mảng/JSON dạng chuỗi JSON;
+    kiểu của từng cột được ghi lại để khi đọc trả về date/datetime/Decimal/list như Postgres.
+    """
+    
+    def __init__(self, db_manager, tables: Optional[List[str]] = None, path: Optional[str] = None):
+        self.db_manager = db_manager
+        self.tables = tables or config.MIRROR_TABLES
+        self.path = path or config.MIRROR_FILE
+        self.sync_interval = config.MIRROR_SYNC_INTERVAL
+        self.full_refresh_interval = config.MIRROR_FULL_REFRESH
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._state = {}        # {table: {'last_sync': str, 'columns': [...], 'loaded_at': float}}
+        self.version = 0        # Tăng mỗi khi dữ liệu mirror thay đổi
+        
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_state "
+            "(table_name TEXT PRIMARY KEY, last_sync TEXT, columns TEXT)"
+        )
+        try:
+            # File mirror tạo trước khi có cột types
+            self._conn.execute("ALTER TABLE _mirror_state ADD COLUMN types TEXT")
+        except sqlite3.OperationalError:
+            pass
+        # Lệnh chèn đơn xếp hàng bởi phiên bản trước (nay mọi lệnh ghi offline đều là unit of work)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _pending_writes "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT, data TEXT, queued_at TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _pending_units "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, unit_key TEXT UNIQUE, operations TEXT, queued_at TEXT)"
+        )
+        self._conn.commit()
+        
+        for row in self._conn.execute("SELECT table_name, last_sync, columns, types FROM _mirror_state"):
+            # loaded_at = 0 để lần đồng bộ đầu tiên trong phiên luôn tải lại toàn bộ
+            self._state[row['table_name']] = {
+                'last_sync': row['last_sync'],
+                'columns': json.loads(row['columns']),
+                'types': json.loads(row['types'] or '{}'),
+                'loaded_at': 0.0,
+            }
+    
+    def start(self):
+        """Chạy thread đồng bộ nền"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="pmis-mirror", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Dừng thread đồng bộ và đóng file SQLite"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self._conn.close()
+    
+    def _run(self):
+        """Vòng lặp đồng bộ nền"""
+        while not self._stop_event.is_set():
+            self.sync()
+            self._stop_event.wait(self.sync_interval)
+    
+    def has_table(self, table_name: str) -> bool:
+        """Bảng đã được đồng bộ về mirror chưa"""
+        return SchemaCatalog.normalize_name(table_name) in self._state
+    
+    def sync(self) -> bool:
+        """Gửi các ghi đang chờ rồi đồng bộ tất cả các bảng, trả về False nếu mất kết nối"""
+        if not self.flush_pending_writes():
+            return False
+        
+        changed = False
+        for table in self.tables:
+            try:
+                state = self._state.get(table)
+                if state is None or time.monotonic() - state['loaded_at'] >= self.full_refresh_interval:
+                    changed = self._full_load(table) or changed
+                else:
+                    changed = self._delta_load(table) or changed
+            except psycopg.OperationalError as e:
+                logger.warning(f"Mirror sync skipped, database unreachable: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Error syncing mirror table {table}: {e}")
+        
+        if changed:
+            self.version += 1
+        return True
+    
+    def _full_load(self, table: str) -> bool:
+        """Tải lại toàn bộ một bảng (kể cả dòng đã xóa mềm) và thay thế bản sao cục bộ"""
+        rows = []
+        columns = None
+        with self.db_manager.get_cursor(dictionary=False) as cursor:
+            cursor.execute(f'SELECT * FROM "{table}"')
+            columns = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+        
+        last_sync = self._max_last_updated(columns, rows)
+        quoted = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join(['?'] * len(columns))
+        
+        with self._lock, self._conn:
+            state = self._state.get(table)
+            if state is None or state['columns'] != columns:
+                # Schema thay đổi (hoặc lần đầu): tạo lại bảng SQLite
+                column_defs = ', '.join(
+                    f'"{column}" INTEGER PRIMARY KEY' if column == 'ID' else f'"{column}"'
+                    for column in columns
+                )
+                self._conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+                self._conn.execute(f'CREATE TABLE "{table}" ({column_defs})')
+            else:
+                self._conn.execute(f'DELETE FROM "{table}"')
+            
+            self._conn.executemany(
+                f'INSERT INTO "{table}" ({quoted}) VALUES ({placeholders})',
+                [[self._to_sqlite(value) for value in row] for row in rows]
+            )
+            self._save_state(table, last_sync, columns, types=self._column_types(columns, rows))
+        
+        logger.info(f"Mirror loaded {len(rows)} rows from {table}")
+        return True
+    
+    def _delta_load(self, table: str) -> bool:
+        """
+        Lấy các dòng thay đổi từ lần đồng bộ trước (lùi lại CONTEXT_DELTA_OVERLAP giây để bắt
+        transaction commit muộn) và upsert vào mirror theo ID
+        """
+        state = self._state[table]
+        since = datetime.min
+        if state['last_sync']:
+            since = datetime.fromisoformat(state['last_sync']) - timedelta(seconds=config.CONTEXT_DELTA_OVERLAP)
+        
+        with self.db_manager.get_cursor(dictionary=False) as cursor:
+            cursor.execute(f'SELECT * FROM "{table}" WHERE last_updated >= %s', (since,))
+            columns = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+        
+        if columns != state['columns']:
+            return self._full_load(table)
+        if not rows:
+            return False
+        
+        quoted = ', '.join(f'"{column}"' for column in columns)
+        placeholders = ', '.join(['?'] * len(columns))
+        last_sync = self._max_last_updated(columns, rows)
+        
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO "{table}" ({quoted}) VALUES ({placeholders})',
+                [[self._to_sqlite(value) for value in row] for row in rows]
+            )
+            types = dict(state.get('types', {}), **self._column_types(columns, rows))
+            self._save_state(table, last_sync, columns, state['loaded_at'], types)
+        
+        logger.debug(f"Mirror applied {len(rows)} changed rows to {table}")
+        return True
+    
+    def _save_state(self, table: str, last_sync: Optional[str], columns: List[str],
+                    loaded_at: Optional[float] = None, types: Optional[Dict[str, str]] = None):
+        """Lưu watermark đồng bộ và kiểu cột của một bảng (gọi trong transaction SQLite)"""
+        types = types or {}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _mirror_state (table_name, last_sync, columns, types) VALUES (?, ?, ?, ?)",
+            (table, last_sync, json.dumps(columns), json.dumps(types))
+        )
+        self._state[table] = {
+            'last_sync': last_sync,
+            'columns': columns,
+            'types': types,
+            'loaded_at': time.monotonic() if loaded_at is None else loaded_at,
+        }
+    
+    def get_table_data(self, table_name: str, columns: List[str] = None,
+                       order_by: Optional[str] = None, limit: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """Đọc dữ liệu (chưa xóa mềm) từ mirror, trả về None nếu bảng chưa được đồng bộ"""
+        table = SchemaCatalog.normalize_name(table_name)
+        state = self._state.get(table)
+        if state is None:
+            return None
+        
+        if columns is None:
+            columns = [f'"{column}"' for column in state['columns']
+                       if column not in ['is_deleted', 'last_updated']]
+        
+        query = (f'SELECT {", ".join(columns)} FROM "{table}" '
+                 f'WHERE is_deleted = 0 OR is_deleted IS NULL')
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        
+        types = state.get('types', {})
+        try:
+            with self._lock:
+                rows = [dict(row) for row in self._conn.execute(query)]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading mirror table {table}: {e}")
+            return None
+        
+        for row in rows:
+            for column, value in row.items():
+                if value is not None and column in types:
+                    row[column] = self._from_sqlite(value, types[column])
+        return rows
+    
+    def get_context(self) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Lấy context AI từ mirror, trả về None nếu còn bảng context chưa được đồng bộ"""
+        result = {}
+        for key, (table_name, columns) in CONTEXT_TABLES.items():
+            rows = self.get_table_data(table_name, columns)
+            if rows is None:
+                return None
+            result[key] = rows
+        return result
+    
+    def queue_unit_of_work(self, key: str, operations: List[tuple]):
+        """Xếp hàng cả một unit of work [(table_name, data)] để gửi lại trong một transaction"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO _pending_units (unit_key, operations, queued_at) VALUES (?, ?, ?)",
+                (key, json.dumps(operations, ensure_ascii=False, default=str), datetime.now().isoformat())
+            )
+        logger.warning(f"Database unreachable, queued unit of work {key} with {len(operations)} writes")
+    
+    def pending_write_count(self) -> int:
+        """Số lệnh ghi (và unit of work) đang chờ gửi"""
+        with self._lock:
+            return (self._conn.execute("SELECT count(*) FROM _pending_writes").fetchone()[0]
+                    + self._conn.execute("SELECT count(*) FROM _pending_units").fetchone()[0])
+    
+    def flush_pending_writes(self) -> bool:
+        """Gửi các lệnh ghi đang chờ theo thứ tự, trả về False nếu vẫn mất kết nối"""
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT seq, table_name, data, queued_at FROM _pending_writes ORDER BY seq"
+            ).fetchall()
+        
+        for row in pending:
+            # Gửi lại như unit of work một lệnh với khóa cố định theo mục: nếu lần gửi trước đã commit
+            # nhưng chưa kịp xóa khỏi hàng đợi, lần này bị bỏ qua thay vì ghi trùng
+            uow = self.db_manager.unit_of_work(key=f"pending-write-{row['seq']}-{row['queued_at']}")
+            try:
+                uow.insert(row['table_name'], json.loads(row['data']))
+                uow._execute()
+            except psycopg.OperationalError as e:
+                logger.warning(f"Pending writes kept, database unreachable: {e}")
+                return False
+            except Exception as e:
+                # Dữ liệu lỗi sẽ không bao giờ ghi được: bỏ để không chặn hàng đợi
+                logger.error(f"Dropping queued insert into {row['table_name']}: {e}")
+            
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM _pending_writes WHERE seq = ?", (row['seq'],))
+        
+        if pending:
+            logger.info(f"Flushed {len(pending)} queued writes to the database")
+        return self._flush_pending_units()
+    
+    def _flush_pending_units(self) -> bool:
+        """Gửi lại các unit of work đang chờ, mỗi unit trong một transaction với khóa ban đầu"""
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT seq, unit_key, operations FROM _pending_units ORDER BY seq"
+            ).fetchall()
+        
+        for row in pending:
+            uow = self.db_manager.unit_of_work(key=row['unit_key'])
+            try:
+                for table_name, data in json.loads(row['operations']):
+                    if table_name == 'gemini_automation_log':
+                        uow.log_ai_activity(data['filename'], data['ai_response'], data['status'])
+                    else:
+                        uow.insert(table_name, data)
+                uow._execute()
+            except psycopg.OperationalError as e:
+                logger.warning(f"Pending units of work kept, database unreachable: {e}")
+                return False
+            except Exception as e:
+                # Dữ liệu lỗi sẽ không bao giờ ghi được: bỏ để không chặn hàng đợi
+                logger.error(f"Dropping queued unit of work {row['unit_key']}: {e}")
+            
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM _pending_units WHERE seq = ?", (row['seq'],))
+        
+        if pending:
+            logger.info(f"Flushed {len(pending)} queued units of work to the database")
+        return True
+    
+    @staticmethod
+    def _max_last_updated(columns: List[str], rows: List[tuple]) -> Optional[str]:
+        """Lấy last_updated lớn nhất (dạng chuỗi ISO) trong các dòng"""
+        if 'last_updated' not in columns:
+            return None
+        index = columns.index('last_updated')
+        values = [row[index] for row in rows if row[index] is not None]
+        return max(values).isoformat() if values else None
+    
+    @staticmethod
+    def _column_types(columns: List[str], rows: List[tuple]) -> Dict[str, str]:
+        """Kiểu Postgres cần khôi phục khi đọc của từng cột (theo giá trị khác NULL đầu tiên)"""
+        types = {}
+        for index, column in enumerate(columns):
+            value = next((row[index] for row in rows if row[index] is not None), None)
+            if isinstance(value, datetime):
+                types[column] = 'datetime'
+            elif isinstance(value, date):
+                types[column] = 'date'
+            elif isinstance(value, Decimal):
+                types[column] = 'decimal'
+            elif isinstance(value, (list, dict)):
+                types[column] = 'json'
+        return types
+    
+    @staticmethod
+    def _from_sqlite(value: Any, kind: str) -> Any:
+        """Chuyển giá trị đọc từ SQLite về kiểu Postgres ban đầu"""
+        if kind == 'datetime':
+            return datetime.fromisoformat(value)
+        if kind == 'date':
+            return date.fromisoformat(value)
+        if kind == 'decimal':
+            return Decimal(str(value))
+        if kind == 'json':
+            return json.loads(value)
+        return value
+    
+    @staticmethod
+    def _to_sqlite(value: Any) -> Any:
+        """Chuyển giá trị Postgres sang kiểu SQLite lưu được"""
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return value
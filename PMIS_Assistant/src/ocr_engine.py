@@ -0,0 +1,244 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+from PIL import Image, ImageOps
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# tesserocr giữ dữ liệu ngôn ngữ trong bộ nhớ giữa các lần OCR (pytesseract tải lại mỗi lần)
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# PyMuPDF dùng để render trang PDF scan thành ảnh
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+_engine = None
+_engine_lock = threading.Lock()
+
+class OCREngine:
+    """
+    OCR cho ảnh chụp và PDF scan
+    
+    - Tiền xử lý: chuyển ảnh xám, đưa kích thước về khoảng OCR_MIN_DIMENSION..OCR_MAX_DIMENSION,
+      tăng tương phản và nhị phân hóa (ngưỡng Otsu)
+    - Ảnh cao được cắt thành các dải ngang tại dòng trắng (không cắt đôi dòng chữ),
+      các dải được OCR song song trên OCR_WORKERS thread
+    - Với tesserocr, mỗi thread giữ một PyTessBaseAPI nên dữ liệu ngôn ngữ chỉ tải một lần
+    """
+    
+    def __init__(self, lang: Optional[str] = None, workers: Optional[int] = None):
+        self.lang = lang or config.OCR_LANG
+        self.workers = workers or config.OCR_WORKERS or os.cpu_count() or 1
+        self.backend = "tesserocr" if tesserocr is not None else ("pytesseract" if pytesseract is not None else None)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._apis = []
+    
+    def image_to_text(self, image_path: str) -> str:
+        """Trích xuất text từ file ảnh"""
+        if self.backend is None:
+            logger.warning("pytesseract not installed, cannot extract text from image")
+            return "[Không thể trích xuất text từ ảnh - cần cài đặt pytesseract]"
+        
+        try:
+            with Image.open(image_path) as image:
+                return self.ocr_image(image)
+        except Exception as e:
+            logger.error(f"Error extracting text from image: {e}")
+            return f"[Lỗi khi trích xuất text từ ảnh: {str(e)}]"
+    
+    def pdf_to_text(self, file_path: str, max_chars: int = 0) -> str:
+        """OCR lần lượt từng trang PDF scan, dừng khi đã đủ max_chars ký tự (0 = đọc hết)"""
+        if self.backend is None:
+            logger.warning("pytesseract not installed, cannot OCR scanned PDF")
+            return ""
+        
+        parts = []
+        total = 0
+        pages = self.iter_pdf_images(file_path)
+        try:
+            for page_number, page_image in enumerate(pages, 1):
+                text = self.ocr_image(page_image).strip()
+                logger.debug(f"OCR page {page_number} of {file_path}: {len(text)} chars")
+                if not text:
+                    continue
+                parts.append(text)
+                total += len(text)
+                if max_chars and total >= max_chars:
+                    break
+        except Exception as e:
+            logger.error(f"Error running OCR on PDF {file_path}: {e}")
+        finally:
+            pages.close()
+        
+        text = "\n".join(parts)
+        return text[:max_chars] if max_chars else text
+    
+    def iter_pdf_images(self, file_path: str) -> Iterator[Image.Image]:
+        """Render lần lượt từng trang PDF thành ảnh xám (chỉ render trang khi được lấy tới)"""
+        if fitz is None:
+            logger.warning("PyMuPDF not installed, cannot render scanned PDF pages for OCR")
+            return
+        
+        with fitz.open(file_path) as document:
+            for page in document:
+                pixmap = page.get_pixmap(dpi=config.OCR_PDF_DPI, colorspace=fitz.csGRAY)
+                yield Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples,
+                                      "raw", "L", pixmap.stride)
+    
+    def ocr_image(self, image: Image.Image) -> str:
+        """Tiền xử lý, cắt dải và OCR song song một ảnh"""
+        tiles = self.split_tiles(self.preprocess(image))
+        texts = self._get_executor().map(self._ocr_tile, tiles)
+        return "\n".join(text.strip() for text in texts if text and text.strip())
+    
+    def preprocess(self, image: Image.Image) -> Image.Image:
+        """Chuyển ảnh xám, chỉnh kích thước, tăng tương phản và nhị phân hóa"""
+        image = ImageOps.exif_transpose(image).convert("L")
+        
+        longest = max(image.size)
+        scale = 1.0
+        if longest > config.OCR_MAX_DIMENSION:
+            scale = config.OCR_MAX_DIMENSION / longest
+        elif 0 < longest < config.OCR_MIN_DIMENSION:
+            # Ảnh chụp màn hình nhỏ: phóng to để chữ đủ cao cho Tesseract
+            scale = min(config.OCR_MIN_DIMENSION / longest, 3.0)
+        if scale != 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.Resampling.LANCZOS if scale < 1 else Image.Resampling.BICUBIC)
+        
+        image = ImageOps.autocontrast(image)
+        if config.OCR_BINARIZE:
+            threshold = self._otsu_threshold(image.histogram())
+            image = image.point([255 if value > threshold else 0 for value in range(256)])
+        return image
+    
+    def split_tiles(self, image: Image.Image) -> List[Image.Image]:
+        """Cắt ảnh cao thành các dải ngang, ranh giới đặt tại dòng trắng gần nhất"""
+        tile_height = config.OCR_TILE_HEIGHT
+        if tile_height <= 0 or image.height <= tile_height * 1.5:
+            return [image]
+        
+        tiles = []
+        top = 0
+        while top < image.height:
+            bottom = min(top + tile_height, image.height)
+            # Dải cuối quá thấp thì gộp vào dải hiện tại
+            if image.height - bottom < tile_height // 2:
+                bottom = image.height
+            else:
+                bottom = self._find_blank_row(image, bottom, tile_height // 4)
+            tiles.append(image.crop((0, top, image.width, bottom)))
+            top = bottom
+        return tiles
+    
+    def shutdown(self):
+        """Dừng các thread OCR và giải phóng dữ liệu ngôn ngữ"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        # Chờ ngoài lock vì thread OCR cần lock khi tạo PyTessBaseAPI
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool OCR (tạo khi cần lần đầu)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pmis-ocr")
+            return self._executor
+    
+    def _ocr_tile(self, tile: Image.Image) -> str:
+        """OCR một dải ảnh (chạy trong thread pool)"""
+        if self.backend == "tesserocr":
+            api = getattr(self._local, "api", None)
+            if api is None:
+                api = tesserocr.PyTessBaseAPI(lang=self.lang)
+                self._local.api = api
+                with self._lock:
+                    self._apis.append(api)
+            api.SetImage(tile)
+            return api.GetUTF8Text()
+        
+        return pytesseract.image_to_string(tile, lang=self.lang)
+    
+    @staticmethod
+    def _find_blank_row(image: Image.Image, row: int, search: int) -> int:
+        """Tìm dòng không có điểm tối gần row nhất (trong khoảng ±search), không có thì trả về row"""
+        start = max(row - search, 1)
+        end = min(row + search, image.height - 1)
+        band = image.crop((0, start, image.width, end))
+        
+        for offset in range(search + 1):
+            for y in (row - offset, row + offset):
+                if start <= y < end and band.crop((0, y - start, band.width, y - start + 1)).getextrema()[0] > 128:
+                    return y
+        return row
+    
+    @staticmethod
+    def _otsu_threshold(histogram: List[int]) -> int:
+        """Ngưỡng nhị phân hóa Otsu từ histogram 256 mức xám"""
+        total = sum(histogram)
+        if total == 0:
+            return 128
+        
+        sum_all = sum(value * count for value, count in enumerate(histogram))
+        sum_background = 0.0
+        weight_background = 0
+        best_threshold = 128
+        best_variance = 0.0
+        
+        for value, count in enumerate(histogram):
+            weight_background += count
+            if weight_background == 0:
+                continue
+            weight_foreground = total - weight_background
+            if weight_foreground == 0:
+                break
+            sum_background += value * count
+            mean_background = sum_background / weight_background
+            mean_foreground = (sum_all - sum_background) / weight_foreground
+            variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+            if variance > best_variance:
+                best_variance = variance
+                best_threshold = value
+        
+        return best_threshold
+
+def get_ocr_engine(workers: Optional[int] = None) -> OCREngine:
+    """OCR engine dùng chung trong process (tạo khi cần lần đầu, workers chỉ có tác dụng lúc tạo)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = OCREngine(workers=workers)
+        return _engine
+
+def shutdown_ocr_engine():
+    """Dừng OCR engine dùng chung"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+            _engine = None
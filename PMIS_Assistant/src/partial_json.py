@@ -0,0 +1,137 @@
+import re
+import json
+import logging
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Escape \uXXXX chưa nhận đủ ở cuối chuỗi
+_INCOMPLETE_UNICODE_ESCAPE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+
+class IncrementalJSONParser:
+    """
+    Parse JSON đang được nhận dần (phản hồi streaming của Gemini)
+    
+    Mỗi lần feed chỉ quét phần mới nhận, ghi nhớ vị trí kết thúc của giá trị hoàn chỉnh cuối cùng
+    và các object/array đang mở. Kết quả tạm là phần JSON hợp lệ đã nhận được đóng ngoặc lại;
+    chuỗi giá trị đang nhận dở được giữ nguyên (để tóm tắt hiện dần), còn số/true/false/null
+    chỉ xuất hiện khi đã nhận đủ. Phần đứng trước '{' hoặc '[' đầu tiên (ví dụ ```json) được bỏ qua.
+    
+    Sử dụng:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            partial = parser.feed(chunk.text)
+            if partial is not None:
+                update_ui(partial)
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self.done = False            # Đã nhận đủ object/array gốc
+        self._pos = 0
+        self._start = None           # Vị trí '{' hoặc '[' đầu tiên
+        self._stack = []             # Các '{' / '[' đang mở
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._in_literal = False
+        self._expect_key = False
+        self._safe_end = None        # (vị trí sau giá trị hoàn chỉnh cuối cùng, stack tại đó)
+        self._last_candidate = None
+    
+    def feed(self, chunk: str) -> Optional[Any]:
+        """Nhận thêm một đoạn, trả về kết quả tạm mới (None nếu chưa có gì mới)"""
+        if not chunk:
+            return None
+        self.text += chunk
+        self._scan()
+        
+        for candidate in self._candidates():
+            if candidate == self._last_candidate:
+                return None
+            try:
+                result = json.loads(candidate)
+            except ValueError as e:
+                logger.debug(f"Partial JSON not parseable yet: {e}")
+                continue
+            self._last_candidate = candidate
+            return result
+        return None
+    
+    def _scan(self):
+        """Quét phần text mới nhận và cập nhật trạng thái"""
+        text = self.text
+        for index in range(self._pos, len(text)):
+            char = text[index]
+            
+            if self.done:
+                break
+            
+            if self._start is None:
+                if char in '{[':
+                    self._start = index
+                    self._open(char, index)
+                continue
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if not self._string_is_key:
+                        self._safe_end = (index + 1, tuple(self._stack))
+                continue
+            
+            if self._in_literal and (char in ',}]' or char.isspace()):
+                self._in_literal = False
+                self._safe_end = (index, tuple(self._stack))
+            
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = self._stack[-1] == '{' and self._expect_key
+            elif char in '{[':
+                self._open(char, index)
+            elif char in '}]':
+                self._stack.pop()
+                self._safe_end = (index + 1, tuple(self._stack))
+                if not self._stack:
+                    self.done = True
+            elif char == ':':
+                self._expect_key = False
+            elif char == ',':
+                self._expect_key = self._stack[-1] == '{'
+            elif not char.isspace():
+                self._in_literal = True
+        
+        self._pos = len(text)
+    
+    def _open(self, char: str, index: int):
+        """Mở một object/array mới"""
+        self._stack.append(char)
+        self._expect_key = char == '{'
+        self._safe_end = (index + 1, tuple(self._stack))
+    
+    def _candidates(self) -> List[str]:
+        """Phần JSON đã nhận được đóng ngoặc lại (kèm chuỗi đang nhận dở nếu có), ưu tiên bản dài nhất"""
+        candidates = []
+        if self._start is None:
+            return candidates
+        
+        if self._in_string and not self._string_is_key:
+            body = self.text[self._start:self._pos]
+            if self._escape:
+                body = body[:-1]
+            body = _INCOMPLETE_UNICODE_ESCAPE.sub('', body)
+            candidates.append(body + '"' + self._closers(self._stack))
+        
+        if self._safe_end is not None:
+            end, stack = self._safe_end
+            candidates.append(self.text[self._start:end] + self._closers(stack))
+        return candidates
+    
+    @staticmethod
+    def _closers(stack) -> str:
+        """Các dấu đóng cho object/array đang mở"""
+        return ''.join('}' if char == '{' else ']' for char in reversed(stack))
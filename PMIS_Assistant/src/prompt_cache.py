@@ -0,0 +1,178 @@
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# Đánh dấu system prompt không cache được phía Gemini (quá ngắn hoặc model không hỗ trợ)
+_UNCACHEABLE = -1
+
+class PromptCache:
+    """
+    Cache cho phần system prompt cố định (hướng dẫn, quy tắc đặt tên, JSON schema, danh sách thực thể
+    khi không dùng retrieval)
+    
+    - Local: chuỗi prompt đã dựng được nhớ theo khóa context (phiên bản prompt + ngày, kèm fingerprint
+      khi prompt chứa danh sách thực thể), giữ tối đa PROMPT_MEMO_SIZE prompt gần nhất
+    - Gemini: khi cùng một system prompt được dùng lần thứ GEMINI_CACHE_MIN_USES, CachedContent
+      (TTL GEMINI_CACHE_TTL giây) được tạo ở thread nền, ngoài lock; lần gọi đó vẫn gửi prompt đầy đủ,
+      các lần sau dùng model từ cached content và chỉ gửi user prompt
+    - Prompt ngắn hơn GEMINI_CACHE_MIN_TOKENS bị bỏ qua trước khi gọi CachedContent.create (loại ngay
+      theo số byte, hoặc sau count_tokens); prompt bị bỏ qua hay bị Gemini từ chối không được thử lại.
+      Khi bật retrieval, system prompt chỉ gồm hướng dẫn và schema nên thường quá ngắn để cache:
+      context cache chỉ có lợi khi RETRIEVAL_ENABLED=false
+    """
+    
+    def __init__(self, model_name: str, generation_config: Dict[str, Any]):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self._lock = threading.Lock()
+        self._prompts = OrderedDict()   # {khóa context: system prompt}
+        self._uses = OrderedDict()      # {hash prompt: số lần dùng hoặc _UNCACHEABLE}
+        self._cached = OrderedDict()    # {hash prompt: (model, cached_content, hết hạn lúc)}
+        self._creating = set()          # Hash các prompt đang được tạo CachedContent
+        self._executor = None
+    
+    def get_prompt(self, context_key: str, build: Callable[[], str]) -> str:
+        """System prompt của một context, chỉ dựng lại khi context (hoặc ngày, phiên bản prompt) đổi"""
+        with self._lock:
+            prompt = self._prompts.get(context_key)
+            if prompt is not None:
+                self._prompts.move_to_end(context_key)
+                return prompt
+        
+        prompt = build()
+        with self._lock:
+            self._prompts[context_key] = prompt
+            while len(self._prompts) > config.PROMPT_MEMO_SIZE:
+                self._prompts.popitem(last=False)
+        return prompt
+    
+    def get_cached_model(self, system_prompt: str) -> Optional[Any]:
+        """Model dùng CachedContent của system prompt, None nếu chưa (hoặc không) cache được"""
+        if not config.GEMINI_CONTEXT_CACHE:
+            return None
+        
+        key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._cached.get(key)
+            if entry is not None:
+                if entry[2] > time.monotonic():
+                    self._cached.move_to_end(key)
+                    return entry[0]
+                # Cache phía Gemini đã hết hạn
+                del self._cached[key]
+            
+            uses = self._uses.get(key, 0)
+            if uses == _UNCACHEABLE:
+                return None
+            if len(system_prompt.encode("utf-8")) < config.GEMINI_CACHE_MIN_TOKENS:
+                # Số token không vượt quá số byte UTF-8: chắc chắn dưới mức tối thiểu, không cần gọi Gemini
+                self._uses[key] = _UNCACHEABLE
+                self._uses.move_to_end(key)
+                while len(self._uses) > config.PROMPT_MEMO_SIZE * 4:
+                    self._uses.popitem(last=False)
+                return None
+            self._uses[key] = uses + 1
+            self._uses.move_to_end(key)
+            while len(self._uses) > config.PROMPT_MEMO_SIZE * 4:
+                self._uses.popitem(last=False)
+            if uses + 1 < config.GEMINI_CACHE_MIN_USES or key in self._creating:
+                return None
+            
+            self._creating.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pmis-prompt-cache")
+            executor = self._executor
+        
+        # Tạo cache mất một round-trip tới Gemini: không chặn lần phân tích hiện tại
+        executor.submit(self._create, key, system_prompt)
+        return None
+    
+    def invalidate(self, system_prompt: str):
+        """Bỏ cache phía Gemini của một system prompt (ví dụ khi cache đã bị xóa trên server)"""
+        key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            self._cached.pop(key, None)
+            self._uses.pop(key, None)
+    
+    def clear(self):
+        """Xóa các CachedContent đã tạo trên Gemini và cache local"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        # Chờ các lần tạo đang chạy (ngoài lock vì chúng cần lock để lưu kết quả)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        
+        with self._lock:
+            entries = list(self._cached.values())
+            self._cached.clear()
+            self._prompts.clear()
+            self._uses.clear()
+            self._creating.clear()
+        
+        for _, cached_content, _ in entries:
+            self._delete(cached_content)
+    
+    def _create(self, key: str, system_prompt: str):
+        """Tạo CachedContent cho system prompt (chạy ở thread nền, không giữ lock khi gọi Gemini)"""
+        try:
+            import google.generativeai as genai
+            from google.generativeai import caching
+            
+            total_tokens = genai.GenerativeModel(self.model_name).count_tokens(system_prompt).total_tokens
+            if total_tokens < config.GEMINI_CACHE_MIN_TOKENS:
+                logger.info(f"System prompt too short for Gemini context caching "
+                            f"({total_tokens} < {config.GEMINI_CACHE_MIN_TOKENS} tokens)")
+                with self._lock:
+                    self._creating.discard(key)
+                    self._uses[key] = _UNCACHEABLE
+                return
+            
+            cached_content = caching.CachedContent.create(
+                model=self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}",
+                system_instruction=system_prompt,
+                ttl=timedelta(seconds=config.GEMINI_CACHE_TTL),
+            )
+            model = genai.GenerativeModel.from_cached_content(
+                cached_content=cached_content,
+                generation_config=self.generation_config,
+            )
+        except Exception as e:
+            logger.warning(f"Gemini context caching unavailable for this prompt: {e}")
+            with self._lock:
+                self._creating.discard(key)
+                self._uses[key] = _UNCACHEABLE
+            return
+        
+        evicted = []
+        with self._lock:
+            self._creating.discard(key)
+            # Hết hạn sớm hơn TTL một chút để không dùng cache vừa bị server xóa
+            self._cached[key] = (model, cached_content, time.monotonic() + config.GEMINI_CACHE_TTL * 0.9)
+            while len(self._cached) > config.GEMINI_CACHE_MAX_ENTRIES:
+                _, (_, oldest, _) = self._cached.popitem(last=False)
+                evicted.append(oldest)
+        
+        for cached_content in evicted:
+            self._delete(cached_content)
+        logger.info(f"Created Gemini context cache for system prompt ({len(system_prompt)} chars)")
+    
+    @staticmethod
+    def _delete(cached_content: Any):
+        """Xóa một CachedContent trên Gemini (bỏ qua lỗi, cache sẽ tự hết hạn)"""
+        try:
+            cached_content.delete()
+        except Exception as e:
+            logger.debug(f"Error deleting Gemini context cache: {e}")
@@ -0,0 +1,291 @@
+import time
+import json
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional
+import psycopg
+from psycopg import sql, pq
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# Ngưỡng các bucket của histogram độ trễ (ms), bucket cuối là "+Inf"
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Độ dài tối đa của câu SQL dùng làm khóa thống kê
+QUERY_KEY_MAXLEN = 300
+
+# Số dòng lấy mẫu để ước lượng số byte của kết quả lớn
+RESULT_SIZE_SAMPLE_ROWS = 32
+
+class QueryMetrics:
+    """
+    Thống kê truy vấn dùng chung cho toàn process
+    
+    Ghi nhận cho mỗi câu SQL: số lần chạy, lỗi, histogram độ trễ, số dòng và số byte đã đọc.
+    Truy vấn chậm hơn DB_SLOW_QUERY_MS được ghi log và giữ lại trong danh sách gần nhất.
+    Thời gian chờ lấy connection (pool hoặc kết nối mới) được đo riêng để tách độ trễ mạng.
+    Thống kê chỉ được cộng dồn trong bộ nhớ; file DB_METRICS_FILE được ghi bởi thread nền mỗi
+    DB_METRICS_FLUSH_INTERVAL giây (khi có thay đổi) và lần cuối trong stop().
+    """
+    
+    def __init__(self, enabled: Optional[bool] = None, slow_query_ms: Optional[float] = None,
+                 metrics_file: Optional[str] = None, flush_interval: Optional[float] = None):
+        self.enabled = config.DB_METRICS_ENABLED if enabled is None else enabled
+        self.slow_query_ms = config.DB_SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms
+        self.metrics_file = config.DB_METRICS_FILE if metrics_file is None else metrics_file
+        self.flush_interval = config.DB_METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._dirty = False      # Có thống kê mới chưa ghi ra file
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+        self._queries = {}
+        self._acquire = self._new_entry()
+        self._slow_queries = deque(maxlen=config.DB_SLOW_QUERY_HISTORY)
+    
+    @staticmethod
+    def _new_entry() -> Dict[str, Any]:
+        """Tạo bản ghi thống kê rỗng"""
+        return {
+            'calls': 0,
+            'errors': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'rows': 0,
+            'bytes': 0,
+            'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        }
+    
+    @staticmethod
+    def _observe(entry: Dict[str, Any], elapsed_ms: float):
+        """Cộng một lần đo độ trễ vào bản ghi"""
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                entry['histogram'][i] += 1
+                break
+        else:
+            entry['histogram'][-1] += 1
+    
+    def record_query(self, query_key: str, elapsed_ms: float, rows: int = 0,
+                     nbytes: int = 0, error: Optional[Exception] = None):
+        """Ghi nhận một lần thực thi truy vấn"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            entry = self._queries.get(query_key)
+            if entry is None:
+                entry = self._queries[query_key] = self._new_entry()
+            self._observe(entry, elapsed_ms)
+            entry['rows'] += rows
+            entry['bytes'] += nbytes
+            if error is not None:
+                entry['errors'] += 1
+            
+            if elapsed_ms >= self.slow_query_ms:
+                self._slow_queries.append({
+                    'query': query_key,
+                    'elapsed_ms': round(elapsed_ms, 2),
+                    'rows': rows,
+                    'at': time.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            self._dirty = True
+        
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows): {query_key}")
+        
+        if self.metrics_file and self._flush_thread is None:
+            self._start_flusher()
+    
+    def record_acquire(self, elapsed_ms: float):
+        """Ghi nhận thời gian chờ lấy connection"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._observe(self._acquire, elapsed_ms)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Lấy bản sao thống kê hiện tại (truy vấn sắp xếp theo tổng thời gian giảm dần)"""
+        with self._lock:
+            queries = [dict(entry, query=key, histogram=list(entry['histogram']))
+                       for key, entry in self._queries.items()]
+            acquire = dict(self._acquire, histogram=list(self._acquire['histogram']))
+            slow_queries = list(self._slow_queries)
+        
+        queries.sort(key=lambda entry: entry['total_ms'], reverse=True)
+        for entry in queries + [acquire]:
+            entry['avg_ms'] = round(entry['total_ms'] / entry['calls'], 3) if entry['calls'] else 0.0
+        
+        return {
+            'since': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._started_at)),
+            'buckets_ms': list(LATENCY_BUCKETS_MS) + ['+Inf'],
+            'totals': {
+                'calls': sum(entry['calls'] for entry in queries),
+                'errors': sum(entry['errors'] for entry in queries),
+                'total_ms': round(sum(entry['total_ms'] for entry in queries), 3),
+                'rows': sum(entry['rows'] for entry in queries),
+                'bytes': sum(entry['bytes'] for entry in queries),
+            },
+            'acquire': acquire,
+            'queries': queries,
+            'slow_queries': slow_queries,
+        }
+    
+    def reset(self):
+        """Xóa toàn bộ thống kê"""
+        with self._lock:
+            self._queries = {}
+            self._acquire = self._new_entry()
+            self._slow_queries.clear()
+            self._started_at = time.time()
+            self._dirty = True
+    
+    def write_file(self, path: Optional[str] = None) -> bool:
+        """Ghi thống kê ra file JSON (ghi file tạm rồi đổi tên để không để lại file dở dang)"""
+        path = path or self.metrics_file
+        if not path:
+            return False
+        
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2, default=str)
+            os.replace(temp_path, path)
+            return True
+        except OSError as e:
+            logger.error(f"Error writing metrics file {path}: {e}")
+            return False
+    
+    def _start_flusher(self):
+        """Khởi động thread nền ghi file metrics (ở lần ghi nhận đầu tiên)"""
+        with self._lock:
+            if self._flush_thread is not None:
+                return
+            self._stop_event.clear()
+            self._flush_thread = threading.Thread(target=self._run_flusher, name="pmis-query-metrics",
+                                                  daemon=True)
+            self._flush_thread.start()
+    
+    def _run_flusher(self):
+        """Ghi file metrics định kỳ, bỏ qua khi không có thống kê mới"""
+        while not self._stop_event.wait(self.flush_interval):
+            self._flush()
+    
+    def _flush(self) -> bool:
+        """Ghi file metrics nếu có thống kê mới kể từ lần ghi trước"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+        return self.write_file()
+    
+    def stop(self):
+        """Dừng thread ghi file và ghi thống kê lần cuối (nếu có cấu hình DB_METRICS_FILE)"""
+        self._stop_event.set()
+        with self._lock:
+            thread, self._flush_thread = self._flush_thread, None
+        if thread is not None:
+            thread.join(timeout=5)
+        self._flush()
+    
+    @staticmethod
+    def query_key(query: Any, context: Any = None) -> str:
+        """Chuẩn hóa câu SQL (gộp khoảng trắng, cắt ngắn) để làm khóa thống kê"""
+        if isinstance(query, sql.Composable):
+            try:
+                query = query.as_string(context)
+            except Exception:
+                query = repr(query)
+        elif isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        
+        key = ' '.join(str(query).split())
+        if len(key) > QUERY_KEY_MAXLEN:
+            key = key[:QUERY_KEY_MAXLEN] + '...'
+        return key
+    
+    @staticmethod
+    def result_size(cursor) -> tuple:
+        """
+        Số dòng và số byte của kết quả hiện tại trên cursor
+        
+        Số byte chỉ đếm chính xác khi kết quả không quá RESULT_SIZE_SAMPLE_ROWS dòng, kết quả lớn hơn
+        được ước lượng từ các dòng lấy mẫu cách đều để chi phí không tăng theo kích thước kết quả.
+        """
+        result = cursor.pgresult
+        if result is None or result.status != pq.ExecStatus.TUPLES_OK:
+            return max(cursor.rowcount, 0), 0
+        
+        ntuples = result.ntuples
+        if ntuples == 0:
+            return 0, 0
+        step = max(ntuples // RESULT_SIZE_SAMPLE_ROWS, 1)
+        sampled = range(0, ntuples, step)
+        nbytes = 0
+        for row in sampled:
+            for col in range(result.nfields):
+                value = result.get_value(row, col)
+                if value is not None:
+                    nbytes += len(value)
+        return ntuples, nbytes * ntuples // len(sampled)
+
+class _InstrumentedMixin:
+    """Đo thời gian execute/executemany/copy và ghi vào QueryMetrics"""
+    
+    def _record(self, query, started: float, error: Optional[Exception] = None):
+        if not query_metrics.enabled:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows, nbytes = (0, 0) if error is not None else QueryMetrics.result_size(self)
+        query_metrics.record_query(QueryMetrics.query_key(query, self), elapsed_ms, rows, nbytes, error)
+    
+    def execute(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, *args, **kwargs)
+        except Exception as e:
+            self._record(query, started, e)
+            raise
+        self._record(query, started)
+        return result
+    
+    def executemany(self, query, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, *args, **kwargs)
+        except Exception as e:
+            self._record(query, started, e)
+            raise
+        self._record(query, started)
+        return result
+
+class InstrumentedCursor(_InstrumentedMixin, psycopg.Cursor):
+    """Cursor phía client có đo thời gian truy vấn"""
+    
+    @contextmanager
+    def copy(self, statement, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with super().copy(statement, *args, **kwargs) as copy:
+                yield copy
+        except Exception as e:
+            self._record(statement, started, e)
+            raise
+        self._record(statement, started)
+
+# Thống kê dùng chung cho mọi DatabaseManager trong process
+query_metrics = QueryMetrics()
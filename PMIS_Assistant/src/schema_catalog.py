@@ -0,0 +1,170 @@
+import time
+import threading
+import logging
+from typing import Dict, List, Any, Optional
+import psycopg
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+class SchemaCatalog:
+    """
+    Catalog schema dùng chung cho toàn process
+
+    Toàn bộ cột của schema public được tải bằng một truy vấn information_schema duy nhất.
+    Sau mỗi SCHEMA_CACHE_TTL giây, một truy vấn fingerprint nhỏ được dùng để phát hiện
+    DDL thay đổi; khi đó catalog được tải lại và version tăng lên.
+    """
+
+    LOAD_QUERY = """
+    SELECT
+        table_name,
+        column_name,
+        data_type,
+        is_nullable,
+        column_default,
+        character_maximum_length
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+    ORDER BY table_name, ordinal_position
+    """
+
+    FINGERPRINT_QUERY = """
+    SELECT md5(string_agg(
+        table_name || '.' || column_name || ':' || data_type || ':' || is_nullable,
+        ',' ORDER BY table_name, ordinal_position
+    )) AS fingerprint
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = config.SCHEMA_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._tables = None       # {table_name: [column info]}
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self.version = 0          # Tăng mỗi khi schema được tải lại
+
+    def get_columns(self, db_manager, table_name: str) -> List[Dict[str, Any]]:
+        """Lấy danh sách cột (kèm column_default) của một bảng"""
+        tables = self._ensure_loaded(db_manager)
+        columns = tables.get(self.normalize_name(table_name), [])
+        return [dict(column) for column in columns]
+
+    async def get_columns_async(self, db_manager, table_name: str) -> List[Dict[str, Any]]:
+        """Như get_columns nhưng tải/kiểm tra catalog qua AsyncDatabaseManager (không giữ lock khi chờ I/O)"""
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._tables is not None
+            known_fingerprint = self._fingerprint if loaded else None
+            stale = not loaded or now - self._checked_at >= self.ttl
+
+        if stale:
+            rows = None
+            try:
+                async with db_manager.get_cursor() as cursor:
+                    await cursor.execute(self.FINGERPRINT_QUERY)
+                    fingerprint = (await cursor.fetchone())['fingerprint']
+                    if not loaded or fingerprint != known_fingerprint:
+                        await cursor.execute(self.LOAD_QUERY)
+                        rows = await cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Error loading schema catalog: {e}")
+                if not loaded and isinstance(e, psycopg.OperationalError):
+                    raise
+            else:
+                with self._lock:
+                    if rows is not None:
+                        self._set_tables(rows, fingerprint, now)
+                    else:
+                        self._checked_at = now
+
+        with self._lock:
+            columns = (self._tables or {}).get(self.normalize_name(table_name), [])
+            return [dict(column) for column in columns]
+
+    def get_table_names(self, db_manager) -> List[str]:
+        """Lấy danh sách tên bảng có trong catalog"""
+        return sorted(self._ensure_loaded(db_manager).keys())
+
+    def invalidate(self):
+        """Đánh dấu catalog cũ, lần truy cập tiếp theo sẽ tải lại"""
+        with self._lock:
+            self._tables = None
+            self._fingerprint = None
+            self._checked_at = 0.0
+        logger.info("Schema catalog invalidated")
+
+    def _ensure_loaded(self, db_manager) -> Dict[str, List[Dict[str, Any]]]:
+        """Tải catalog nếu chưa có, hoặc kiểm tra DDL thay đổi khi hết TTL"""
+        with self._lock:
+            now = time.monotonic()
+            if self._tables is None:
+                self._load(db_manager, now)
+            elif now - self._checked_at >= self.ttl:
+                self._check_for_ddl_changes(db_manager, now)
+            return self._tables if self._tables is not None else {}
+
+    def _load(self, db_manager, now: float):
+        """Tải toàn bộ cột của schema public trong một round-trip"""
+        try:
+            with db_manager.get_cursor() as cursor:
+                db_manager.execute_prepared(cursor, 'schema_fingerprint')
+                fingerprint = cursor.fetchone()['fingerprint']
+                db_manager.execute_prepared(cursor, 'schema_load')
+                rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error loading schema catalog: {e}")
+            if self._tables is None and isinstance(e, psycopg.OperationalError):
+                # Chưa có catalog nào: báo mất kết nối để nơi gọi xếp hàng ghi offline
+                raise
+            return
+
+        self._set_tables(rows, fingerprint, now)
+
+    def _set_tables(self, rows: List[Dict[str, Any]], fingerprint: str, now: float):
+        """Nhóm các dòng information_schema theo bảng và tăng version (gọi khi đang giữ lock)"""
+        tables = {}
+        for row in rows:
+            row = dict(row)
+            tables.setdefault(row.pop('table_name'), []).append(row)
+
+        self._tables = tables
+        self._fingerprint = fingerprint
+        self._checked_at = now
+        self.version += 1
+        logger.info(f"Schema catalog loaded ({len(tables)} tables, version {self.version})")
+
+    def _check_for_ddl_changes(self, db_manager, now: float):
+        """So sánh fingerprint schema, tải lại nếu DDL đã thay đổi"""
+        try:
+            with db_manager.get_cursor() as cursor:
+                db_manager.execute_prepared(cursor, 'schema_fingerprint')
+                fingerprint = cursor.fetchone()['fingerprint']
+        except Exception as e:
+            logger.error(f"Error checking schema fingerprint: {e}")
+            self._checked_at = now
+            return
+
+        if fingerprint != self._fingerprint:
+            logger.info("Schema change detected, reloading catalog")
+            self._load(db_manager, now)
+        else:
+            self._checked_at = now
+
+    @staticmethod
+    def normalize_name(table_name: str) -> str:
+        """Bỏ dấu ngoặc kép và tiền tố schema khỏi tên bảng"""
+        name = table_name.strip()
+        if name.lower().startswith('public.'):
+            name = name[len('public.'):]
+        return name.strip('"')
+
+# Catalog dùng chung cho mọi DatabaseManager trong process
+schema_catalog = SchemaCatalog()
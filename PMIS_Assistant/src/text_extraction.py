@@ -0,0 +1,101 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.ocr_engine import get_ocr_engine
+
+logger = logging.getLogger(__name__)
+
+# Các hàm ở mức module để chạy được trong ProcessPoolExecutor
+# (đọc PDF và OCR tốn CPU, chạy bằng thread sẽ bị GIL giới hạn)
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif']
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def ocr_image(image_path: str) -> str:
+    """Trích xuất text từ ảnh sử dụng OCR"""
+    return get_ocr_engine().image_to_text(image_path)
+
+def extract_file_text(file_path: str, max_chars: Optional[int] = None) -> str:
+    """Trích xuất text của một file (ảnh dùng OCR, còn lại dùng ClipboardHandler.read_file_content)"""
+    _, ext = os.path.splitext(file_path)
+    if ext.lower() in IMAGE_EXTENSIONS:
+        text = ocr_image(file_path)
+        return text[:max_chars] if max_chars else text
+    
+    from src.clipboard_handler import ClipboardHandler
+    return ClipboardHandler().read_file_content(file_path, max_chars) or ""
+
+def _init_worker():
+    """Khởi tạo process trích xuất: một thread OCR mỗi process vì các process đã chạy song song"""
+    # Tesseract (OpenMP) không tự tạo thêm thread trong mỗi process
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    get_ocr_engine(workers=1)
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process pool dùng chung (tạo khi cần lần đầu)"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=config.EXTRACT_PROCESS_WORKERS or None,
+                                                initializer=_init_worker)
+        return _process_pool
+
+def shutdown_process_pool():
+    """Đóng process pool dùng chung"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+def extract_files_parallel(file_paths: List[str], max_chars: Optional[int] = None,
+                           cancelled: Optional[threading.Event] = None) -> Dict[str, str]:
+    """
+    Trích xuất text của nhiều file trong process pool, trả về {đường dẫn: text}
+    
+    Mỗi file là một task riêng; khi cancelled được set, các file chưa bắt đầu bị hủy và kết quả
+    chỉ gồm các file đã xong. Nếu process pool không dùng được (ví dụ bị hỏng), các file được đọc tuần tự.
+    """
+    if max_chars is None:
+        max_chars = config.EXTRACT_CHAR_BUDGET
+    if not file_paths:
+        return {}
+    if len(file_paths) == 1 or config.EXTRACT_PROCESS_WORKERS < 0:
+        return _extract_sequential(file_paths, max_chars, cancelled)
+    
+    try:
+        pool = get_process_pool()
+        futures = {pool.submit(extract_file_text, path, max_chars): path for path in set(file_paths)}
+        texts = {}
+        for future in as_completed(futures):
+            texts[futures[future]] = future.result()
+            if cancelled is not None and cancelled.is_set():
+                for pending in futures:
+                    pending.cancel()
+                logger.info(f"Text extraction cancelled after {len(texts)} of {len(futures)} files")
+                break
+        return texts
+    except BrokenProcessPool as e:
+        logger.error(f"Extraction process pool failed, extracting sequentially: {e}")
+        shutdown_process_pool()
+        return _extract_sequential(file_paths, max_chars, cancelled)
+
+def _extract_sequential(file_paths: List[str], max_chars: int,
+                        cancelled: Optional[threading.Event] = None) -> Dict[str, str]:
+    """Trích xuất lần lượt từng file trong process hiện tại, dừng khi cancelled được set"""
+    texts = {}
+    for path in file_paths:
+        if cancelled is not None and cancelled.is_set():
+            break
+        texts[path] = extract_file_text(path, max_chars)
+    return texts
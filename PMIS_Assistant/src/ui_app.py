@@ -18,6 +18,7 @@ from PyQt6.QtGui import QFont, QIcon
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
 from src.db_manager import DatabaseManager
+from src.unit_of_work import UnitOfWork
 from src.file_manager import FileManager
 
 logger = logging.getLogger(__name__)
@@ -246,19 +247,31 @@ class PMISAssistantUI(QMainWindow):
     
     # Signal để thông báo cho main module
     save_completed = pyqtSignal()
+    # Signal khi cửa sổ đóng (đã lưu hoặc bỏ qua)
+    closed = pyqtSignal()
     
     def __init__(self, clipboard_data: Dict[str, Any], ai_result: Dict[str, Any], 
-                 db_manager: DatabaseManager, file_manager: FileManager):
+                 db_manager: DatabaseManager, file_manager: FileManager, streaming: bool = False):
         super().__init__()
         self.clipboard_data = clipboard_data
         self.ai_result = ai_result
         self.db_manager = db_manager
         self.file_manager = file_manager
         
+        # Kết quả AI đang được điền dần (chưa cho lưu cho tới khi nhận đủ)
+        self.streaming = streaming
+        # Giá trị tự điền lần trước của từng ô, ô đã bị người dùng sửa thì không ghi đè
+        self._auto_filled = {}
+        
         # Dữ liệu đã chọn từ tree view
         self.selected_columns = {}
         self.table_data = {}
         
+        # Token trang tiếp theo của các bảng còn dữ liệu chưa tải {table_name: next_cursor}
+        self._table_next_cursors = {}
+        self._table_row_counts = {}
+        self._table_column_offsets = {}
+        
         # Đường dẫn file gốc (nếu có)
         self.original_file_path = ""
         if clipboard_data.get("type") in ["file", "image"]:
@@ -305,6 +318,9 @@ class PMISAssistantUI(QMainWindow):
         # Buttons
         button_layout = self._create_button_layout()
         main_layout.addLayout(button_layout)
+        
+        self._remember_auto_filled()
+        self._update_streaming_state()
     
     def _create_ai_analysis_group(self) -> QGroupBox:
         """Tạo nhóm hiển thị kết quả phân tích AI"""
@@ -419,8 +435,15 @@ class PMISAssistantUI(QMainWindow):
         # Table widget
         self.table_widget = QTableWidget()
         self.table_widget.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        # Cuộn tới cuối bảng thì tải thêm trang tiếp theo
+        self.table_widget.verticalScrollBar().valueChanged.connect(self._on_table_scrolled)
         layout.addWidget(self.table_widget)
         
+        self.load_more_button = QPushButton("Tải thêm dữ liệu")
+        self.load_more_button.clicked.connect(self._load_next_table_page)
+        self.load_more_button.hide()
+        layout.addWidget(self.load_more_button)
+        
         # Filter row
         self.filter_row_widgets = []
         layout.addLayout(self._create_filter_row())
@@ -447,13 +470,66 @@ class PMISAssistantUI(QMainWindow):
         cancel_button.clicked.connect(self.close)
         layout.addWidget(cancel_button)
         
-        save_button = QPushButton("Xác nhận và Lưu")
-        save_button.clicked.connect(self.save_data)
-        save_button.setStyleSheet("QPushButton { background-color: #4CAF50; color: white; }")
-        layout.addWidget(save_button)
+        self.save_button = QPushButton("Xác nhận và Lưu")
+        self.save_button.clicked.connect(self.save_data)
+        self.save_button.setStyleSheet("QPushButton { background-color: #4CAF50; color: white; }")
+        layout.addWidget(self.save_button)
         
         return layout
     
+    def update_result(self, ai_result: Dict[str, Any], final: bool = False):
+        """Cập nhật kết quả AI (tạm hoặc cuối cùng) vào các ô chưa bị người dùng sửa"""
+        self.ai_result = ai_result
+        if final:
+            self.streaming = False
+        
+        suggested_filename = self.file_manager.suggest_filename(
+            self.ai_result,
+            os.path.basename(self.original_file_path) if self.original_file_path else ""
+        )
+        values = {
+            "summary": self.ai_result.get("summary", ""),
+            "mapping": self._format_mapping_result(),
+            "filename": suggested_filename,
+            "destination": self.file_manager.suggest_destination(self.ai_result),
+        }
+        
+        for field, widget in self._auto_fill_widgets().items():
+            if self._widget_text(widget) != self._auto_filled.get(field):
+                continue
+            if isinstance(widget, QTextEdit):
+                widget.setPlainText(values[field])
+            else:
+                widget.setText(values[field])
+            self._auto_filled[field] = values[field]
+        
+        self._update_streaming_state()
+    
+    def _auto_fill_widgets(self) -> Dict[str, Any]:
+        """Các ô được điền từ kết quả AI"""
+        return {
+            "summary": self.summary_edit,
+            "mapping": self.mapping_edit,
+            "filename": self.filename_edit,
+            "destination": self.destination_edit,
+        }
+    
+    def _remember_auto_filled(self):
+        """Ghi nhớ giá trị tự điền hiện tại của các ô"""
+        self._auto_filled = {field: self._widget_text(widget)
+                             for field, widget in self._auto_fill_widgets().items()}
+    
+    @staticmethod
+    def _widget_text(widget) -> str:
+        """Text hiện tại của QTextEdit/QLineEdit"""
+        return widget.toPlainText() if isinstance(widget, QTextEdit) else widget.text()
+    
+    def _update_streaming_state(self):
+        """Khóa nút lưu và đổi tiêu đề khi AI còn đang trả lời"""
+        self.save_button.setEnabled(not self.streaming)
+        title = f"{config.APP_NAME} v{config.APP_VERSION}"
+        self.setWindowTitle(f"{title} - Đang phân tích..." if self.streaming else title)
+    
     def _format_mapping_result(self) -> str:
         """Định dạng kết quả mapping để hiển thị"""
         mapping_results = self.ai_result.get("mapping_results", {})
@@ -484,64 +560,98 @@ class PMISAssistantUI(QMainWindow):
             self._show_table_container()
     
     def _populate_table_with_selected_columns(self):
-        """Điền dữ liệu vào bảng với các cột đã chọn"""
+        """Điền dữ liệu vào bảng với các cột đã chọn (trang đầu, các trang sau tải khi cuộn tới cuối)"""
         if not self.selected_columns:
             return
         
+        self._reset_table_pages()
+        
         try:
-            # Lấy dữ liệu từ database
-            all_data = {}
-            for table_name, columns in self.selected_columns.items():
-                data = self.db_manager.get_table_data(table_name, columns)
-                all_data[table_name] = data
+            self._setup_table_columns()
+            
+            for table_name in self.selected_columns:
+                self._table_row_counts[table_name] = 0
+                self._table_next_cursors[table_name] = None
             
-            # Hiển thị dữ liệu trong bảng
-            self._display_data_in_table(all_data)
+            # Mỗi trang là một truy vấn keyset có LIMIT, connection được trả ngay sau đó
+            self._load_next_table_page()
+            
+            # Tạo filter row
+            self._create_filter_widgets()
             
         except Exception as e:
+            self._reset_table_pages()
             logger.error(f"Error populating table: {e}")
             QMessageBox.critical(self, "Lỗi", f"Không thể tải dữ liệu: {str(e)}")
     
-    def _display_data_in_table(self, data: Dict[str, List[Dict]]):
-        """Hiển thị dữ liệu trong bảng"""
+    def _setup_table_columns(self):
+        """Thiết lập tiêu đề cột và vị trí cột bắt đầu của từng bảng"""
         # Gộp tất cả các cột từ các bảng
         all_columns = []
+        self._table_column_offsets = {}
         for table_name, columns in self.selected_columns.items():
+            self._table_column_offsets[table_name] = len(all_columns)
             for column in columns:
                 all_columns.append(f"{table_name}.{column}")
         
-        # Thiết lập số cột và hàng
+        self.table_widget.setRowCount(0)
         self.table_widget.setColumnCount(len(all_columns))
         self.table_widget.setHorizontalHeaderLabels(all_columns)
-        
-        # Tìm số hàng tối đa
-        max_rows = 0
-        table_data = {}
-        for table_name, rows in data.items():
-            table_data[table_name] = rows
-            max_rows = max(max_rows, len(rows))
-        
-        self.table_widget.setRowCount(max_rows)
-        
-        # Điền dữ liệu
-        for row in range(max_rows):
-            col = 0
-            for table_name, columns in self.selected_columns.items():
-                rows = table_data.get(table_name, [])
-                if row < len(rows):
-                    row_data = rows[row]
-                    for column in columns:
-                        value = str(row_data.get(column, ""))
-                        item = QTableWidgetItem(value)
-                        self.table_widget.setItem(row, col, item)
-                        col += 1
-                else:
-                    # Nếu không có dữ liệu cho hàng này, để trống
-                    for _ in columns:
-                        col += 1
-        
-        # Tạo filter row
-        self._create_filter_widgets()
+    
+    def _load_next_table_page(self):
+        """Tải trang tiếp theo của các bảng còn dữ liệu (bảng lỗi được bỏ qua và báo cho người dùng)"""
+        errors = []
+        for table_name, next_cursor in list(self._table_next_cursors.items()):
+            try:
+                page = self.db_manager.get_table_page(
+                    table_name, self.selected_columns.get(table_name),
+                    page_size=config.TABLE_PAGE_SIZE, cursor=next_cursor
+                )
+            except Exception as e:
+                del self._table_next_cursors[table_name]
+                errors.append(f"{table_name}: {e}")
+                continue
+            self._append_table_rows(table_name, page["rows"])
+            
+            if page["next_cursor"] is None:
+                del self._table_next_cursors[table_name]
+            else:
+                self._table_next_cursors[table_name] = page["next_cursor"]
+        
+        self.load_more_button.setVisible(bool(self._table_next_cursors))
+        if errors:
+            QMessageBox.warning(self, "Lỗi", "Không thể tải dữ liệu:\n" + "\n".join(errors))
+    
+    def _on_table_scrolled(self, value: int):
+        """Tải thêm khi thanh cuộn chạm cuối bảng"""
+        scroll_bar = self.table_widget.verticalScrollBar()
+        if self._table_next_cursors and value >= scroll_bar.maximum():
+            self._load_next_table_page()
+    
+    def _append_table_rows(self, table_name: str, rows: List[Dict]):
+        """Thêm các dòng mới của một bảng vào cuối phần dữ liệu của bảng đó"""
+        columns = self.selected_columns.get(table_name, [])
+        col_offset = self._table_column_offsets.get(table_name, 0)
+        start_row = self._table_row_counts.get(table_name, 0)
+        end_row = start_row + len(rows)
+        
+        if self.table_widget.rowCount() < end_row:
+            self.table_widget.setRowCount(end_row)
+        
+        filters = self._get_active_filters()
+        for row_index, row_data in enumerate(rows, start=start_row):
+            for col_index, column in enumerate(columns, start=col_offset):
+                value = str(row_data.get(column, ""))
+                self.table_widget.setItem(row_index, col_index, QTableWidgetItem(value))
+            self._apply_filters_to_row(row_index, filters)
+        
+        self._table_row_counts[table_name] = end_row
+    
+    def _reset_table_pages(self):
+        """Xóa trạng thái phân trang (cursor trang kế tiếp, số dòng đã tải) của lần chọn cột trước"""
+        self._table_next_cursors = {}
+        self._table_row_counts = {}
+        self.load_more_button.hide()
     
     def _create_filter_widgets(self):
         """Tạo các widget filter cho mỗi cột"""
@@ -560,27 +670,28 @@ class PMISAssistantUI(QMainWindow):
     
     def filter_data(self):
         """Lọc dữ liệu trong bảng dựa trên các filter"""
+        filters = self._get_active_filters()
+        for row in range(self.table_widget.rowCount()):
+            self._apply_filters_to_row(row, filters)
+    
+    def _get_active_filters(self) -> Dict[int, str]:
+        """Lấy các filter đang có nội dung {chỉ số cột: chuỗi lọc}"""
         filters = {}
         for i, widget in enumerate(self.filter_row_widgets):
             if widget and widget.text().strip():
                 filters[i] = widget.text().strip()
+        return filters
+    
+    def _apply_filters_to_row(self, row: int, filters: Dict[int, str]):
+        """Ẩn/hiện một hàng theo các filter"""
+        show_row = True
+        for col, filter_text in filters.items():
+            item = self.table_widget.item(row, col)
+            if item and filter_text.lower() not in item.text().lower():
+                show_row = False
+                break
         
-        if not filters:
-            # Nếu không có filter, hiển thị tất cả các hàng
-            for row in range(self.table_widget.rowCount()):
-                self.table_widget.setRowHidden(row, False)
-            return
-        
-        # Áp dụng filter
-        for row in range(self.table_widget.rowCount()):
-            show_row = True
-            for col, filter_text in filters.items():
-                item = self.table_widget.item(row, col)
-                if item and filter_text.lower() not in item.text().lower():
-                    show_row = False
-                    break
-            
-            self.table_widget.setRowHidden(row, not show_row)
+        self.table_widget.setRowHidden(row, not show_row)
     
     def toggle_tree_view(self):
         """Ẩn/hiện tree view"""
@@ -648,17 +759,21 @@ class PMISAssistantUI(QMainWindow):
                 QMessageBox.critical(self, "Lỗi", message)
                 return
             
-            # Lưu vào database
-            self._save_to_database(summary, filename, destination, message)
+            # Lưu vào database (None = mất kết nối, đã xếp hàng gửi lại sau)
+            doc_id = self._save_to_database(summary, filename, destination, message)
             
-            # Log hoạt động AI
-            self.db_manager.log_ai_activity(
-                filename, 
-                json.dumps(self.ai_result, ensure_ascii=False), 
-                "success"
-            )
+            # Log hoạt động AI nằm ngoài unit of work: ghi ở background (write-behind) để không chặn
+            # giao diện, và lỗi ghi log (ví dụ trùng filename) không làm hủy dữ liệu vừa lưu
+            self.db_manager.queue_ai_activity(filename, self.ai_result, "success")
             
-            QMessageBox.information(self, "Thành công", "Dữ liệu đã được lưu thành công!")
+            if doc_id is None:
+                QMessageBox.warning(
+                    self, "Chưa ghi vào database",
+                    "File đã được lưu nhưng không kết nối được database. "
+                    "Dữ liệu sẽ được ghi tự động khi có kết nối trở lại."
+                )
+            else:
+                QMessageBox.information(self, "Thành công", "Dữ liệu đã được lưu thành công!")
             
             # Phát signal để thông báo cho main module
             self.save_completed.emit()
@@ -685,7 +800,7 @@ class PMISAssistantUI(QMainWindow):
             return self.file_manager.save_text_to_file(text_content, destination, filename)
     
     def _save_to_database(self, summary: str, filename: str, destination: str, file_path: str):
-        """Lưu thông tin vào database"""
+        """Lưu tbl_documents và bảng nghiệp vụ trong một unit of work (log AI được ghi riêng qua write-behind)"""
         # Lưu vào bảng tbl_documents
         document_data = {
             "file_name": filename,
@@ -701,15 +816,17 @@ class PMISAssistantUI(QMainWindow):
             "file_path_original": file_path
         }
         
-        doc_id = self.db_manager.insert_into_documents_table(document_data)
-        
-        # Lưu vào bảng nghiệp vụ tương ứng (nếu có mapping)
-        self._save_to_business_table(doc_id)
+        # Ghi tbl_documents và các bảng nghiệp vụ trong cùng một transaction
+        with self.db_manager.unit_of_work() as uow:
+            doc = uow.insert("tbl_documents", document_data)
+            
+            # Lưu vào bảng nghiệp vụ tương ứng (nếu có mapping)
+            self._save_to_business_table(uow)
         
-        return doc_id
+        return uow.results[doc]
     
-    def _save_to_business_table(self, doc_id: int):
-        """Lưu vào bảng nghiệp vụ tương ứng"""
+    def _save_to_business_table(self, uow: UnitOfWork):
+        """Thêm các lệnh ghi vào bảng nghiệp vụ tương ứng vào unit of work"""
         mapping_results = self.ai_result.get("mapping_results", {})
         
         # Lưu vào VanBanPhapLy nếu có thông tin văn bản
@@ -722,10 +839,16 @@ class PMISAssistantUI(QMainWindow):
                     "NoiDung": self.ai_result.get("summary", ""),
                     "NgayBanHanh": doc_info.get("date")
                 }
-                self.db_manager.insert_document("VanBanPhapLy", van_ban_data)
+                uow.insert("VanBanPhapLy", van_ban_data)
         
         # Có thể mở rộng để lưu vào các bảng nghiệp vụ khác
         # dựa trên kết quả mapping
+    
+    def closeEvent(self, event):
+        """Xóa trạng thái phân trang khi đóng cửa sổ"""
+        self._reset_table_pages()
+        super().closeEvent(event)
+        self.closed.emit()
 
 def show_ui(clipboard_data: Dict[str, Any], ai_result: Dict[str, Any], 
             db_manager: DatabaseManager, file_manager: FileManager) -> int:
@@ -738,4 +861,14 @@ def show_ui(clipboard_data: Dict[str, Any], ai_result: Dict[str, Any],
     window.show()
     
     # Chạy event loop
-    return app.exec()
\ No newline at end of file
+    return app.exec()
+
+def open_ui(clipboard_data: Dict[str, Any], ai_result: Dict[str, Any],
+            db_manager: DatabaseManager, file_manager: FileManager,
+            streaming: bool = False) -> PMISAssistantUI:
+    """Mở cửa sổ kết quả mà không chạy event loop riêng (dùng khi ứng dụng tray đang chạy)"""
+    window = PMISAssistantUI(clipboard_data, ai_result, db_manager, file_manager, streaming)
+    window.show()
+    window.raise_()
+    window.activateWindow()
+    return window
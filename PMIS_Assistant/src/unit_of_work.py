@@ -0,0 +1,146 @@
+import json
+import uuid
+import logging
+from typing import Dict, List, Any, Optional
+import psycopg
+import sys
+import os
+
+# Add parent directory to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from src.query_metrics import InstrumentedCursor
+
+logger = logging.getLogger(__name__)
+
+# Bảng ghi khóa của các unit of work đã commit (tạo bởi database_setup.py), dùng để không ghi trùng
+# khi gửi lại một unit of work đã xếp hàng offline mà thực ra đã được commit trước khi mất kết nối
+APPLIED_UNITS_TABLE = 'pmis_applied_units'
+RECORD_UNIT_QUERY = "INSERT INTO pmis_applied_units (unit_key) VALUES (%s)"
+
+class UnitOfWork:
+    """
+    Gom nhiều lệnh INSERT và ghi chúng trong một transaction duy nhất
+    
+    Khi libpq hỗ trợ pipeline mode, toàn bộ các lệnh được gửi đi trong một round-trip;
+    nếu không, chúng chạy tuần tự trên cùng một connection nhưng vẫn chung một transaction.
+    Câu lệnh được tạo ngay khi thêm (dùng catalog schema trong bộ nhớ), nên lỗi cột/bảng
+    được báo trước khi mở kết nối; nếu catalog chưa tải được vì mất kết nối, câu lệnh được
+    tạo lúc commit.
+    
+    Khi mất kết nối lúc commit và có mirror cục bộ, cả unit of work được xếp hàng thành một mục
+    (kèm khóa key) và gửi lại sau trong một transaction; queued = True và results toàn None.
+    
+    Sử dụng:
+        with db_manager.unit_of_work() as uow:
+            doc = uow.insert('tbl_documents', document_data)
+            uow.insert('VanBanPhapLy', van_ban_data)
+        doc_id = uow.results[doc]
+    """
+    
+    def __init__(self, db_manager, key: Optional[str] = None):
+        self.db_manager = db_manager
+        self.key = key or uuid.uuid4().hex
+        self._operations = []    # [(table_name, data, query, params)]
+        self.results = []        # ID trả về theo thứ tự các lệnh (None nếu đã xếp hàng offline)
+        self.committed = False
+        self.queued = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+    
+    def insert(self, table_name: str, data: Dict[str, Any]) -> int:
+        """Thêm một lệnh chèn, trả về vị trí của nó trong results"""
+        try:
+            query, params = self.db_manager.build_insert(table_name, data)
+        except psycopg.OperationalError:
+            # Catalog chưa tải được: tạo câu lệnh lúc commit (hoặc xếp hàng cả unit nếu vẫn mất kết nối)
+            query, params = None, None
+        self._operations.append((table_name, data, query, params))
+        return len(self._operations) - 1
+    
+    def log_ai_activity(self, filename: str, ai_response: Any, status: str) -> int:
+        """Thêm bản ghi gemini_automation_log vào cùng transaction"""
+        if not isinstance(ai_response, str):
+            ai_response = json.dumps(ai_response, ensure_ascii=False)
+        data = {'filename': filename, 'ai_response': ai_response, 'status': status}
+        query = self.db_manager.statements['log_ai_activity']
+        self._operations.append(('gemini_automation_log', data, query, [filename, ai_response, status]))
+        return len(self._operations) - 1
+    
+    def commit(self) -> List[Optional[int]]:
+        """Ghi tất cả các lệnh trong một transaction, trả về danh sách ID"""
+        if self.committed:
+            return self.results
+        if not self._operations:
+            self.committed = True
+            return self.results
+        
+        try:
+            self.results = self._execute()
+        except psycopg.OperationalError:
+            if self.db_manager.local_mirror is None:
+                raise
+            # Mất kết nối: xếp hàng cả unit of work để gửi lại sau trong một transaction
+            self.db_manager.local_mirror.queue_unit_of_work(
+                self.key, [(table_name, data) for table_name, data, _, _ in self._operations]
+            )
+            self.results = [None] * len(self._operations)
+            self.queued = True
+        except (psycopg.errors.UndefinedColumn, psycopg.errors.UndefinedTable) as e:
+            # Catalog có thể đã cũ sau khi DDL thay đổi
+            self.db_manager.schema_catalog.invalidate()
+            logger.error(f"Error committing unit of work: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Error committing unit of work: {e}")
+            raise
+        
+        self.committed = True
+        return self.results
+    
+    def _execute(self) -> List[Optional[int]]:
+        """Thực thi các lệnh trong một transaction (pipeline nếu được hỗ trợ)"""
+        self._operations = [
+            (table_name, data, *self.db_manager.build_insert(table_name, data)) if query is None
+            else (table_name, data, query, params)
+            for table_name, data, query, params in self._operations
+        ]
+        statements = [(query, params) for _, _, query, params in self._operations]
+        # Ghi khóa trong cùng transaction: unit of work đã commit thì lần gửi lại vi phạm khóa chính
+        record_key = bool(self.db_manager.get_table_columns(APPLIED_UNITS_TABLE))
+        if record_key:
+            statements.insert(0, (RECORD_UNIT_QUERY, [self.key]))
+        
+        with self.db_manager.get_connection() as connection:
+            # Mỗi lệnh một cursor để giữ kết quả RETURNING riêng
+            cursors = [InstrumentedCursor(connection) for _ in statements]
+            try:
+                if config.DB_PIPELINE_ENABLED and psycopg.Pipeline.is_supported():
+                    with connection.pipeline(), connection.transaction():
+                        for cursor, (query, params) in zip(cursors, statements):
+                            cursor.execute(query, params)
+                else:
+                    with connection.transaction():
+                        for cursor, (query, params) in zip(cursors, statements):
+                            cursor.execute(query, params)
+                
+                results = []
+                for cursor in cursors[1:] if record_key else cursors:
+                    row = cursor.fetchone()
+                    results.append(row[0] if row else None)
+            except psycopg.errors.UniqueViolation as e:
+                if e.diag.table_name != APPLIED_UNITS_TABLE:
+                    raise
+                logger.info(f"Unit of work {self.key} was already committed, skipping")
+                return [None] * len(self._operations)
+            finally:
+                for cursor in cursors:
+                    cursor.close()
+        
+        logger.info(f"Committed unit of work with {len(results)} writes")
+        return results
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Cho phép import config và src.* của PMIS_Assistant
+PMIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "PMIS_Assistant")
+if PMIS_DIR not in sys.path:
+    sys.path.insert(0, PMIS_DIR)
+
+# Test không cần mirror cục bộ hay thống kê truy vấn (đặt trước khi config được import)
+os.environ.setdefault("MIRROR_ENABLED", "false")
+os.environ.setdefault("DB_METRICS_ENABLED", "false")
+os.environ.setdefault("DB_METRICS_FILE", "")
+
+# test_env.py là script kiểm tra .env chạy tay (python test/test_env.py), không phải test pytest
+collect_ignore = ["test_env.py"]
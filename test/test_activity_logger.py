@@ -0,0 +1,85 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("dotenv")
+psycopg = pytest.importorskip("psycopg")
+
+import config
+from src.activity_logger import ActivityLogger
+
+class FakeDatabase:
+    """DatabaseManager giả: lưu các dòng log được chèn, hoặc báo mất kết nối khi down"""
+
+    def __init__(self, down=False):
+        self.down = down
+        self.rows = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def get_cursor(self, dictionary=True):
+        if self.down:
+            raise psycopg.OperationalError("connection refused")
+        yield self
+
+    def executemany(self, query, params):
+        with self._lock:
+            self.rows.extend(params)
+
+@pytest.fixture
+def spool_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "AI_LOG_BATCH_SIZE", 100)
+    monkeypatch.setattr(config, "AI_LOG_FLUSH_INTERVAL", 60)
+    monkeypatch.setattr(config, "AI_LOG_RETRY_INTERVAL", 60)
+    return str(tmp_path / "ai_log_spool.jsonl")
+
+def read_spool(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_entries_stay_in_spool_while_database_is_down(spool_file):
+    """Mất kết nối: bản ghi vẫn nằm trong spool sau khi dừng worker"""
+    db = FakeDatabase(down=True)
+    activity_logger = ActivityLogger(db, spool_file)
+    activity_logger.enqueue("a.pdf", {"summary": "Quyết định"}, "success")
+    activity_logger.enqueue("b.pdf", "raw", "error")
+    activity_logger.stop()
+
+    entries = read_spool(spool_file)
+    assert [entry["filename"] for entry in entries] == ["a.pdf", "b.pdf"]
+    assert json.loads(entries[0]["ai_response"]) == {"summary": "Quyết định"}
+    assert db.rows == []
+
+def test_spooled_entries_are_replayed_on_next_start(spool_file):
+    """Lần chạy sau gửi lại các bản ghi trong spool rồi xóa file spool"""
+    offline = ActivityLogger(FakeDatabase(down=True), spool_file)
+    offline.enqueue("a.pdf", "{}", "success")
+    offline.enqueue("b.pdf", "{}", "success")
+    offline.stop()
+    # Dòng ghi dở khi crash bị bỏ qua
+    with open(spool_file, "a", encoding="utf-8") as f:
+        f.write('{"uid": "partial", "filena')
+
+    db = FakeDatabase()
+    activity_logger = ActivityLogger(db, spool_file)
+    activity_logger.stop()
+
+    assert [row[0] for row in db.rows] == ["a.pdf", "b.pdf"]
+    assert not os.path.exists(spool_file)
+
+def test_new_and_spooled_entries_are_written_once(spool_file):
+    """Bản ghi mới và bản ghi cũ trong spool được gửi cùng nhau, mỗi bản ghi đúng một lần"""
+    offline = ActivityLogger(FakeDatabase(down=True), spool_file)
+    offline.enqueue("old.pdf", "{}", "success")
+    offline.stop()
+
+    db = FakeDatabase()
+    activity_logger = ActivityLogger(db, spool_file)
+    activity_logger.enqueue("new.pdf", "{}", "success")
+    activity_logger.stop()
+
+    assert sorted(row[0] for row in db.rows) == ["new.pdf", "old.pdf"]
+    assert not os.path.exists(spool_file)
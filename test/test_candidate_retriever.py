@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from src.candidate_retriever import CandidateRetriever, BM25Index, normalize_text, tokenize
+
+PROJECTS = [
+    {'ID': 1, 'MaDuAn': 'DA01', 'TenDuAn': 'Cầu Rạch Miễu 2'},
+    {'ID': 2, 'MaDuAn': 'DA02', 'TenDuAn': 'Đường vành đai 3'},
+    {'ID': 3, 'MaDuAn': 'DA03', 'TenDuAn': 'Trường tiểu học Hòa Bình'},
+    {'ID': 4, 'MaDuAn': 'DA04', 'TenDuAn': 'Bệnh viện đa khoa tỉnh'},
+    {'ID': 5, 'MaDuAn': 'DA05', 'TenDuAn': 'Kè chống sạt lở sông Tiền'},
+]
+
+TASKS = [
+    {'ID': 10, 'TenCongViec': 'Khảo sát địa chất', 'DuAn_ID': 4},
+    {'ID': 11, 'TenCongViec': 'Khảo sát địa chất', 'DuAn_ID': 1},
+    {'ID': 12, 'TenCongViec': 'Lập dự toán', 'DuAn_ID': 2},
+    {'ID': 13, 'TenCongViec': 'Giải phóng mặt bằng', 'DuAn_ID': 3},
+    {'ID': 14, 'TenCongViec': 'Thi công cọc khoan nhồi', 'DuAn_ID': 5},
+]
+
+DEPARTMENTS = [{'ID': 1, 'MaPhongBan': 'KT', 'TenPhongBan': 'Phòng Kỹ thuật'}]
+
+def context():
+    return {'projects': PROJECTS, 'departments': DEPARTMENTS, 'tasks': TASKS, 'issues': []}
+
+def test_normalize_text_removes_vietnamese_accents():
+    assert normalize_text('Đường Vành Đai') == 'duong vanh dai'
+
+def test_tokenize_adds_character_trigrams():
+    terms = tokenize('Cầu')
+    assert terms[0] == 'cau'
+    assert '# ca' in terms and '#au ' in terms
+
+def test_bm25_ranks_matching_document_first():
+    index = BM25Index(['cau rach mieu', 'duong vanh dai', 'benh vien tinh', 'truong hoc'])
+    scores = index.scores(tokenize('bệnh viện'))
+    assert max(scores, key=scores.get) == 2
+
+def test_select_keeps_top_k_relevant_projects():
+    """Dự án khớp tên (kể cả gõ không dấu) được chọn, loại có không quá top_k dòng giữ nguyên"""
+    retriever = CandidateRetriever(top_k=1)
+    selected = retriever.select(context(), 'Cong van ve du an cau Rach Mieu 2')
+
+    assert [row['ID'] for row in selected['projects']] == [1]
+    assert selected['departments'] == DEPARTMENTS
+    assert selected['issues'] == []
+
+def test_select_boosts_tasks_of_selected_projects():
+    """Hai công việc cùng tên: công việc thuộc dự án ứng viên được xếp trước"""
+    retriever = CandidateRetriever(top_k=1)
+    selected = retriever.select(context(), 'Cầu Rạch Miễu 2: báo cáo khảo sát địa chất')
+
+    assert [row['ID'] for row in selected['projects']] == [1]
+    assert [row['ID'] for row in selected['tasks']] == [11]
+
+def test_select_unions_candidates_of_several_texts():
+    retriever = CandidateRetriever(top_k=1)
+    selected = retriever.select(context(), 'Bệnh viện đa khoa tỉnh', 'Kè chống sạt lở sông Tiền')
+
+    assert [row['ID'] for row in selected['projects']] == [4, 5]
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("psycopg")
+
+from src.context_cache import ContextCache
+
+T0 = datetime(2024, 1, 1, 8, 0, 0)
+T1 = datetime(2024, 1, 1, 9, 0, 0)
+
+@pytest.fixture
+def cache():
+    """ContextCache đã có hai dự án, ghi lại các thay đổi gửi tới listener"""
+    cache = ContextCache(db_manager=None, ttl=60, full_refresh_interval=3600, single_query=True)
+    cache._rows = {'projects': {
+        1: {'ID': 1, 'MaDuAn': 'DA01', 'TenDuAn': 'Cầu A'},
+        2: {'ID': 2, 'MaDuAn': 'DA02', 'TenDuAn': 'Đường B'},
+    }}
+    cache._last_sync = {'projects': T0}
+    cache.events = []
+    cache.add_listener(lambda key, rows, deleted_ids, full: cache.events.append((key, rows, deleted_ids, full)))
+    return cache
+
+def test_apply_delta_upserts_and_deletes(cache):
+    """Dòng mới/đổi được gộp theo ID, dòng is_deleted bị xóa khỏi cache"""
+    changed = cache._apply_delta('projects', [
+        {'ID': 2, 'MaDuAn': 'DA02', 'TenDuAn': 'Đường B mở rộng', 'is_deleted': False},
+        {'ID': 3, 'MaDuAn': 'DA03', 'TenDuAn': 'Hầm C', 'is_deleted': False},
+        {'ID': 1, 'MaDuAn': 'DA01', 'TenDuAn': 'Cầu A', 'is_deleted': True},
+    ], T1)
+
+    assert changed is True
+    assert sorted(cache._rows['projects']) == [2, 3]
+    assert cache._rows['projects'][2]['TenDuAn'] == 'Đường B mở rộng'
+    assert 'is_deleted' not in cache._rows['projects'][3]
+    assert cache._last_sync['projects'] == T1
+    assert cache.events == [('projects', [
+        {'ID': 2, 'MaDuAn': 'DA02', 'TenDuAn': 'Đường B mở rộng'},
+        {'ID': 3, 'MaDuAn': 'DA03', 'TenDuAn': 'Hầm C'},
+    ], [1], False)]
+
+def test_apply_delta_ignores_unchanged_overlap(cache):
+    """Dòng lấy lại trong khoảng overlap mà không đổi thì không tính là thay đổi"""
+    changed = cache._apply_delta('projects', [
+        {'ID': 1, 'MaDuAn': 'DA01', 'TenDuAn': 'Cầu A', 'is_deleted': False},
+        {'ID': 9, 'MaDuAn': 'DA09', 'TenDuAn': 'Đã xóa trước đó', 'is_deleted': True},
+    ], T1)
+
+    assert changed is False
+    assert cache.events == []
+    assert sorted(cache._rows['projects']) == [1, 2]
+
+def test_apply_delta_keeps_latest_sync(cache):
+    """Mốc đồng bộ không lùi lại khi delta có last_updated cũ hơn hoặc rỗng"""
+    cache._apply_delta('projects', [], None)
+    assert cache._last_sync['projects'] == T0
+
+    cache._apply_delta('projects', [], T1)
+    cache._apply_delta('projects', [], T0)
+    assert cache._last_sync['projects'] == T1
+
+def test_get_returns_same_snapshot_until_version_changes(cache):
+    """get() trả về cùng một dict khi version không đổi (để nơi gọi nhớ fingerprint)"""
+    cache._checked_at = cache._loaded_at = float('inf')
+    first = cache.get()
+    assert cache.get() is first
+
+    # Như _incremental_refresh: delta có thay đổi thì tăng version
+    assert cache._apply_delta('projects', [{'ID': 4, 'MaDuAn': 'DA04', 'TenDuAn': 'Kè D'}], T1)
+    cache.version += 1
+    second = cache.get()
+    assert second is not first
+    assert [row['ID'] for row in second['projects']] == [1, 2, 4]
@@ -0,0 +1,95 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip("dotenv")
+psycopg = pytest.importorskip("psycopg")
+
+from src.db_manager import DatabaseManager
+from src.schema_catalog import SchemaCatalog
+
+TABLE_ROWS = [{"ID": i, "TenDuAn": f"Dự án {i}", "is_deleted": i == 4} for i in range(1, 9)]
+SCHEMA = [{"column_name": "ID"}, {"column_name": "TenDuAn"}, {"column_name": "is_deleted"}]
+
+class FakeCursor:
+    """Cursor giả thực thi câu keyset pagination trên TABLE_ROWS"""
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.rows = []
+
+    def execute(self, query, params=None):
+        text = query.as_string(None)
+        params = list(params or [])
+        self.executed.append((text, params))
+
+        rows = [row for row in TABLE_ROWS if not row["is_deleted"]]
+        if '"ID" > %s' in text:
+            rows = [row for row in rows if row["ID"] > params[-1]]
+        elif '"ID" < %s' in text:
+            rows = [row for row in rows if row["ID"] < params[-1]]
+        rows.sort(key=lambda row: row["ID"], reverse=text.split(" ORDER BY ")[1].split()[1] == "DESC")
+        limit = int(text.rsplit("LIMIT ", 1)[1])
+        self.rows = [{"ID": row["ID"], "TenDuAn": row["TenDuAn"]} for row in rows[:limit]]
+
+    def fetchall(self):
+        return self.rows
+
+@pytest.fixture
+def manager():
+    """DatabaseManager không kết nối DB: schema và cursor được thay bằng bản giả"""
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.schema_catalog = SchemaCatalog()
+    db.get_table_schema = lambda table_name: SCHEMA
+    db.executed = []
+
+    @contextmanager
+    def get_cursor(dictionary=True):
+        yield FakeCursor(db.executed)
+
+    db.get_cursor = get_cursor
+    return db
+
+def page_ids(page):
+    return [row["ID"] for row in page["rows"]]
+
+def test_page_cursor_round_trip(manager):
+    """Đi hết các trang về sau rồi quay lại bằng prev_cursor, bỏ qua dòng đã xóa mềm"""
+    first = manager.get_table_page('"DuAn"', page_size=3)
+    assert page_ids(first) == [1, 2, 3]
+    assert first["prev_cursor"] is None
+
+    second = manager.get_table_page('"DuAn"', page_size=3, cursor=first["next_cursor"])
+    assert page_ids(second) == [5, 6, 7]
+
+    last = manager.get_table_page('"DuAn"', page_size=3, cursor=second["next_cursor"])
+    assert page_ids(last) == [8]
+    assert last["next_cursor"] is None
+
+    back = manager.get_table_page('"DuAn"', page_size=3, direction="prev", cursor=last["prev_cursor"])
+    assert page_ids(back) == [5, 6, 7]
+
+    start = manager.get_table_page('"DuAn"', page_size=3, direction="prev", cursor=back["prev_cursor"])
+    assert page_ids(start) == [1, 2, 3]
+    assert start["prev_cursor"] is None
+    assert start["next_cursor"] == first["next_cursor"]
+
+def test_page_query_quotes_identifiers(manager):
+    """Cột khóa và tên bảng được quote, giá trị cursor truyền qua tham số"""
+    first = manager.get_table_page("DuAn", page_size=2)
+    manager.get_table_page("DuAn", page_size=2, cursor=first["next_cursor"])
+
+    text, params = manager.executed[-1]
+    assert 'FROM "DuAn"' in text
+    assert '"ID" > %s' in text
+    assert 'ORDER BY "ID" ASC LIMIT 3' in text
+    assert params == [2]
+
+def test_page_cursor_encoding():
+    """Token trang giải mã lại đúng giá trị khóa"""
+    token = DatabaseManager._encode_page_cursor(42)
+    assert DatabaseManager._decode_page_cursor(token) == 42
+
+def test_page_rejects_invalid_direction(manager):
+    with pytest.raises(ValueError):
+        manager.get_table_page("DuAn", direction="sideways")